@@ -1,51 +1,131 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, make_response, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from fetch_data import fetch_bom_data
-from assembly_manager import assemble_finished_good, store_craftable_non_craftable_goods
-from db_connection import connect_to_database
+from assembly_manager import assemble_finished_good, store_craftable_non_craftable_goods, store_shortages, plan_inventory, InsufficientStock
+from db_connection import get_connection, pool_stats, pool as db_pool
+from exports import (iter_query, write_xlsx, csv_chunks, ndjson_chunks, arrow_schema,
+                     arrow_stream_chunks, write_parquet)
+from pagination import parse_page_request, fetch_page, count_rows
+from bom_import import parse_bom_workbook, copy_and_merge
+from search import admin_parts_search, ranked_admin_parts, autocomplete_item_codes
+from craft_executor import fetch_boms, CRAFT_DEADLINE
+from craft_scan import scan_craftable_goods
+from craft_refresh import refresh_craftability
+from bom_graph import get_bom_graph, fetch_stock_vector, invalidate_bom_graph
+from bom_exploded import refresh_exploded
+from table_versions import bump, bump_items, version_tag, response_cache
+from production_mix import allocate_mix
+from whatif import WhatIfSession, PlanConflict, sessions as whatif_sessions, commit_plans
+from metrics import set_route, stage, render as render_metrics, gauge_lines, REQUEST_SECONDS
+from solver_cache import solve_rows, cached_result, stock_snapshot, solver_cache, STRUCTURE_TABLE
 import bcrypt
 from psycopg2.extras import RealDictCursor
 import psycopg2
-from fetch_data import build_bom_tree, calculate_max_units
-from threading import Thread
-from queue import Queue
+from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units, calculate_max_units_batch, SolverTrace
 from datetime import datetime, timedelta, timezone
 import threading
-import pandas as pd 
 import io
-from io import BytesIO
 import base64
+import tempfile
+import logging
+import os
+import time
+import hashlib
+from functools import wraps
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """jsonify() with the time spent serializing recorded as the "serialize" stage."""
+
+    def dumps(self, obj, **kwargs):
+        with stage("serialize"):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)
 
 app.config["JWT_SECRET_KEY"] = "alankrit2004"
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
 jwt = JWTManager(app)
 
-def run_with_timeout(func, args=(), kwargs={}, timeout=120):
-    """Run a function with timeout using threads instead of signals"""
-    result_queue = Queue()
-    
-    def wrapper():
-        try:
-            result = func(*args, **kwargs)
-            result_queue.put(('success', result))
-        except Exception as e:
-            result_queue.put(('error', str(e)))
-    
-    thread = Thread(target=wrapper)
-    thread.daemon = True
-    thread.start()
-    thread.join(timeout)
-    
-    if thread.is_alive():
-        return 'timeout', None
-    
-    if not result_queue.empty():
-        return result_queue.get()
-    return 'error', 'Unknown error occurred'
+def _route_label():
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+# ⏱️ **Request timing middleware**: every stage timed during the request is labelled with its route
+@app.before_request
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+    g.metrics_route_token = set_route(_route_label())
+
+@app.after_request
+def record_request_time(response):
+    started = g.get("metrics_started")
+    if started is not None:
+        REQUEST_SECONDS.observe((_route_label(), request.method, str(response.status_code)),
+                                time.perf_counter() - started)
+    return response
+
+@app.teardown_request
+def reset_request_route(exc):
+    token = g.pop("metrics_route_token", None)
+    if token is not None:
+        token.var.reset(token)
+
+def conditional_response(*tables):
+    """
+    Tags a listing view's responses with an ETag built from the version
+    counters of `tables` and the request body. A matching If-None-Match gets
+    a 304, and a repeated request is answered from the response cache, both
+    without touching the database.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            body = request.get_data(cache=True)
+            etag = f"{version_tag(*tables)}-{hashlib.sha1(body).hexdigest()[:12]}"
+
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                cache_key = (request.path, etag)
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    response = Response(cached, mimetype="application/json")
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.put(cache_key, response.get_data())
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+        return wrapper
+    return decorator
+
+# ✅ **Database Pool Metrics**
+@app.route("/pool_stats", methods=["GET"])
+@jwt_required()
+def get_pool_stats():
+    return jsonify(pool_stats())
+
+# ✅ **Prometheus Metrics**
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Request and stage latency histograms, pool and cache gauges, in the Prometheus text format."""
+    extra = gauge_lines("bom_db_pool", "Database pool statistics.", pool_stats(), label="stat")
+    extra += gauge_lines("bom_solver_cache", "Solver result cache statistics.", solver_cache.stats(), label="stat")
+    extra += gauge_lines("bom_response_cache", "Listing response cache statistics.", response_cache.stats(), label="stat")
+    return Response(render_metrics(extra), mimetype="text/plain; version=0.0.4")
+
+# ✅ **Solver and Response Cache Metrics**
+@app.route("/cache_stats", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    return jsonify({"solver": solver_cache.stats(), "responses": response_cache.stats()})
 
 # ✅ **User Registration API**
 @app.route("/register", methods=["POST"])
@@ -59,23 +139,23 @@ def register():
 
     hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
 
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
-    cursor = connection.cursor()
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
+        cursor = connection.cursor()
 
-    try:
-        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s);", 
-                       (username, hashed_password.decode("utf-8")))
-        connection.commit()
-        return jsonify({"message": "User registered successfully"}), 201
-    except psycopg2.IntegrityError:
-        return jsonify({"error": "Username already exists"}), 409
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cursor.close()
-        connection.close()
+        try:
+            cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s);", 
+                           (username, hashed_password.decode("utf-8")))
+            connection.commit()
+            bump("users")
+            return jsonify({"message": "User registered successfully"}), 201
+        except psycopg2.IntegrityError:
+            return jsonify({"error": "Username already exists"}), 409
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cursor.close()
 
 
 
@@ -88,16 +168,15 @@ def login():
     if not username or not password:
         return jsonify({"error": "Username and password required"}), 400
 
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-    cursor = connection.cursor(cursor_factory=RealDictCursor)
-    cursor.execute("SELECT password FROM users WHERE username = %s;", (username,))
-    user = cursor.fetchone()
+        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        cursor.execute("SELECT password FROM users WHERE username = %s;", (username,))
+        user = cursor.fetchone()
 
-    cursor.close()
-    connection.close()
+        cursor.close()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
@@ -124,86 +203,200 @@ def logout():
 @app.route("/get_craftable_goods", methods=["POST"])
 @jwt_required()
 def get_craftable_goods():
-    connection = None
     try:
         data = request.get_json()
         craft_quantity = data.get("quantity")
         specific_bom = data.get("bom_number")
-
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        timeout = data.get("timeout", CRAFT_DEADLINE)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not timeout > 0:
+            return jsonify({"error": "timeout must be a positive number of seconds."}), 400
+        deadline = min(float(timeout), CRAFT_DEADLINE)
+        trace_requested = bool(data.get("trace"))
+
+        # 🚀 Whole-catalog scan, streamed as one JSON object per line
+        if data.get("scan"):
+            return Response(
+                stream_with_context(scan_craftable_goods(craft_quantity)),
+                mimetype="application/x-ndjson"
+            )
 
         if specific_bom:
             batch_codes = [specific_bom]
         else:
-            cursor.execute('''
-                SELECT DISTINCT "bom_number" 
-                FROM "admin_parts" 
-                LIMIT 10
-            ''')
-            batch_codes = [row['bom_number'] for row in cursor.fetchall()]
-            cursor.close()
+            with get_connection() as connection:
+                if not connection:
+                    return jsonify({"error": "Database connection failed"}), 500
+
+                cursor = connection.cursor(cursor_factory=RealDictCursor)
+                cursor.execute('''
+                    SELECT DISTINCT "bom_number" 
+                    FROM "admin_parts" 
+                    LIMIT 10
+                ''')
+                batch_codes = [row['bom_number'] for row in cursor.fetchall()]
+                cursor.close()
+
+        quantity_to_check = craft_quantity or None  # None: exact max buildable, subassemblies included
+
+        # ✅ Unchanged BOMs come straight from the solver cache; traced runs always recompute
+        results = {}
+        if not trace_requested:
+            for fg_code in batch_codes:
+                cached = cached_result(fg_code, quantity_to_check)
+                if cached is not None:
+                    results[fg_code] = (cached[2], None)
+
+        # 🚀 Fetch the remaining BOMs concurrently, each on its own pooled connection, under one deadline
+        snapshot = stock_snapshot()
+        missing_codes = [fg_code for fg_code in batch_codes if fg_code not in results]
+        bom_rows, errors, timed_out = fetch_boms(missing_codes, deadline=deadline)
+
+        for fg_code, bom_data in bom_rows.items():
+            if not bom_data:
+                continue
+            try:
+                trace = SolverTrace() if trace_requested else None
+                _, _, result = solve_rows(bom_data, fg_code, quantity_to_check, snapshot, trace=trace)
+                results[fg_code] = (result, trace)
+            except Exception as e:
+                errors[fg_code] = str(e)
 
         craftable_goods = []
         non_craftable_goods = []
+        shortage_rows = []
 
         for fg_code in batch_codes:
-            def process_code():
-                bom_data = fetch_bom_data(connection, fg_code)
-                if not bom_data:
-                    return None
-
-                item_data, tree = build_bom_tree(bom_data, fg_code)
-                quantity_to_check = craft_quantity or 1  # Use 1 if not specified
-                return calculate_max_units(tree, item_data, fg_code, quantity_to_check)
-
-            status, result = run_with_timeout(process_code, timeout=5)
-
-            if status == 'timeout':
-                print(f"Timeout processing {fg_code}")
+            if fg_code in errors:
+                print(f"Error processing finished good {fg_code}: {errors[fg_code]}")
                 continue
-            elif status == 'error':
-                print(f"Error processing finished good {fg_code}: {result}")
+            result = results.get(fg_code)
+            if not result:
                 continue
-            elif status == 'success' and result:
-                max_units, shortages, used_items = result
-
-                if craft_quantity:
-                    if shortages:
-                        for item in shortages:
-                            cursor = connection.cursor()
-                            cursor.execute("""
-                                INSERT INTO non_craftable_list (bom_number, item_code, missing_qty, craft_attempt_qty, timestamp)
-                                VALUES (%s, %s, %s, %s, CURRENT_DATE)
-                            """, (fg_code, item[0], item[1], craft_quantity))
-                            connection.commit()
-
-                        non_craftable_goods.append({
-                            "finished_good_code": fg_code,
-                            "missing_items": [
-                                {"item_code": item[0], "missing_qty": item[1]}
-                                for item in shortages
-                            ]
-                        })
-                    else:
-                        craftable_goods.append({
-                            "finished_good_code": fg_code,
-                            "can_craft_quantity": craft_quantity
-                        })
+
+            (max_units, shortages, used_items), trace = result
+            entries_before = len(craftable_goods) + len(non_craftable_goods)
+
+            if craft_quantity:
+                if shortages:
+                    shortage_rows.extend(
+                        (fg_code, item[0], item[1], craft_quantity) for item in shortages
+                    )
+
+                    non_craftable_goods.append({
+                        "finished_good_code": fg_code,
+                        "missing_items": [
+                            {"item_code": item[0], "missing_qty": item[1]}
+                            for item in shortages
+                        ]
+                    })
                 else:
-                    if shortages:
-                        non_craftable_goods.append({
-                            "finished_good_code": fg_code,
-                            "missing_items": [item[0] for item in shortages]
-                        })
-                    elif max_units > 0:
-                        craftable_goods.append({
-                            "finished_good_code": fg_code,
-                            "max_units": max_units
-                        })
+                    craftable_goods.append({
+                        "finished_good_code": fg_code,
+                        "can_craft_quantity": craft_quantity
+                    })
+            else:
+                if shortages:
+                    non_craftable_goods.append({
+                        "finished_good_code": fg_code,
+                        "missing_items": [item[0] for item in shortages]
+                    })
+                elif max_units > 0:
+                    craftable_goods.append({
+                        "finished_good_code": fg_code,
+                        "max_units": max_units
+                    })
+
+            # 🔍 Attach the bounded per-node log when tracing was requested
+            if trace is not None and len(craftable_goods) + len(non_craftable_goods) > entries_before:
+                entry = (non_craftable_goods if shortages else craftable_goods)[-1]
+                entry.update(trace.to_dict())
+
+        # 🚀 Persist every shortage of this request in one round trip and one commit
+        if shortage_rows:
+            with get_connection() as connection:
+                if not connection:
+                    return jsonify({"error": "Database connection failed"}), 500
+                store_shortages(connection, shortage_rows)
+
+        return jsonify({
+            "craftable_goods": craftable_goods,
+            "non_craftable_goods": non_craftable_goods,
+            "timed_out_goods": timed_out
+        })
+
+    except Exception as e:
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+
+def refresh_after_stock_change(connection, item_codes):
+    """
+    Incrementally refreshes craftability for the goods using `item_codes`.
+    Best effort: the caller's change is already committed, so a failure
+    here is logged and reported as None instead of failing the request.
+    """
+    try:
+        return refresh_craftability(connection, item_codes)
+    except Exception as e:
+        connection.rollback()
+        print(f"Craftability refresh failed for {len(item_codes)} items: {e}")
+        return None
+
+@app.route("/where_used", methods=["POST"])
+@jwt_required()
+def where_used():
+    """
+    Lists the assemblies and finished goods that consume an item, directly
+    or through subassemblies, with the quantity needed per unit of each.
+    """
+    data = request.get_json()
+    item_code = data.get("item_code")
+    if not item_code:
+        return jsonify({"error": "Missing item_code"}), 400
+
+    try:
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+            graph = get_bom_graph(connection)
+
+        result = graph.where_used(item_code)
+        if result is None:
+            return jsonify({"error": f"Item {item_code} not found in any BOM"}), 404
+        return jsonify(result), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+
+@app.route("/craftable_goods_batch", methods=["POST"])
+@jwt_required()
+def get_craftable_goods_batch():
+    """
+    Max buildable units for every finished good in one vectorized pass over
+    the in-memory BOM graph and the current stock.
+    """
+    try:
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            graph = get_bom_graph(connection)
+            stock = fetch_stock_vector(connection, graph)
+
+        fg_codes, max_units, limiting_items = calculate_max_units_batch(graph, stock)
+
+        craftable_goods = []
+        non_craftable_goods = []
+        for fg_code, units, limiting_item in zip(fg_codes, max_units, limiting_items):
+            if units > 0:
+                craftable_goods.append({
+                    "finished_good_code": fg_code,
+                    "max_units": units,
+                    "limiting_item": limiting_item
+                })
+            else:
+                non_craftable_goods.append({
+                    "finished_good_code": fg_code,
+                    "missing_items": [limiting_item] if limiting_item else []
+                })
 
         return jsonify({
             "craftable_goods": craftable_goods,
@@ -213,27 +406,111 @@ def get_craftable_goods():
     except Exception as e:
         return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
-    finally:
-        if connection:
-            connection.close()
+@app.route("/craftability_snapshot", methods=["POST"])
+@jwt_required()
+@conditional_response("craftability_snapshot")
+def list_craftability_snapshot():
+    """
+    Lists the stored max buildable units per finished good, kept current
+    for the goods each API stock change affects. "craftable": true/false
+    filters on max_units > 0; pagination as in /crafted_goods.
+    """
+    data = request.get_json()
+    craftable = data.get("craftable")
+    if craftable is not None and not isinstance(craftable, bool):
+        return jsonify({"error": "craftable must be true or false"}), 400
+
+    try:
+        page_request = parse_page_request(data, key_size=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            where = None if craftable is None else ("max_units > 0" if craftable else "max_units = 0")
+
+            total_records = count_rows(cursor, "craftability_snapshot", where, [], page_request.count)
+            results, next_cursor = fetch_page(cursor, "craftability_snapshot", where, [], ("bom_number",), False,
+                                              page_request)
+
+            return jsonify({
+                "total_records": total_records,
+                "page": page_request.page,
+                "page_size": page_request.page_size,
+                "results": results,
+                "next_cursor": next_cursor
+            })
+        except Exception as e:
+            return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+
+@app.route("/production_mix", methods=["POST"])
+@jwt_required()
+def production_mix():
+    """
+    Allocates the current stock across a demand list of finished goods,
+    highest priority first, so goods sharing components don't count the
+    same stock twice. Each demand entry is {"bom_number", "quantity"
+    (omit for as many as possible), "priority" (default 0)}.
+    """
+    data = request.get_json()
+    demand_list = data.get("demand")
+    if not isinstance(demand_list, list) or not demand_list:
+        return jsonify({"error": "demand must be a non-empty list"}), 400
+
+    demand = []
+    for position, entry in enumerate(demand_list):
+        bom_number = entry.get("bom_number") if isinstance(entry, dict) else None
+        quantity = entry.get("quantity") if bom_number else None
+        priority = entry.get("priority", 0) if bom_number else None
+        if (not bom_number
+                or (quantity is not None and (not isinstance(quantity, int) or quantity <= 0))
+                or not isinstance(priority, (int, float))):
+            return jsonify({"error": f"Invalid demand entry at position {position}"}), 400
+        demand.append((str(bom_number), quantity, priority))
+
+    try:
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+            graph = get_bom_graph(connection)
+            stock = fetch_stock_vector(connection, graph)
+
+        started = time.perf_counter()
+        allocations, components = allocate_mix(graph, stock, demand)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        return jsonify({
+            "allocations": allocations,
+            "binding_components": components,
+            "fully_served": sum(1 for entry in allocations
+                                if entry["requested"] is not None and entry["achievable"] >= entry["requested"]),
+            "solve_ms": round(elapsed_ms, 2)
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
 @app.route("/list_non_craftable", methods=["POST"])
 @jwt_required()
+@conditional_response("non_craftable_list")
 def list_non_craftable_goods():
     try:
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT bom_number, item_code, missing_qty, craft_attempt_qty, TO_CHAR(timestamp, 'DD-MM-YYYY') as timestamp
-            FROM non_craftable_list
-            ORDER BY timestamp DESC
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        connection.close()
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            cursor.execute("""
+                SELECT bom_number, item_code, missing_qty, craft_attempt_qty, TO_CHAR(timestamp, 'DD-MM-YYYY') as timestamp
+                FROM non_craftable_list
+                ORDER BY timestamp DESC
+            """)
+            data = cursor.fetchall()
+            cursor.close()
 
         return jsonify({"non_craftable_list": data})
 
@@ -241,41 +518,89 @@ def list_non_craftable_goods():
         return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
 
+EXPORT_MIMETYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+def export_table(query, params, sheet_name, filename, export_format, empty_message):
+    """
+    Streams a query result as a file download through a server-side cursor.
+    Without `export_format`, returns the legacy Base64-encoded xlsx in JSON.
+    """
+    if export_format and export_format not in EXPORT_MIMETYPES:
+        return jsonify({"error": f"Unsupported format: {export_format}"}), 400
+
+    connection = db_pool.getconn()
+    if not connection:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        columns, type_codes, chunks, has_rows = iter_query(connection, query, params)
+        if not has_rows:
+            db_pool.putconn(connection)
+            return jsonify({"error": empty_message}), 404
+
+        if export_format in ("parquet", "arrow"):
+            try:
+                schema = arrow_schema(columns, type_codes)
+            except RuntimeError as e:
+                db_pool.putconn(connection)
+                return jsonify({"error": str(e)}), 501
+
+        # 🚀 Text and Arrow streams go straight from the cursor; the connection goes back when the response closes
+        if export_format in ("csv", "ndjson", "arrow"):
+            if export_format == "csv":
+                body = csv_chunks(columns, chunks)
+            elif export_format == "ndjson":
+                body = ndjson_chunks(columns, chunks)
+            else:
+                body = arrow_stream_chunks(schema, chunks)
+            response = Response(
+                stream_with_context(body),
+                mimetype=EXPORT_MIMETYPES[export_format],
+                headers={"Content-Disposition": f"attachment; filename={filename}.{export_format}"}
+            )
+            response.call_on_close(lambda: db_pool.putconn(connection))
+            return response
+
+        output = tempfile.TemporaryFile()
+        if export_format == "parquet":
+            write_parquet(output, schema, chunks)
+        else:
+            write_xlsx(output, sheet_name, columns, chunks)
+    except Exception:
+        db_pool.putconn(connection)
+        raise
+    db_pool.putconn(connection)
+    output.seek(0)
+
+    if export_format:
+        return send_file(output, mimetype=EXPORT_MIMETYPES[export_format], as_attachment=True,
+                         download_name=f"{filename}.{export_format}")
+
+    with output:
+        base64_encoded = base64.b64encode(output.read()).decode("utf-8")
+    return jsonify({"file_data": base64_encoded})
+
 @app.route("/download_non_craftable_list", methods=["POST"])
 @jwt_required()
 def download_non_craftable_list():
+    """
+    Downloads the non-craftable list. Pass "format" (xlsx, csv, ndjson, parquet
+    or arrow) for a streamed file; otherwise returns a Base64-encoded Excel file.
+    """
     try:
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
+        data = request.get_json(silent=True) or {}
+        return export_table("""
             SELECT bom_number, item_code, missing_qty, craft_attempt_qty, TO_CHAR(timestamp, 'DD-MM-YYYY') as timestamp
             FROM non_craftable_list
             ORDER BY timestamp DESC
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        connection.close()
-
-        if not data:
-            return jsonify({"error": "No non-craftable data found"}), 404
-
-        df = pd.DataFrame(data)
-
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name="Non Craftable List", index=False)
-            worksheet = writer.sheets["Non Craftable List"]
-            for i, col in enumerate(df.columns):
-                col_width = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                worksheet.set_column(i, i, col_width)
-
-        output.seek(0)
-        base64_encoded = base64.b64encode(output.read()).decode("utf-8")
-
-        return jsonify({"file_data": base64_encoded})
+        """, (), "Non Craftable List", "non_craftable_list", data.get("format"),
+            "No non-craftable data found")
 
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
@@ -299,103 +624,207 @@ def plan_craftable_good():
         if not bom_number or not isinstance(quantity, int) or quantity <= 0:
             return jsonify({"error": "Valid BOM number and quantity are required."}), 400
 
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor()
-
-        # 1. Fetch BOM and Build Tree
-        bom_data = fetch_bom_data(connection, bom_number)
-        if not bom_data:
-            return jsonify({"error": "No BOM data found for the given BOM number"}), 404
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor()
+
+            # 1. Fetch BOM and build tree from live rows; a write never trusts the solver cache
+            bom_data = fetch_bom_data(connection, bom_number)
+            if not bom_data:
+                return jsonify({"error": "No BOM data found for the given BOM number"}), 404
+            item_data, tree = build_bom_tree(bom_data, bom_number)
+
+            # 2. Check Craftability
+            _, shortages, used_items = calculate_max_units(tree, item_data, bom_number, quantity)
+            if shortages:
+                missing_items = [item[0] for item in shortages]
+                return jsonify({"error": f"Not enough stock for items: {missing_items}"}), 400
+
+            # 3. Deduct stock, update planned_inventory and log in crafted_goods in one transaction
+            try:
+                plan_inventory(connection, bom_number, quantity, used_items, item_data)
+            except InsufficientStock as e:
+                connection.rollback()
+                return jsonify({"error": str(e)}), 400
+
+            connection.commit()
+            bump("admin_parts", "planned_inventory", "crafted_goods")
+            bump_items(used_items)
+            cursor.close()
 
-        item_data, tree = build_bom_tree(bom_data, bom_number)
+            # 4. Re-evaluate only the finished goods that use the deducted items
+            refreshed = refresh_after_stock_change(connection, used_items)
 
-        # 2. Check Craftability
-        _, shortages, used_items = calculate_max_units(tree, item_data, bom_number, quantity)
-        if shortages:
-            missing_items = [item[0] for item in shortages]
-            return jsonify({"error": f"Not enough stock for items: {missing_items}"}), 400
+        return jsonify({
+            "message": f"BOM {bom_number} planned successfully for {quantity} unit(s).",
+            "planned_inventory_updated": True,
+            "craftability_refreshed": refreshed
+        }), 200
 
-        # 3. Deduct stock and update planned_inventory
-        for item_code in used_items:
-            required_qty = used_items[item_code]
-            item_details = item_data[item_code]
-            item_level = item_details["Item_Level"]
-            extended_qty = item_details["Extended_Quantity"]
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-            # Fetch On_hand_Qty BEFORE deduction
-            cursor.execute("""
-                SELECT "On_hand_Qty" FROM admin_parts
-                WHERE "Item_code" = %s AND bom_number = %s
-            """, (item_code, bom_number))
-            result = cursor.fetchone()
-            admin_on_hand_qty = result["On_hand_Qty"] if result else 0
 
-            # Prevent stock from becoming negative (just in case)
-            if admin_on_hand_qty < required_qty:
-                required_qty = admin_on_hand_qty
 
-            # Deduct stock
-            cursor.execute("""
-                UPDATE admin_parts
-                SET "On_hand_Qty" = GREATEST("On_hand_Qty" - %s, 0)
-                WHERE "Item_code" = %s AND bom_number = %s
-            """, (required_qty, item_code, bom_number))
+def _whatif_session(data):
+    session = whatif_sessions.get(data.get("session_id"), get_jwt_identity())
+    if session is None:
+        return None, (jsonify({"error": "Unknown or expired what-if session"}), 404)
+    return session, None
 
-            # Check if already in planned_inventory
-            cursor.execute("""
-                SELECT "Allocation" FROM planned_inventory
-                WHERE "Item_code" = %s AND bom_number = %s
-            """, (item_code, bom_number))
-            existing = cursor.fetchone()
+@app.route("/whatif/start", methods=["POST"])
+@jwt_required()
+def whatif_start():
+    """
+    Opens a what-if planning session on a snapshot of the current stock.
+    Plans tried in the session are evaluated in memory; nothing is written
+    until /whatif/commit.
+    """
+    try:
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+            graph = get_bom_graph(connection)
+            stock = fetch_stock_vector(connection, graph)
 
-            net_qty = max(admin_on_hand_qty - required_qty, 0)
+        session = whatif_sessions.add(WhatIfSession(get_jwt_identity(), graph, stock))
+        return jsonify(session.summary()), 200
 
-            if existing:
-                new_alloc = existing["Allocation"] + required_qty
-                cursor.execute("""
-                    UPDATE planned_inventory
-                    SET "Allocation" = %s,
-                        "On_hand_Qty" = %s,
-                        "Net_Qty" = %s
-                    WHERE "Item_code" = %s AND bom_number = %s
-                """, (new_alloc, admin_on_hand_qty, net_qty, item_code, bom_number))
-            else:
-                cursor.execute("""
-                    INSERT INTO planned_inventory (
-                        bom_number, "Item_Level", "Item_code", 
-                        "Allocation", "Extended_Quantity", 
-                        "On_hand_Qty", "Net_Qty"
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    bom_number, item_level, item_code,
-                    required_qty, extended_qty,
-                    admin_on_hand_qty, net_qty
-                ))
+    except Exception as e:
+        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
-        # 4. Log in crafted_goods
-        cursor.execute("""
-            INSERT INTO crafted_goods (bom_number, "On_hand_Qty")
-            VALUES (%s, %s)
-            ON CONFLICT (bom_number) DO NOTHING;
-        """, (bom_number, quantity))
+@app.route("/whatif/try", methods=["POST"])
+@jwt_required()
+def whatif_try():
+    """
+    Checks whether `quantity` units of a BOM fit the session's remaining
+    stock. With "apply": true a feasible plan is kept and its usage deducted
+    from the session's stock for the plans tried after it.
+    """
+    data = request.get_json()
+    bom_number = data.get("bom_number")
+    quantity = data.get("quantity")
+    if not bom_number or not isinstance(quantity, int) or quantity <= 0:
+        return jsonify({"error": "Valid BOM number and quantity are required."}), 400
+
+    session, error = _whatif_session(data)
+    if error:
+        return error
+
+    with session.lock:
+        started = time.perf_counter()
+        result = session.evaluate(bom_number, quantity)
+        if result is None:
+            return jsonify({"error": "No BOM data found for the given BOM number"}), 404
 
-        connection.commit()
-        cursor.close()
+        _, shortages, used_items = result
+        feasible = not shortages
+        applied = feasible and bool(data.get("apply"))
+        if applied:
+            session.apply(bom_number, quantity, used_items)
+        elapsed_us = (time.perf_counter() - started) * 1e6
 
         return jsonify({
-            "message": f"BOM {bom_number} planned successfully for {quantity} unit(s).",
-            "planned_inventory_updated": True
+            "bom_number": bom_number,
+            "quantity": quantity,
+            "feasible": feasible,
+            "applied": applied,
+            "missing_items": [{"item_code": item[0], "missing_qty": item[1]} for item in shortages],
+            "used_items": used_items,
+            "remaining_stock": session.remaining(used_items),
+            "plans": len(session.plans),
+            "elapsed_us": round(elapsed_us, 1)
         }), 200
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Database error: {str(e)}"}), 500
-
-
+@app.route("/whatif/undo", methods=["POST"])
+@jwt_required()
+def whatif_undo():
+    """Drops the session's last applied plan and restores the stock it used."""
+    session, error = _whatif_session(request.get_json())
+    if error:
+        return error
+    with session.lock:
+        undone = session.undo()
+        if undone is None:
+            return jsonify({"error": "No applied plans to undo"}), 400
+        return jsonify({"undone": {"bom_number": undone[0], "quantity": undone[1]}, **session.summary()}), 200
+
+@app.route("/whatif/stock", methods=["POST"])
+@jwt_required()
+def whatif_stock():
+    """Remaining stock of `item_codes` in the session, after its applied plans."""
+    data = request.get_json()
+    item_codes = data.get("item_codes")
+    if not isinstance(item_codes, list) or not item_codes:
+        return jsonify({"error": "item_codes must be a non-empty list"}), 400
+    session, error = _whatif_session(data)
+    if error:
+        return error
+    with session.lock:
+        return jsonify({"remaining_stock": session.remaining(item_codes), **session.summary()}), 200
+
+@app.route("/whatif/commit", methods=["POST"])
+@jwt_required()
+def whatif_commit():
+    """
+    Plans every applied plan of the session for real, in order and in one
+    transaction, re-checking each against live stock. If any no longer
+    fits, nothing is written and the session is kept for adjusting.
+    """
+    data = request.get_json()
+    session, error = _whatif_session(data)
+    if error:
+        return error
+
+    with session.lock:
+        plans = [(plan[0], plan[1]) for plan in session.plans]
+        if not plans:
+            return jsonify({"error": "The session has no applied plans"}), 400
+
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+            try:
+                deducted = commit_plans(connection, plans)
+                connection.commit()
+            except PlanConflict as e:
+                connection.rollback()
+                return jsonify({
+                    "error": str(e),
+                    "bom_number": e.bom_number,
+                    "quantity": e.quantity,
+                    "missing_items": [{"item_code": item[0], "missing_qty": item[1]} for item in e.shortages]
+                }), 409
+            except psycopg2.Error as e:
+                connection.rollback()
+                return jsonify({"error": "Database error", "details": str(e)}), 500
+
+            bump("admin_parts", "planned_inventory", "crafted_goods")
+            bump_items(deducted)
+            whatif_sessions.discard(session.id)
+
+            # Re-evaluate only the finished goods that use the deducted items
+            refreshed = refresh_after_stock_change(connection, deducted)
+
+    return jsonify({
+        "message": f"{len(plans)} plan(s) committed.",
+        "plans": [{"bom_number": bom_number, "quantity": quantity} for bom_number, quantity in plans],
+        "craftability_refreshed": refreshed
+    }), 200
+
+@app.route("/whatif/discard", methods=["POST"])
+@jwt_required()
+def whatif_discard():
+    """Closes a what-if session without writing anything."""
+    session, error = _whatif_session(request.get_json())
+    if error:
+        return error
+    whatif_sessions.discard(session.id)
+    return jsonify({"message": "What-if session discarded."}), 200
 
 @app.route("/reset_approvals", methods=["POST"])
 @jwt_required()
@@ -405,37 +834,47 @@ def reset_inventory():
     by summing up `Allocated` per `Item_code`. Also clears `planned_inventory`, `crafted_goods`, and `non_craftable_list`.
     """
     try:
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor = connection.cursor()
+            cursor = connection.cursor()
 
-        # 🚀 **1. Restore Allocated Qty back to `admin_parts_duplicate`**
-        cursor.execute("""
-            UPDATE admin_parts
-            SET "On_hand_Qty" = "On_hand_Qty" + sub.restock_qty
-            FROM (
-                SELECT "Item_code", SUM("Allocation") AS restock_qty
-                FROM planned_inventory
-                GROUP BY "Item_code"
-            ) AS sub
-            WHERE admin_parts."Item_code" = sub."Item_code";
-        """)
+            # 🚀 **1. Restore Allocated Qty back to `admin_parts_duplicate`**
+            cursor.execute("""
+                UPDATE admin_parts
+                SET "On_hand_Qty" = "On_hand_Qty" + sub.restock_qty
+                FROM (
+                    SELECT "Item_code", SUM("Allocation") AS restock_qty
+                    FROM planned_inventory
+                    GROUP BY "Item_code"
+                ) AS sub
+                WHERE admin_parts."Item_code" = sub."Item_code"
+                RETURNING admin_parts."Item_code";
+            """)
+            restocked_items = {row["Item_code"] for row in cursor.fetchall()}
 
-        # 🚀 **2. Clear `planned_inventory`**
-        cursor.execute("DELETE FROM planned_inventory")
+            # 🚀 **2. Clear `planned_inventory`**
+            cursor.execute("DELETE FROM planned_inventory")
 
-        # 🚀 **3. Clear `crafted_goods`**
-        cursor.execute("DELETE FROM crafted_goods")
+            # 🚀 **3. Clear `crafted_goods`**
+            cursor.execute("DELETE FROM crafted_goods")
 
-        # 🚀 **4. Clear `non_craftable_list`**
-        cursor.execute("DELETE FROM non_craftable_list")
+            # 🚀 **4. Clear `non_craftable_list`**
+            cursor.execute("DELETE FROM non_craftable_list")
 
-        connection.commit()
-        cursor.close()
+            connection.commit()
+            bump("admin_parts", "planned_inventory", "crafted_goods", "non_craftable_list")
+            bump_items(restocked_items)
+            cursor.close()
 
-        return jsonify({"message": "Planned inventory and non-craftable list reset successfully."}), 200
+            # 🚀 **5. Re-evaluate only the finished goods that use the restocked items**
+            refreshed = refresh_after_stock_change(connection, restocked_items)
+
+        return jsonify({
+            "message": "Planned inventory and non-craftable list reset successfully.",
+            "craftability_refreshed": refreshed
+        }), 200
 
     except Exception as e:
         return jsonify({"error": f"Database error: {e}"}), 500
@@ -489,55 +928,23 @@ def reset_inventory():
 def download_bom_data():
     """
     Downloads the BOM data table with selected columns.
-    Returns a Base64-encoded Excel file.
+    Pass "format" (xlsx, csv, ndjson, parquet or arrow) for a streamed file;
+    otherwise returns a Base64-encoded Excel file.
     """
     try:
         data = request.get_json()
         bom_number = data.get("bom_number", None)  # Optional
 
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-
+        query = """
+            SELECT "Item_code", "On_hand_Qty", "Extended_Quantity"
+            FROM admin_parts
+        """
+        params = ()
         if bom_number:
-            cursor.execute("""
-                SELECT "Item_code", "On_hand_Qty", "Extended_Quantity"
-                FROM admin_parts WHERE bom_number = %s
-            """, (bom_number,))
-        else:
-            cursor.execute("""
-                SELECT "Item_code", "On_hand_Qty", "Extended_Quantity"
-                FROM admin_parts
-            """)
-
-        bom_data = cursor.fetchall()
-        cursor.close()
-
-        if not bom_data:
-            return jsonify({"error": "No data found"}), 404
-
-        # Convert to DataFrame
-        df = pd.DataFrame(bom_data)
-
-        # Create Excel file with adjusted column widths
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="BOM Data")
-
-            # ✅ Auto-adjust column widths
-            worksheet = writer.sheets["BOM Data"]
-            for col_num, value in enumerate(df.columns.values):
-                col_width = max(df[value].astype(str).map(len).max(), len(value)) + 2
-                worksheet.set_column(col_num, col_num, col_width)
-
-        output.seek(0)
-
-        # Convert to Base64
-        encoded_string = base64.b64encode(output.getvalue()).decode('utf-8')
+            query += " WHERE bom_number = %s"
+            params = (bom_number,)
 
-        return jsonify({"file_data": encoded_string})
+        return export_table(query, params, "BOM Data", "bom_data", data.get("format"), "No data found")
 
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
@@ -547,17 +954,13 @@ def download_bom_data():
 def download_planned_inventory():
     """
     Downloads the entire planned inventory table or for a specific BOM number.
+    Pass "format" (xlsx, csv, ndjson, parquet or arrow) for a streamed file;
+    otherwise returns a Base64-encoded Excel file.
     """
     try:
         data = request.get_json()
         bom_number = data.get("bom_number")
 
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-
         # 🚀 **1. Fetch planned inventory data**
         query = """
             SELECT id, bom_number, "Item_Level", "Item_code", "On_hand_Qty", 
@@ -569,34 +972,9 @@ def download_planned_inventory():
             query += " WHERE bom_number = %s"
             params = (bom_number,)
 
-        cursor.execute(query, params)
-        planned_data = cursor.fetchall()
-        cursor.close()
-        connection.close()
-
-        if not planned_data:
-            return jsonify({"error": "No planned inventory data found"}), 404
-
-        # Convert to DataFrame
-        df_planned = pd.DataFrame(planned_data)
-
-        # 🚀 **2. Create an Excel File**
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df_planned.to_excel(writer, sheet_name="Planned Inventory", index=False)
-
-            # Adjust column widths
-            worksheet = writer.sheets["Planned Inventory"]
-            for i, col in enumerate(df_planned.columns):
-                col_width = max(df_planned[col].astype(str).map(len).max(), len(col)) + 2
-                worksheet.set_column(i, i, col_width)
-
-        output.seek(0)
-
-        # 🚀 **3. Convert to Base64**
-        base64_encoded = base64.b64encode(output.read()).decode("utf-8")
-
-        return jsonify({"file_data": base64_encoded})
+        # 🚀 **2. Stream it out as a file**
+        return export_table(query, params, "Planned Inventory", "planned_inventory", data.get("format"),
+                            "No planned inventory data found")
 
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
@@ -619,26 +997,27 @@ def assemble():
         if not finished_good_code or not isinstance(quantity, int) or quantity <= 0:
             return jsonify({"error": "Valid BOM number and quantity required."}), 400
 
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
 
-        cursor = connection.cursor()
+            cursor = connection.cursor()
 
-        # 🚀 **2. Remove from `planned_inventory`**
-        cursor.execute("DELETE FROM planned_inventory WHERE bom_number = %s", (finished_good_code,))
+            # 🚀 **2. Remove from `planned_inventory`**
+            cursor.execute("DELETE FROM planned_inventory WHERE bom_number = %s", (finished_good_code,))
 
-        # 🚀 **3. Remove from `crafted_goods`**
-        cursor.execute("DELETE FROM crafted_goods WHERE bom_number = %s", (finished_good_code,))
+            # 🚀 **3. Remove from `crafted_goods`**
+            cursor.execute("DELETE FROM crafted_goods WHERE bom_number = %s", (finished_good_code,))
 
-        # 🚀 **4. Log Assembly**
-        cursor.execute("""
-            INSERT INTO assembly_logs (bom_number, max_crafted_units, created_by, created_at)
-            VALUES (%s, %s, %s, NOW());
-        """, (finished_good_code, quantity, user))
+            # 🚀 **4. Log Assembly**
+            cursor.execute("""
+                INSERT INTO assembly_logs (bom_number, max_crafted_units, created_by, created_at)
+                VALUES (%s, %s, %s, NOW());
+            """, (finished_good_code, quantity, user))
 
-        connection.commit()
-        cursor.close()
+            connection.commit()
+            bump("planned_inventory", "crafted_goods", "assembly_logs")
+            cursor.close()
 
         return jsonify({
             "message": f"Successfully assembled {finished_good_code} in {quantity} quantity.",
@@ -652,70 +1031,48 @@ def assemble():
 # ✅ **List Assembly Logs with Search & Pagination**
 @app.route("/assembly_logs", methods=["POST"])
 @jwt_required()
+@conditional_response("assembly_logs")
 def list_assembly_logs():
+    """
+    Lists assembly logs, newest first. Pass the previous response's
+    "next_cursor" as "cursor" for the next page; "page" still works for
+    older clients. "count" is none, exact, estimated or cached.
+    """
     try:
         data = request.get_json()
         search_text = data.get("search_text", "").strip()
-        page = data.get("page", 1)  # Default page is 1
-        page_size = data.get("page_size", 10)  # Default page size is 10
-       
-        # Validate pagination values
-        if not isinstance(page, int) or page <= 0:
-            return jsonify({"error": "Invalid page number"}), 400
-        if not isinstance(page_size, int) or page_size <= 0:
-            return jsonify({"error": "Invalid page size"}), 400
-       
-        offset = (page - 1) * page_size  # Calculate offset for pagination
-       
-        connection = connect_to_database()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-       
-        cursor = connection.cursor()
-       
-        # Base query
-        query = "SELECT id, bom_number, max_crafted_units, created_by, created_at FROM assembly_logs"
-        params = []
-       
-        # Apply search filter if provided
-        if search_text:
-            query += " WHERE bom_number ILIKE %s OR created_by ILIKE %s"
-            params.extend([f"%{search_text}%", f"%{search_text}%"])
-        
-        # Count total rows before applying pagination
-        count_query = "SELECT COUNT(*) AS total FROM assembly_logs"
-        if search_text:
-            count_query += " WHERE bom_number ILIKE %s OR created_by ILIKE %s"
-        
-        cursor.execute(count_query, tuple(params[:2] if search_text else []))
-        count_result = cursor.fetchone()
-        
-        # Handle different return types safely
-        total_count = 0
-        if count_result is not None:
-            if isinstance(count_result, dict):
-                total_count = count_result.get('total', 0)
-            elif isinstance(count_result, (list, tuple)) and len(count_result) > 0:
-                total_count = count_result[0]
-            else:
-                total_count = 0
-       
-        # Add pagination
-        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
-        params.extend([page_size, offset])
-       
-        cursor.execute(query, tuple(params))
-        logs = cursor.fetchall()
-        cursor.close()
-        connection.close()
-       
+
+        try:
+            page_request = parse_page_request(data, key_size=2)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        with get_connection() as connection:
+            if not connection:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cursor = connection.cursor()
+
+            # Apply search filter if provided
+            where, params = None, []
+            if search_text:
+                where = "bom_number ILIKE %s OR created_by ILIKE %s"
+                params = [f"%{search_text}%", f"%{search_text}%"]
+
+            total_count = count_rows(cursor, "assembly_logs", where, params, page_request.count)
+            logs, next_cursor = fetch_page(cursor, "assembly_logs", where, params,
+                                           ("created_at", "id"), True, page_request,
+                                           columns="id, bom_number, max_crafted_units, created_by, created_at")
+            cursor.close()
+
         return jsonify({
-            "assembly_logs": logs, 
-            "page": page, 
-            "page_size": page_size,
-            "total_count": total_count
+            "assembly_logs": logs,
+            "page": page_request.page,
+            "page_size": page_request.page_size,
+            "total_count": total_count,
+            "next_cursor": next_cursor
         }), 200
-   
+
     except Exception as e:
         import traceback
         print(f"API error: {str(e)}")
@@ -724,62 +1081,80 @@ def list_assembly_logs():
 
 @app.route("/admin_parts", methods=["POST"])
 @jwt_required()
+@conditional_response("admin_parts")
 def get_admin_parts():
+    """
+    Lists admin parts. With "searchtext", results are ranked by relevance
+    (exact item code, then item-code prefix, then similarity); pass
+    "sort": "id" to page in id order instead.
+    """
     data = request.get_json()
     query = data.get("searchtext", "").strip()
-    page = data.get("page", 1)
-    page_size = data.get("page_size", 10)
+    ranked = bool(query) and data.get("sort", "relevance") != "id"
 
-    if not isinstance(page, int) or not isinstance(page_size, int) or page <= 0 or page_size <= 0:
-        return jsonify({"error": "Invalid page or page_size"}), 400
+    try:
+        page_request = parse_page_request(data, key_size=2 if ranked else 1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    offset = (page - 1) * page_size
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-    try:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
 
-        if query:
-            search_pattern = f"%{query}%"
+            where, params = None, []
+            if query:
+                where, params = admin_parts_search(query)
 
-            cursor.execute("""
-                SELECT COUNT(*) FROM admin_parts 
-                WHERE CAST("bom_number" AS TEXT) ILIKE %s 
-                OR "Item_code" ILIKE %s
-                OR "description" ILIKE %s
-                OR "Type" ILIKE %s
-            """, (search_pattern, search_pattern, search_pattern, search_pattern))
-            total_records = cursor.fetchone()['count']
+            total_records = count_rows(cursor, "admin_parts", where, params, page_request.count)
+            if ranked:
+                table, rank_params = ranked_admin_parts(cursor, query)
+                results, next_cursor = fetch_page(cursor, table, where, rank_params + params,
+                                                  ("rank", "id"), True, page_request)
+            else:
+                results, next_cursor = fetch_page(cursor, "admin_parts", where, params, ("id",), False, page_request)
+
+            return jsonify({
+                "total_records": total_records,
+                "page": page_request.page,
+                "page_size": page_request.page_size,
+                "results": results,
+                "next_cursor": next_cursor
+            })
+        except Exception as e:
+            return jsonify({"error": f"Database error: {e}"}), 500
+        finally:
+            cursor.close()
 
-            cursor.execute("""
-                SELECT * FROM admin_parts 
-                WHERE CAST("bom_number" AS TEXT) ILIKE %s 
-                OR "Item_code" ILIKE %s
-                OR "description" ILIKE %s
-                OR "Type" ILIKE %s
-                LIMIT %s OFFSET %s
-            """, (search_pattern, search_pattern, search_pattern, search_pattern, page_size, offset))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM admin_parts")
-            total_records = cursor.fetchone()['count']
 
-            cursor.execute("SELECT * FROM admin_parts LIMIT %s OFFSET %s", (page_size, offset))
+@app.route("/admin_parts/autocomplete", methods=["POST"])
+@jwt_required()
+def autocomplete_admin_parts():
+    """
+    Suggests item codes starting with "prefix" (case-insensitive).
+    """
+    data = request.get_json()
+    prefix = data.get("prefix", "").strip()
+    limit = data.get("limit", 10)
+
+    if not prefix:
+        return jsonify({"error": "Missing prefix"}), 400
+    if not isinstance(limit, int) or not 0 < limit <= 100:
+        return jsonify({"error": "limit must be between 1 and 100"}), 400
 
-        results = cursor.fetchall()
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-        return jsonify({
-            "total_records": total_records,
-            "page": page,
-            "page_size": page_size,
-            "results": results
-        })
-    except Exception as e:
-        return jsonify({"error": f"Database error: {e}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            return jsonify({"prefix": prefix, "suggestions": autocomplete_item_codes(cursor, prefix, limit)})
+        except Exception as e:
+            return jsonify({"error": f"Database error: {e}"}), 500
+        finally:
+            cursor.close()
 
 
 
@@ -788,123 +1163,98 @@ def get_admin_parts():
 
 @app.route("/crafted_goods", methods=["POST"])
 @jwt_required()
+@conditional_response("crafted_goods")
 def fetch_or_search_crafted_goods():
     """
-    Fetches or searches crafted goods with pagination.
+    Fetches or searches crafted goods with cursor pagination.
     Filters only non-approved records.
     Orders results by newest first.
     """
     data = request.get_json()
     query = data.get("searchtext", "").strip()  
-    page = data.get("page", 1)
-    page_size = data.get("page_size", 10)
-
-    if not isinstance(page, int) or not isinstance(page_size, int) or page <= 0 or page_size <= 0:
-        return jsonify({"error": "Invalid page or page_size"}), 400
-
-    offset = (page - 1) * page_size
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
 
     try:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-        params = []
-        query_conditions = "WHERE approved = FALSE"
-
-        if query:
-            search_pattern = f"%{query}%"
-            if query.isnumeric():
-                query_conditions += " AND bom_number = %s"
-                params.append(query)
-            else:
-                query_conditions += " AND (CAST(bom_number AS TEXT) ILIKE %s OR description ILIKE %s OR \"Type\" ILIKE %s)"
-                params.extend([search_pattern, search_pattern, search_pattern])
-
-        # 🔹 Get total record count
-        count_query = f"SELECT COUNT(*) FROM crafted_goods {query_conditions}"
-        cursor.execute(count_query, tuple(params))
-        total_records = cursor.fetchone()['count']
-
-        # 🔹 Fetch paginated results sorted by newest first (Using Primary Key or Insert Timestamp)
-        data_query = f"""
-            SELECT * FROM crafted_goods 
-            {query_conditions}
-            ORDER BY id DESC  -- Ensure the latest records appear first
-            LIMIT %s OFFSET %s
-        """
-        params.extend([page_size, offset])
-        cursor.execute(data_query, tuple(params))
-        results = cursor.fetchall()
+        page_request = parse_page_request(data, key_size=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify({
-            "total_records": total_records,
-            "page": page,
-            "page_size": page_size,
-            "results": results
-        })
-    except Exception as e:
-        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
+            params = []
+            query_conditions = "approved = FALSE"
+
+            if query:
+                search_pattern = f"%{query}%"
+                if query.isnumeric():
+                    query_conditions += " AND bom_number = %s"
+                    params.append(query)
+                else:
+                    query_conditions += " AND (CAST(bom_number AS TEXT) ILIKE %s OR description ILIKE %s OR \"Type\" ILIKE %s)"
+                    params.extend([search_pattern, search_pattern, search_pattern])
+
+            # 🔹 Get total record count
+            total_records = count_rows(cursor, "crafted_goods", query_conditions, params, page_request.count)
+
+            # 🔹 Fetch the page sorted by newest first (Primary Key)
+            results, next_cursor = fetch_page(cursor, "crafted_goods", query_conditions, params,
+                                              ("id",), True, page_request)
+
+            return jsonify({
+                "total_records": total_records,
+                "page": page_request.page,
+                "page_size": page_request.page_size,
+                "results": results,
+                "next_cursor": next_cursor
+            })
+        except Exception as e:
+            return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
 
 @app.route("/approved_crafted_goods", methods=["POST"])
 @jwt_required()
+@conditional_response("crafted_goods")
 def fetch_approved_crafted_goods():
     data = request.get_json()
     query = data.get("searchtext", "").strip()
-    page = data.get("page", 1)
-    page_size = data.get("page_size", 10)
-
-    if not isinstance(page, int) or not isinstance(page_size, int) or page <= 0 or page_size <= 0:
-        return jsonify({"error": "Invalid page or page_size"}), 400
-
-    offset = (page - 1) * page_size
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
 
     try:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
-
-        if query:
-            search_pattern = f"%{query}%"
+        page_request = parse_page_request(data, key_size=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-            cursor.execute("""
-                SELECT COUNT(*) FROM crafted_goods 
-                WHERE (bom_number ILIKE %s OR description ILIKE %s OR "Type" ILIKE %s) 
-                AND approved = TRUE
-            """, (search_pattern, search_pattern, search_pattern))
-
-            total_records = cursor.fetchone()['count']
-
-            cursor.execute("""
-                SELECT * FROM crafted_goods 
-                WHERE (bom_number ILIKE %s OR description ILIKE %s OR "Type" ILIKE %s) 
-                AND approved = TRUE
-                LIMIT %s OFFSET %s
-            """, (search_pattern, search_pattern, search_pattern, page_size, offset))
-        else:
-            cursor.execute("SELECT COUNT(*) FROM crafted_goods WHERE approved = TRUE")
-            total_records = cursor.fetchone()['count']
-
-            cursor.execute("SELECT * FROM crafted_goods WHERE approved = TRUE LIMIT %s OFFSET %s", (page_size, offset))
-
-        results = cursor.fetchall()
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-        return jsonify({
-            "total_records": total_records,
-            "page": page,
-            "page_size": page_size,
-            "results": results
-        })
-    except Exception as e:
-        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
+
+            where, params = "approved = TRUE", []
+            if query:
+                search_pattern = f"%{query}%"
+                where = '(bom_number ILIKE %s OR description ILIKE %s OR "Type" ILIKE %s) AND approved = TRUE'
+                params = [search_pattern, search_pattern, search_pattern]
+
+            total_records = count_rows(cursor, "crafted_goods", where, params, page_request.count)
+            results, next_cursor = fetch_page(cursor, "crafted_goods", where, params, ("id",), True, page_request)
+
+            return jsonify({
+                "total_records": total_records,
+                "page": page_request.page,
+                "page_size": page_request.page_size,
+                "results": results,
+                "next_cursor": next_cursor
+            })
+        except Exception as e:
+            return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
 @app.route("/thumbsup", methods=["POST"])
 @jwt_required()
@@ -915,31 +1265,31 @@ def approve_crafted_good():
     if not bom_number:
         return jsonify({"error": "Missing bom_number"}), 400
 
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-    try:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
 
-        # Check if the item exists
-        cursor.execute("SELECT * FROM crafted_goods WHERE bom_number = %s", (bom_number,))
-        result = cursor.fetchone()
+            # Check if the item exists
+            cursor.execute("SELECT * FROM crafted_goods WHERE bom_number = %s", (bom_number,))
+            result = cursor.fetchone()
 
-        if not result:
-            return jsonify({"error": "Item not found"}), 404
+            if not result:
+                return jsonify({"error": "Item not found"}), 404
 
-        # Set approved = TRUE
-        cursor.execute("UPDATE crafted_goods SET approved = TRUE WHERE bom_number = %s", (bom_number,))
-        connection.commit()
+            # Set approved = TRUE
+            cursor.execute("UPDATE crafted_goods SET approved = TRUE WHERE bom_number = %s", (bom_number,))
+            connection.commit()
+            bump("crafted_goods")
 
-        return jsonify({"message": "Item approved", "bom_number": bom_number, "approved": True})
+            return jsonify({"message": "Item approved", "bom_number": bom_number, "approved": True})
     
-    except Exception as e:
-        return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
-    finally:
-        cursor.close()
-        connection.close()
+        except Exception as e:
+            return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
 
 # Add/Edit Admin Parts API
@@ -995,91 +1345,186 @@ def add_edit_admin_parts():
         }), 400
 
     # Database connection
-    connection = connect_to_database()
-    if not connection:
-        return jsonify({"error": "Database connection failed"}), 500
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
 
-    try:
-        cursor = connection.cursor(cursor_factory=RealDictCursor)
+        try:
+            cursor = connection.cursor(cursor_factory=RealDictCursor)
         
-        if "id" in validated_data:
-            # UPDATE existing record
-            cursor.execute("""
-                UPDATE admin_parts SET
-                    bom_number = %s,
-                    "Item_code" = %s,
-                    "Item_Level" = %s,
-                    description = %s,
-                    "Type" = %s,
-                    "On_hand_Qty" = %s,
-                    "Extended_Quantity" = %s,
-                    is_active = %s
-                WHERE id = %s
-                RETURNING *;
-            """, (
-                validated_data["bom_number"],
-                validated_data["item_code"],
-                validated_data["item_level"],
-                validated_data["description"],
-                validated_data["type"],
-                validated_data["on_hand_qty"],
-                validated_data["extended_quantity"],
-                validated_data["is_active"],
-                validated_data["id"]
-            ))
-
-            if cursor.rowcount == 0:
-                return jsonify({"error": f"No record found with id {validated_data['id']}"}), 404
+            if "id" in validated_data:
+                cursor.execute("""
+                    SELECT bom_number, "Item_code", "Item_Level", "Type", "Extended_Quantity"
+                    FROM admin_parts WHERE id = %s FOR UPDATE
+                """, (validated_data["id"],))
+                previous = cursor.fetchone()
+
+                # UPDATE existing record
+                cursor.execute("""
+                    UPDATE admin_parts SET
+                        bom_number = %s,
+                        "Item_code" = %s,
+                        "Item_Level" = %s,
+                        description = %s,
+                        "Type" = %s,
+                        "On_hand_Qty" = %s,
+                        "Extended_Quantity" = %s,
+                        is_active = %s
+                    WHERE id = %s
+                    RETURNING *;
+                """, (
+                    validated_data["bom_number"],
+                    validated_data["item_code"],
+                    validated_data["item_level"],
+                    validated_data["description"],
+                    validated_data["type"],
+                    validated_data["on_hand_qty"],
+                    validated_data["extended_quantity"],
+                    validated_data["is_active"],
+                    validated_data["id"]
+                ))
+
+                if cursor.rowcount == 0:
+                    return jsonify({"error": f"No record found with id {validated_data['id']}"}), 404
                 
-        else:
-            # INSERT new record
-            cursor.execute("""
-                INSERT INTO admin_parts (
-                    bom_number,
-                    "Item_code",
-                    "Item_Level",
-                    description,
-                    "Type",
-                    "On_hand_Qty",
-                    "Extended_Quantity",
-                    is_active,
-                    created_date,
-                    created_by
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_DATE, %s)
-                RETURNING *;
-            """, (
-                validated_data["bom_number"],
-                validated_data["item_code"],
-                validated_data["item_level"],
-                validated_data["description"],
-                validated_data["type"],
-                validated_data["on_hand_qty"],
-                validated_data["extended_quantity"],
-                validated_data["is_active"],
-                current_user
-            ))
-
-        result = cursor.fetchone()
-        connection.commit()
+            else:
+                # INSERT new record
+                cursor.execute("""
+                    INSERT INTO admin_parts (
+                        bom_number,
+                        "Item_code",
+                        "Item_Level",
+                        description,
+                        "Type",
+                        "On_hand_Qty",
+                        "Extended_Quantity",
+                        is_active,
+                        created_date,
+                        created_by
+                    )
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, CURRENT_DATE, %s)
+                    RETURNING *;
+                """, (
+                    validated_data["bom_number"],
+                    validated_data["item_code"],
+                    validated_data["item_level"],
+                    validated_data["description"],
+                    validated_data["type"],
+                    validated_data["on_hand_qty"],
+                    validated_data["extended_quantity"],
+                    validated_data["is_active"],
+                    current_user
+                ))
+
+            result = cursor.fetchone()
+
+            # Stock-only edits keep the cached BOM graph and exploded BOMs; structure edits rebuild them
+            changed_items = {result["Item_code"]}
+            structure_changed = "id" not in validated_data or any(
+                previous[column] != result[column]
+                for column in ("bom_number", "Item_code", "Item_Level", "Type", "Extended_Quantity")
+            )
+            if structure_changed:
+                changed_boms = {result["bom_number"]}
+                if "id" in validated_data:
+                    changed_boms.add(previous["bom_number"])
+                    changed_items.add(previous["Item_code"])
+                changed_items.update(str(bom) for bom in changed_boms)
+                refresh_exploded(connection, changed_boms)
+
+            connection.commit()
+            bump("admin_parts")
+            bump_items(changed_items)
+            if structure_changed:
+                bump(STRUCTURE_TABLE)
+                invalidate_bom_graph()
+            refreshed = refresh_after_stock_change(connection, changed_items)
         
-        operation = "updated" if "id" in validated_data else "created"
-        return jsonify({
-            "message": f"Admin part {operation} successfully",
-            "data": result
-        }), 200
+            operation = "updated" if "id" in validated_data else "created"
+            return jsonify({
+                "message": f"Admin part {operation} successfully",
+                "data": result,
+                "craftability_refreshed": refreshed
+            }), 200
         
-    except psycopg2.Error as e:
-        connection.rollback()
-        return jsonify({
-            "error": "Database error",
-            "details": str(e)
-        }), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+        except psycopg2.Error as e:
+            connection.rollback()
+            return jsonify({
+                "error": "Database error",
+                "details": str(e)
+            }), 500
+        finally:
+            if cursor:
+                cursor.close()
+
+
+# Bulk BOM Import API
+@app.route("/admin_parts/import", methods=["POST"])
+@jwt_required()
+def import_admin_parts():
+    """
+    Imports BOMs from an uploaded Excel file (multipart field "file").
+    Each BOM in the file replaces the existing rows for that Code in one
+    transaction. Per-row errors are returned; BOMs with errors are skipped
+    when "skip_invalid" is true, otherwise nothing is imported.
+    """
+    upload = request.files.get("file")
+    if not upload:
+        return jsonify({"error": "Missing file"}), 400
+    skip_invalid = request.form.get("skip_invalid", "false").lower() == "true"
+    current_user = get_jwt_identity()
+
+    started = time.perf_counter()
+    try:
+        parsed = parse_bom_workbook(upload.stream, request.form.get("sheet") or None)
+    except Exception as e:
+        return jsonify({"error": f"Could not read workbook: {e}"}), 400
+    parse_seconds = time.perf_counter() - started
+
+    report = {
+        "errors": parsed.errors,
+        "error_count": parsed.error_count,
+        "rejected_boms": sorted(parsed.rejected_boms),
+        "skipped_rows": parsed.skipped_rows,
+    }
+    rows = parsed.valid_rows()
+    if parsed.error_count and not skip_invalid:
+        return jsonify({"error": "Import rejected, fix the listed rows or send skip_invalid=true", **report}), 400
+    if not rows:
+        return jsonify({"error": "No valid BOM rows found", **report}), 400
+
+    with get_connection() as connection:
+        if not connection:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        try:
+            removed, inserted, copy_seconds, merge_seconds = copy_and_merge(connection, rows, current_user)
+            refresh_exploded(connection, {row[1] for row in rows})
+            connection.commit()
+            bump("admin_parts", STRUCTURE_TABLE)
+            invalidate_bom_graph()
+        except psycopg2.Error as e:
+            connection.rollback()
+            return jsonify({"error": "Database error", "details": str(e), **report}), 500
+
+        # The replaced BOMs and every good built from them
+        refreshed = refresh_after_stock_change(connection, {row[1] for row in rows})
+
+    total_seconds = time.perf_counter() - started
+    return jsonify({
+        "message": f"Imported {inserted} rows for {len({row[1] for row in rows})} BOMs",
+        "imported_rows": inserted,
+        "replaced_rows": removed,
+        "craftability_refreshed": refreshed,
+        **report,
+        "timings": {
+            "parse_seconds": round(parse_seconds, 3),
+            "copy_seconds": round(copy_seconds, 3),
+            "merge_seconds": round(merge_seconds, 3),
+            "total_seconds": round(total_seconds, 3),
+        },
+        "rows_per_second": round(inserted / total_seconds) if total_seconds else None,
+    }), 200
 
         
 if __name__ == "__main__":
@@ -1,49 +1,220 @@
 from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units
+from psycopg2.extras import execute_values
+from psycopg2 import sql
 import json
+import os
+from table_versions import bump
+from metrics import timed
 
-def store_craftable_non_craftable_goods(connection, craftable_goods, non_craftable_goods):
+# Rows per multi-row statement for bulk inventory writes
+INVENTORY_BATCH_SIZE = int(os.getenv("INVENTORY_BATCH_SIZE", "1000"))
+
+PLAN_DEDUCT_QUERY = sql.SQL("""
+    UPDATE admin_parts AS a
+    SET "On_hand_Qty" = GREATEST(a."On_hand_Qty" - v.qty, 0)
+    FROM (VALUES %s) AS v("Item_code", qty)
+    WHERE a.bom_number = {bom_number} AND a."Item_code" = v."Item_code"
+""")
+
+PLAN_UPSERT_QUERY = sql.SQL("""
+    INSERT INTO planned_inventory (
+        bom_number, "Item_code", "Item_Level", "Extended_Quantity",
+        "Allocation", "On_hand_Qty", "Net_Qty"
+    )
+    SELECT {bom_number}, v.*
+    FROM (VALUES %s) AS v("Item_code", "Item_Level", "Extended_Quantity", "Allocation", "On_hand_Qty", "Net_Qty")
+    ON CONFLICT (bom_number, "Item_code") DO UPDATE
+    SET "Allocation" = planned_inventory."Allocation" + EXCLUDED."Allocation",
+        "On_hand_Qty" = EXCLUDED."On_hand_Qty",
+        "Net_Qty" = EXCLUDED."Net_Qty"
+""")
+
+
+class InsufficientStock(Exception):
+    """Stock changed between the craftability check and the row locks."""
+
+    def __init__(self, bom_number, shortages):
+        super().__init__(f"Not enough stock for items: {[item[0] for item in shortages]}")
+        self.bom_number = bom_number
+        self.shortages = shortages
+
+
+@timed("db_write")
+def plan_inventory(connection, bom_number, quantity, used_items, item_data):
+    """
+    Deducts `used_items` from the BOM's admin_parts rows and records the
+    allocation in planned_inventory and crafted_goods with a fixed number
+    of set-based statements, whatever the BOM size.
+
+    Only the admin_parts rows of this BOM that are being deducted are
+    locked (FOR UPDATE, in id order), and `used_items` is re-checked
+    against the locked stock: raises InsufficientStock if another request
+    took it in the meantime. Does not commit; the caller rolls back.
+    Needs migrations/005_planned_inventory_unique.sql.
+    """
+    item_codes = list(used_items)
     with connection.cursor() as cursor:
-        for fg_code, max_units in craftable_goods:
-            try:
-                max_units_int = int(max_units)  # Ensure max_units is an integer
-                cursor.execute("""
-                INSERT INTO crafted_goods (bom_number, "On_hand_Qty", is_active)
-                VALUES (%s, %s, TRUE)
-                ON CONFLICT (bom_number) DO UPDATE SET "On_hand_Qty" = EXCLUDED."On_hand_Qty", is_active = EXCLUDED.is_active;
-                """, (fg_code, max_units_int))
-            except ValueError as e:
-                print(f"Error converting max_units to int for {fg_code}: {max_units} - {e}")
-                continue
-
-        for fg_code, missing_items in non_craftable_goods:
+        if item_codes:
+            # 1. Lock the affected rows and read On_hand_Qty BEFORE deduction
             cursor.execute("""
+                SELECT "Item_code", "On_hand_Qty" FROM admin_parts
+                WHERE bom_number = %s AND "Item_code" = ANY(%s)
+                ORDER BY id
+                FOR UPDATE
+            """, (bom_number, item_codes))
+            on_hand_before = {}
+            for row in cursor.fetchall():
+                on_hand_before.setdefault(row["Item_code"], row["On_hand_Qty"])
+
+            # The check ran before the locks, so a concurrent plan may have taken the stock since
+            shortages = [(item_code, used_items[item_code] - on_hand_qty)
+                         for item_code, on_hand_qty in on_hand_before.items() if used_items[item_code] > on_hand_qty]
+            if shortages:
+                raise InsufficientStock(bom_number, shortages)
+
+            deductions = []
+            planned_rows = []
+            for item_code in item_codes:
+                # Items with no row in this BOM are not deducted here
+                admin_on_hand_qty = on_hand_before.get(item_code, 0)
+                required_qty = used_items[item_code] if item_code in on_hand_before else 0
+                net_qty = admin_on_hand_qty - required_qty
+                item_details = item_data[item_code]
+
+                deductions.append((item_code, required_qty))
+                planned_rows.append((
+                    item_code, item_details["Item_Level"], item_details["Extended_Quantity"],
+                    required_qty, admin_on_hand_qty, net_qty
+                ))
+
+            # 2. Deduct stock
+            bom_literal = sql.Literal(bom_number)
+            execute_values(cursor, PLAN_DEDUCT_QUERY.format(bom_number=bom_literal), deductions,
+                           page_size=len(deductions))
+
+            # 3. Add to or create the planned_inventory rows
+            execute_values(cursor, PLAN_UPSERT_QUERY.format(bom_number=bom_literal), planned_rows,
+                           page_size=len(planned_rows))
+
+        # 4. Log in crafted_goods
+        cursor.execute("""
+            INSERT INTO crafted_goods (bom_number, "On_hand_Qty")
+            VALUES (%s, %s)
+            ON CONFLICT (bom_number) DO NOTHING;
+        """, (bom_number, quantity))
+
+@timed("db_write")
+def store_shortages(connection, shortage_rows):
+    """
+    Writes (bom_number, item_code, missing_qty, craft_attempt_qty) rows to
+    non_craftable_list as one multi-row INSERT and a single commit.
+    """
+    if not shortage_rows:
+        return
+    with connection.cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO non_craftable_list (bom_number, item_code, missing_qty, craft_attempt_qty, timestamp)
+            VALUES %s
+        """, shortage_rows, template="(%s, %s, %s, %s, CURRENT_DATE)", page_size=len(shortage_rows))
+    connection.commit()
+    bump("non_craftable_list")
+
+@timed("db_write")
+def store_craftable_non_craftable_goods(connection, craftable_goods, non_craftable_goods, batch_size=None):
+    """
+    Upserts craftable goods into crafted_goods and non-craftable goods into
+    non_craftable_goods with multi-row INSERT ... ON CONFLICT statements,
+    `batch_size` rows per statement, and commits once.
+    """
+    batch_size = batch_size or INVENTORY_BATCH_SIZE
+
+    # A multi-row upsert can't touch the same bom_number twice; last entry wins
+    crafted_rows = {}
+    for fg_code, max_units in craftable_goods:
+        try:
+            crafted_rows[fg_code] = (fg_code, int(max_units))  # Ensure max_units is an integer
+        except ValueError as e:
+            print(f"Error converting max_units to int for {fg_code}: {max_units} - {e}")
+            continue
+
+    non_craftable_rows = {
+        fg_code: (fg_code, json.dumps(missing_items))
+        for fg_code, missing_items in non_craftable_goods
+    }
+
+    with connection.cursor() as cursor:
+        if crafted_rows:
+            execute_values(cursor, """
+            INSERT INTO crafted_goods (bom_number, "On_hand_Qty", is_active)
+            VALUES %s
+            ON CONFLICT (bom_number) DO UPDATE SET "On_hand_Qty" = EXCLUDED."On_hand_Qty", is_active = EXCLUDED.is_active;
+            """, list(crafted_rows.values()), template="(%s, %s, TRUE)", page_size=batch_size)
+
+        if non_craftable_rows:
+            execute_values(cursor, """
             INSERT INTO non_craftable_goods (bom_number, "On_hand_Qty", is_active, missing_items)
-            VALUES (%s, 0, FALSE, %s)
+            VALUES %s
             ON CONFLICT (bom_number) DO UPDATE SET "On_hand_Qty" = EXCLUDED."On_hand_Qty", is_active = EXCLUDED.is_active, missing_items = EXCLUDED.missing_items;
-            """, (fg_code, json.dumps(missing_items)))
+            """, list(non_craftable_rows.values()), template="(%s, 0, FALSE, %s)", page_size=batch_size)
 
         connection.commit()
+    bump("crafted_goods", "non_craftable_goods")
+
+@timed("db_write")
+def store_craftability_snapshot(connection, snapshot_rows, batch_size=None):
+    """
+    Upserts (bom_number, max_units, missing_items JSON) rows into
+    craftability_snapshot, `batch_size` rows per statement, and commits once.
+    """
+    if not snapshot_rows:
+        return
+    with connection.cursor() as cursor:
+        execute_values(cursor, """
+            INSERT INTO craftability_snapshot (bom_number, max_units, missing_items, refreshed_at)
+            VALUES %s
+            ON CONFLICT (bom_number) DO UPDATE SET max_units = EXCLUDED.max_units,
+                missing_items = EXCLUDED.missing_items, refreshed_at = EXCLUDED.refreshed_at;
+        """, snapshot_rows, template="(%s, %s, %s::jsonb, now())", page_size=batch_size or INVENTORY_BATCH_SIZE)
+    connection.commit()
+    bump("craftability_snapshot")
 
-def assemble_finished_good(connection, finished_good_code, quantity, confirm=False):
+@timed("db_write")
+def update_inventory(connection, updates, batch_size=None):
+    """
+    Sets admin_parts_duplicate."On_hand_Qty" from (new_qty, item_code) pairs
+    with UPDATE ... FROM (VALUES ...), `batch_size` rows per statement.
+    Does not commit.
+    """
+    if not updates:
+        return
+    with connection.cursor() as cursor:
+        execute_values(cursor, """
+            UPDATE admin_parts_duplicate AS a
+            SET "On_hand_Qty" = v.new_qty
+            FROM (VALUES %s) AS v(new_qty, "Item_code")
+            WHERE a."Item_code" = v."Item_code";
+        """, updates, template="(%s::double precision, %s)", page_size=batch_size or INVENTORY_BATCH_SIZE)
+
+def assemble_finished_good(connection, finished_good_code, quantity, confirm=False, batch_size=None):
     bom_data = fetch_bom_data(connection, finished_good_code)
     if not bom_data:
         return {"success": False, "message": f"No BOM data found for {finished_good_code}."}
 
     item_data, tree = build_bom_tree(bom_data, finished_good_code)
-    max_units, shortages = calculate_max_units(tree, item_data, finished_good_code, quantity)
+    max_units, shortages, _ = calculate_max_units(tree, item_data, finished_good_code, quantity)
 
     if max_units < quantity:
         return {"success": False, "message": f"Cannot assemble {quantity}. Max craftable: {max_units}.", "shortages": shortages}
 
+    # Item codes are unique here, as UPDATE ... FROM needs
     updates = [(max(0, float(item_data[item_code]["On_hand_Qty"]) - quantity * item_data[item_code]["Extended_Quantity"]), item_code)
                for item_code in item_data]
 
     if not confirm:
         return {"success": False, "message": "Confirmation required.", "updates": updates}
 
-    with connection.cursor() as cursor:
-        for new_qty, item_code in updates:
-            cursor.execute('UPDATE admin_parts_duplicate SET "On_hand_Qty" = %s WHERE "Item_code" = %s;', (new_qty, item_code))
-        connection.commit()
+    update_inventory(connection, updates, batch_size)
+    connection.commit()
+    bump("admin_parts_duplicate")
 
     return {"success": True, "message": f"{quantity} units of {finished_good_code} assembled."}
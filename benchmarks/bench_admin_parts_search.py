@@ -0,0 +1,111 @@
+"""
+Latency percentiles of the /admin_parts search queries on a large
+synthetic admin_parts: a filtered page in id order, a ranked page, the
+estimated count and item-code autocomplete.
+
+Needs a Postgres to write to; admin_parts is created as a TEMP table with
+the indexes from migrations/002, so it only shadows the real table for this
+session. Without pg_trgm the substring searches fall back to sequential
+scans, which this benchmark shows as well.
+
+    BENCH_DATABASE_URL=postgresql://localhost/postgres BENCH_ROWS=1000000 python benchmarks/bench_admin_parts_search.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from pagination import PageRequest, fetch_page, count_rows
+from search import admin_parts_search, ranked_admin_parts, autocomplete_item_codes, has_trigram_support
+
+ROWS = int(os.getenv("BENCH_ROWS", "1000000"))
+REPEAT = int(os.getenv("BENCH_REPEAT", "200"))
+
+SCHEMA = """
+    CREATE TEMP TABLE admin_parts (
+        id serial PRIMARY KEY, bom_number integer, "Item_Level" integer, "Item_code" text,
+        description text, "Type" text, "On_hand_Qty" double precision, "Extended_Quantity" double precision
+    );
+    INSERT INTO admin_parts (bom_number, "Item_Level", "Item_code", description, "Type", "On_hand_Qty", "Extended_Quantity")
+    SELECT 100000 + g / 20, 1 + g %% 5, 'P' || lpad(to_hex(g * 2654435761 %% 4294967296), 8, '0'),
+           'component ' || md5(g::text), CASE WHEN g %% 3 = 0 THEN 'MAKE' ELSE 'BUY' END, g %% 40, 1
+    FROM generate_series(1, %s) g;
+    CREATE INDEX ON admin_parts ((lower("Item_code") COLLATE "C"));
+"""
+
+TRIGRAM_INDEXES = """
+    CREATE INDEX ON admin_parts USING gin ((CAST("bom_number" AS TEXT)) gin_trgm_ops);
+    CREATE INDEX ON admin_parts USING gin ("Item_code" gin_trgm_ops);
+    CREATE INDEX ON admin_parts USING gin ("description" gin_trgm_ops);
+    CREATE INDEX ON admin_parts USING gin ("Type" gin_trgm_ops);
+"""
+
+
+def percentiles(cursor, fn, terms):
+    samples = []
+    for i in range(REPEAT):
+        started = time.perf_counter()
+        fn(cursor, terms[i % len(terms)])
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        sys.exit("Set BENCH_DATABASE_URL to a Postgres the benchmark may write to")
+
+    connection = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    connection.autocommit = True
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    cursor.execute(SCHEMA, (ROWS,))
+    trigram = has_trigram_support(cursor)
+    if trigram:
+        cursor.execute(TRIGRAM_INDEXES)
+    cursor.execute("ANALYZE admin_parts")
+    print(f"{ROWS} rows loaded and indexed in {time.perf_counter() - started:.1f}s, pg_trgm: {trigram}")
+
+    cursor.execute('SELECT "Item_code", description FROM admin_parts ORDER BY random() LIMIT 100')
+    samples = cursor.fetchall()
+    rng = random.Random(0)
+    codes = [row["Item_code"][rng.randint(2, 4):][:5] for row in samples]
+    words = [row["description"][10:16] for row in samples]
+    prefixes = [row["Item_code"][:4].lower() for row in samples]
+    page = PageRequest(page_size=10)
+
+    def search_page(cursor, text):
+        where, params = admin_parts_search(text)
+        fetch_page(cursor, "admin_parts", where, params, ("id",), False, page)
+
+    def ranked_page(cursor, text):
+        where, params = admin_parts_search(text)
+        table, rank_params = ranked_admin_parts(cursor, text)
+        fetch_page(cursor, table, where, rank_params + params, ("rank", "id"), True, page)
+
+    def estimated_count(cursor, text):
+        where, params = admin_parts_search(text)
+        count_rows(cursor, "admin_parts", where, params, "estimated")
+
+    print(f"{'query':<34} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, fn, terms in (
+        ("search page, item code substring", search_page, codes),
+        ("search page, description word", search_page, words),
+        ("ranked page, item code substring", ranked_page, codes),
+        ("estimated count", estimated_count, codes),
+        ("autocomplete", lambda cursor, prefix: autocomplete_item_codes(cursor, prefix), prefixes),
+    ):
+        p50, p99 = percentiles(cursor, fn, terms)
+        print(f"{name:<34} {p50:>8.2f} {p99:>8.2f}")
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Export time and file size per download format for a synthetic catalog,
+run through the same chunked writers the download routes use (no
+database needed), plus the time to read each file back.
+
+    python benchmarks/bench_exports.py
+"""
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exports import (EXPORT_CHUNK_SIZE, write_xlsx, csv_chunks, ndjson_chunks, arrow_schema,
+                     arrow_stream_chunks, write_parquet)
+from synthetic_bom import generate_catalog
+
+COLUMNS = ["bom_number", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity"]
+# Postgres OIDs for integer, integer, text, text, double precision, double precision
+TYPE_CODES = [23, 23, 25, 25, 701, 701]
+
+
+def chunked(rows, size=EXPORT_CHUNK_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def export_streamed(chunks_fn, rows):
+    output = io.BytesIO()
+    for part in chunks_fn(chunked(rows)):
+        output.write(part if isinstance(part, bytes) else part.encode("utf-8"))
+    return output.getvalue()
+
+
+def export_file(write_fn, rows):
+    with tempfile.TemporaryFile() as output:
+        write_fn(output, chunked(rows))
+        output.seek(0)
+        return output.read()
+
+
+def read_xlsx(data):
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    return sum(1 for _ in workbook.active.iter_rows(values_only=True)) - 1
+
+
+def read_parquet(data):
+    import pyarrow.parquet as pq
+    return pq.read_table(io.BytesIO(data)).num_rows
+
+
+def read_arrow(data):
+    import pyarrow as pa
+    return pa.ipc.open_stream(data).read_all().num_rows
+
+
+def formats():
+    yield "xlsx", lambda rows: export_file(lambda f, c: write_xlsx(f, "BOM Data", COLUMNS, c), rows), read_xlsx
+    yield "csv", lambda rows: export_streamed(lambda c: csv_chunks(COLUMNS, c), rows), \
+        lambda data: sum(1 for _ in csv.reader(io.StringIO(data.decode("utf-8")))) - 1
+    yield "ndjson", lambda rows: export_streamed(lambda c: ndjson_chunks(COLUMNS, c), rows), \
+        lambda data: sum(1 for line in data.splitlines() if json.loads(line))
+    try:
+        schema = arrow_schema(COLUMNS, TYPE_CODES)
+    except RuntimeError as e:
+        print(f"Skipping parquet/arrow: {e}")
+        return
+    yield "parquet", lambda rows: export_file(lambda f, c: write_parquet(f, schema, c), rows), read_parquet
+    yield "arrow", lambda rows: export_streamed(lambda c: arrow_stream_chunks(schema, c), rows), read_arrow
+
+
+def main():
+    _, catalog = generate_catalog(finished_goods=400, depth=4, fanout=8, reuse=0.5, seed=3)
+    rows = [
+        (int(row["bom_number"]), row["Item_Level"], row["Item_code"], row["Type"],
+         row["On_hand_Qty"], float(row["Extended_Quantity"]))
+        for row in catalog
+    ]
+    print(f"{len(rows)} rows, chunks of {EXPORT_CHUNK_SIZE}")
+    print(f"{'format':<8} {'export s':>9} {'rows/sec':>10} {'size KiB':>9} {'read s':>8}")
+
+    for name, export, read in formats():
+        started = time.perf_counter()
+        data = export(rows)
+        seconds = time.perf_counter() - started
+
+        try:
+            started = time.perf_counter()
+            assert read(data) == len(rows)
+            read_seconds = f"{time.perf_counter() - started:>8.3f}"
+        except ImportError:
+            read_seconds = f"{'n/a':>8}"
+        print(f"{name:<8} {seconds:>9.3f} {len(rows) / seconds:>10.0f} {len(data) / 1024:>9.0f} {read_seconds}")
+
+
+if __name__ == "__main__":
+    main()
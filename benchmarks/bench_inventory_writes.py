@@ -0,0 +1,115 @@
+"""
+Rows/sec of the batched inventory writes in assembly_manager against the
+previous one-statement-per-row loops, for 10k items.
+
+Needs a Postgres to write to; the tables are created as TEMP tables, which
+shadow any real tables of the same name for this session only.
+
+    BENCH_DATABASE_URL=postgresql://localhost/postgres python benchmarks/bench_inventory_writes.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from assembly_manager import store_craftable_non_craftable_goods, update_inventory
+
+ROWS = 10000
+BATCH_SIZES = (100, 1000, 5000)
+
+SCHEMA = """
+    CREATE TEMP TABLE crafted_goods (
+        id serial PRIMARY KEY, bom_number text UNIQUE, "On_hand_Qty" integer,
+        is_active boolean, approved boolean DEFAULT FALSE
+    );
+    CREATE TEMP TABLE non_craftable_goods (
+        id serial PRIMARY KEY, bom_number text UNIQUE, "On_hand_Qty" integer,
+        is_active boolean, missing_items jsonb
+    );
+    CREATE TEMP TABLE admin_parts_duplicate (
+        id serial PRIMARY KEY, "Item_code" text, "On_hand_Qty" double precision
+    );
+    CREATE INDEX ON admin_parts_duplicate ("Item_code");
+"""
+
+
+def legacy_store_goods(connection, craftable_goods, non_craftable_goods):
+    with connection.cursor() as cursor:
+        for fg_code, max_units in craftable_goods:
+            cursor.execute("""
+            INSERT INTO crafted_goods (bom_number, "On_hand_Qty", is_active)
+            VALUES (%s, %s, TRUE)
+            ON CONFLICT (bom_number) DO UPDATE SET "On_hand_Qty" = EXCLUDED."On_hand_Qty", is_active = EXCLUDED.is_active;
+            """, (fg_code, int(max_units)))
+        for fg_code, missing_items in non_craftable_goods:
+            cursor.execute("""
+            INSERT INTO non_craftable_goods (bom_number, "On_hand_Qty", is_active, missing_items)
+            VALUES (%s, 0, FALSE, %s)
+            ON CONFLICT (bom_number) DO UPDATE SET "On_hand_Qty" = EXCLUDED."On_hand_Qty", is_active = EXCLUDED.is_active, missing_items = EXCLUDED.missing_items;
+            """, (fg_code, json.dumps(missing_items)))
+        connection.commit()
+
+
+def legacy_update_inventory(connection, updates):
+    with connection.cursor() as cursor:
+        for new_qty, item_code in updates:
+            cursor.execute('UPDATE admin_parts_duplicate SET "On_hand_Qty" = %s WHERE "Item_code" = %s;', (new_qty, item_code))
+    connection.commit()
+
+
+def timed(connection, fn):
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE crafted_goods, non_craftable_goods")
+    connection.commit()
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        sys.exit("Set BENCH_DATABASE_URL to a Postgres the benchmark may write to")
+
+    connection = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    with connection.cursor() as cursor:
+        cursor.execute(SCHEMA)
+        cursor.execute(
+            'INSERT INTO admin_parts_duplicate ("Item_code", "On_hand_Qty") '
+            "SELECT 'ITEM' || g, 100 FROM generate_series(1, %s) g", (ROWS,)
+        )
+    connection.commit()
+
+    half = ROWS // 2
+    craftable = [(f"FG{i}", i % 50) for i in range(half)]
+    non_craftable = [(f"FG{i}", [f"ITEM{i}"]) for i in range(half, ROWS)]
+    updates = [(float(i % 90), f"ITEM{i + 1}") for i in range(ROWS)]
+
+    print(f"{'write path':<32} {'batch':>6} {'seconds':>8} {'rows/sec':>10}")
+
+    def report(name, batch, seconds):
+        print(f"{name:<32} {batch:>6} {seconds:>8.3f} {ROWS / seconds:>10.0f}")
+
+    report("goods upsert, per-row loop", 1,
+           timed(connection, lambda: legacy_store_goods(connection, craftable, non_craftable)))
+    for batch in BATCH_SIZES:
+        report("goods upsert, execute_values", batch,
+               timed(connection, lambda: store_craftable_non_craftable_goods(connection, craftable, non_craftable, batch)))
+
+    report("inventory update, per-row loop", 1,
+           timed(connection, lambda: legacy_update_inventory(connection, updates)))
+    for batch in BATCH_SIZES:
+        def batched():
+            update_inventory(connection, updates, batch)
+            connection.commit()
+        report("inventory update, execute_values", batch, timed(connection, batched))
+
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
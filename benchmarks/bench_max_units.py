@@ -0,0 +1,94 @@
+"""
+Scaling of calculate_max_units on BOMs with heavy subassembly reuse.
+
+Compares the topological, memoized solver with the previous recursive
+walk (kept here as `legacy_calculate_max_units`), which re-walks a shared
+subassembly once per path that reaches it.
+
+    python benchmarks/bench_max_units.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bom_graph import BomGraph
+from fetch_data import calculate_max_units
+from synthetic_bom import generate_catalog, as_tuples
+
+LEGACY_PATH_LIMIT = 500000
+
+
+def legacy_calculate_max_units(tree, item_data, finished_good_code, required_quantity):
+    """The recursive solver this benchmark replaced, without its print() calls."""
+    shortages = []
+    used_items = {}
+
+    def recursive_calculate(item_code, quantity_needed):
+        item = item_data[item_code]
+        on_hand_qty = float(item["On_hand_Qty"]) or 0
+        required_qty = max(1, float(item["Extended_Quantity"]))
+        remaining_needed = max(0, quantity_needed - on_hand_qty)
+        if on_hand_qty > 0:
+            used_items[item_code] = used_items.get(item_code, 0) + min(quantity_needed, on_hand_qty)
+        if on_hand_qty >= quantity_needed:
+            return on_hand_qty // required_qty
+        if item_code in tree:
+            child_units = []
+            can_fulfill = True
+            for child in tree[item_code]:
+                units = recursive_calculate(child, remaining_needed * float(item_data[child]["Extended_Quantity"]))
+                if units == 0:
+                    can_fulfill = False
+                else:
+                    child_units.append(units)
+            return min(child_units) if can_fulfill and child_units else 0
+        if remaining_needed > 0:
+            shortages.append((item_code, remaining_needed))
+        return 0
+
+    return recursive_calculate(finished_good_code, required_quantity), shortages, used_items
+
+
+def count_paths(tree, root):
+    """Number of root-to-node paths, i.e. the nodes a non-memoized walk visits."""
+    from fetch_data import topological_order
+    paths = {root: 1}
+    for item_code in topological_order(tree, root):
+        for child in tree.get(item_code, ()):
+            paths[child] = paths.get(child, 0) + paths.get(item_code, 0)
+    return sum(paths.values())
+
+
+def best_of(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    print(f"{'depth':>5} {'nodes':>8} {'edges':>8} {'paths':>14} {'solver ms':>10} {'us/node':>8} {'legacy ms':>10}")
+    for depth in (4, 5, 6, 7, 8, 9):
+        # No stock anywhere, so every MAKE item is expanded
+        fg_codes, rows = generate_catalog(finished_goods=1, depth=depth, fanout=8, reuse=0.5,
+                                          buy_share=0.1, stock_level=0.0, seed=1)
+        graph = BomGraph.from_rows(as_tuples(rows))
+        item_data, tree = graph.subtree(fg_codes[0])
+        nodes = len(item_data)
+        edges = sum(len(children) for children in tree.values())
+        paths = count_paths(tree, fg_codes[0])
+
+        solver = best_of(lambda: calculate_max_units(tree, item_data, fg_codes[0], 10))
+        legacy = "skipped"
+        if paths <= LEGACY_PATH_LIMIT:
+            legacy = f"{best_of(lambda: legacy_calculate_max_units(tree, item_data, fg_codes[0], 10), 1) * 1000:10.1f}"
+        print(f"{depth:>5} {nodes:>8} {edges:>8} {paths:>14} {solver * 1000:>10.2f} "
+              f"{solver / nodes * 1e6:>8.2f} {legacy:>10}")
+
+
+if __name__ == "__main__":
+    main()
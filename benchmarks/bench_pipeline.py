@@ -0,0 +1,282 @@
+"""
+Latency percentiles and memory of the craftability pipeline per stage:
+fetch_bom_data, build_bom_tree and calculate_max_units, over synthetic
+catalogs that vary depth, fan-out, subassembly reuse, MAKE/BUY mix and
+stock levels.
+
+With BENCH_DATABASE_URL the catalog is loaded into TEMP admin_parts and
+bom_exploded tables (shadowing the real ones for this session only) and
+fetch_bom_data runs as in production. Without it an in-memory SQLite
+admin_parts stands in, queried with the same recursive explosion as
+fetch_bom_data's fallback CTE, so only the fetch stage differs.
+
+Results are written as JSON (BENCH_OUTPUT, default
+benchmarks/results/pipeline-<commit>.json). Pass an earlier result file
+to print the change per stage:
+
+    python benchmarks/bench_pipeline.py
+    BENCH_DATABASE_URL=postgresql://localhost/postgres python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py benchmarks/results/pipeline-<old commit>.json
+"""
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units
+from synthetic_bom import generate_catalog
+
+REPEAT = int(os.getenv("BENCH_REPEAT", "50"))
+QUANTITY = 1
+
+# name -> generate_catalog arguments
+SCENARIOS = {
+    "baseline": dict(finished_goods=20, depth=4, fanout=4, reuse=0.5, buy_share=0.3, stock_level=1.0),
+    "deep": dict(finished_goods=10, depth=7, fanout=3, reuse=0.5, buy_share=0.3, stock_level=1.0),
+    "wide": dict(finished_goods=10, depth=3, fanout=16, reuse=0.5, buy_share=0.3, stock_level=1.0),
+    "no_reuse": dict(finished_goods=20, depth=4, fanout=4, reuse=0.0, buy_share=0.3, stock_level=1.0),
+    "heavy_reuse": dict(finished_goods=20, depth=5, fanout=6, reuse=0.9, buy_share=0.3, stock_level=1.0),
+    "buy_heavy": dict(finished_goods=20, depth=4, fanout=4, reuse=0.5, buy_share=0.8, stock_level=1.0),
+    "starved": dict(finished_goods=20, depth=4, fanout=4, reuse=0.5, buy_share=0.3, stock_level=0.0,
+                    make_stock_share=0.0),
+    "overstocked": dict(finished_goods=20, depth=4, fanout=4, reuse=0.5, buy_share=0.3, stock_level=50.0,
+                        make_stock_share=0.9),
+}
+
+PG_SCHEMA = """
+    CREATE TEMP TABLE admin_parts (
+        id serial PRIMARY KEY, bom_number integer, "Item_Level" integer, "Item_code" text,
+        description text DEFAULT '', "Type" text, "On_hand_Qty" double precision, "Extended_Quantity" double precision
+    );
+    CREATE INDEX ON admin_parts (bom_number);
+    CREATE TEMP TABLE bom_exploded (
+        fg_code text NOT NULL, seq integer NOT NULL, path_id integer, source_id integer NOT NULL,
+        code text NOT NULL, "Item_Level" integer, "Item_code" text, "Type" text,
+        "Extended_Quantity" double precision, cumulative_qty double precision, depth integer NOT NULL,
+        PRIMARY KEY (fg_code, seq)
+    );
+    CREATE INDEX ON bom_exploded (code);
+    CREATE INDEX ON bom_exploded ("Item_code");
+"""
+
+SQLITE_SCHEMA = """
+    CREATE TABLE admin_parts (
+        id INTEGER PRIMARY KEY, bom_number TEXT, "Item_Level" INTEGER, "Item_code" TEXT,
+        "Type" TEXT, "On_hand_Qty" REAL, "Extended_Quantity" REAL
+    );
+    CREATE INDEX admin_parts_bom_number ON admin_parts (bom_number);
+"""
+
+# fetch_bom_data's recursive CTE, with the path array as a delimited string
+SQLITE_BOM_QUERY = """
+    WITH RECURSIVE bom_tree AS (
+        SELECT bom_number AS "Code", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity",
+               ',' || bom_number || ',' AS path
+        FROM admin_parts
+        WHERE bom_number = ?
+
+        UNION ALL
+
+        SELECT b.bom_number, b."Item_Level", b."Item_code", b."Type", b."On_hand_Qty", b."Extended_Quantity",
+               bt.path || b.bom_number || ','
+        FROM admin_parts b
+        INNER JOIN bom_tree bt ON b.bom_number = bt."Item_code"
+        WHERE instr(bt.path, ',' || b.bom_number || ',') = 0
+    )
+    SELECT "Code", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity"
+    FROM bom_tree
+"""
+
+
+def as_insert_rows(rows):
+    return [(row["bom_number"], row["Item_Level"], row["Item_code"], row["Type"],
+             row["On_hand_Qty"], row["Extended_Quantity"]) for row in rows]
+
+
+class PostgresStandIn:
+    name = "postgres"
+
+    def __init__(self, dsn):
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+        self.connection = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+        with self.connection.cursor() as cursor:
+            cursor.execute(PG_SCHEMA)
+        self.connection.commit()
+
+    def load(self, rows):
+        from psycopg2.extras import execute_values
+        from bom_exploded import rebuild_all
+        with self.connection.cursor() as cursor:
+            cursor.execute("TRUNCATE admin_parts, bom_exploded")
+            execute_values(cursor, """
+                INSERT INTO admin_parts (bom_number, "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity")
+                VALUES %s
+            """, as_insert_rows(rows), page_size=5000)
+            rebuild_all(self.connection)
+            cursor.execute("ANALYZE admin_parts")
+            cursor.execute("ANALYZE bom_exploded")
+        self.connection.commit()
+
+    def fetch(self, fg_code):
+        bom_data = fetch_bom_data(self.connection, fg_code)
+        self.connection.rollback()
+        return bom_data
+
+    def close(self):
+        self.connection.close()
+
+
+class SqliteStandIn:
+    name = "sqlite"
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SQLITE_SCHEMA)
+
+    def load(self, rows):
+        self.connection.execute("DELETE FROM admin_parts")
+        self.connection.executemany("""
+            INSERT INTO admin_parts (bom_number, "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity")
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, as_insert_rows(rows))
+        self.connection.execute("ANALYZE")
+        self.connection.commit()
+
+    def fetch(self, fg_code):
+        return [dict(row) for row in self.connection.execute(SQLITE_BOM_QUERY, (fg_code,))]
+
+    def close(self):
+        self.connection.close()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(samples):
+    return {
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 4),
+        "p90_ms": round(percentile(samples, 0.90) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "max_ms": round(max(samples) * 1000, 4),
+    }
+
+
+def stages(source, fg_code):
+    """(name, fn) per pipeline stage; each takes the previous stage's output."""
+    return (
+        ("fetch_bom_data", lambda _: source.fetch(fg_code)),
+        ("build_bom_tree", lambda bom_data: build_bom_tree(bom_data, fg_code)),
+        ("calculate_max_units", lambda built: calculate_max_units(built[1], built[0], fg_code, QUANTITY)),
+    )
+
+
+def run_scenario(source, params):
+    fg_codes, rows = generate_catalog(seed=7, **params)
+    source.load(rows)
+
+    samples = {name: [] for name, _ in stages(source, fg_codes[0])}
+    peaks = {name: 0 for name in samples}
+    bom_rows = []
+
+    for i in range(REPEAT):
+        fg_code = fg_codes[i % len(fg_codes)]
+        value = None
+        for name, fn in stages(source, fg_code):
+            started = time.perf_counter()
+            value = fn(value)
+            samples[name].append(time.perf_counter() - started)
+            if name == "fetch_bom_data":
+                bom_rows.append(len(value))
+
+    # Memory is traced on a separate pass, since tracemalloc slows every allocation
+    for fg_code in fg_codes:
+        value = None
+        for name, fn in stages(source, fg_code):
+            tracemalloc.start()
+            value = fn(value)
+            peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+    return {
+        "params": params,
+        "catalog_rows": len(rows),
+        "bom_rows_p50": percentile(bom_rows, 0.5),
+        "stages": {
+            name: {**summarize(samples[name]), "peak_kib": round(peaks[name] / 1024, 1)}
+            for name in samples
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange in p50 against {baseline_path} ({baseline['commit']}, {baseline['backend']}):")
+    if baseline["backend"] != results["backend"]:
+        print(f"Warning: baseline ran on {baseline['backend']}, this run on {results['backend']}")
+    for scenario, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(scenario)
+        if not before:
+            continue
+        for stage, timings in result["stages"].items():
+            old = before["stages"].get(stage, {}).get("p50_ms")
+            if old:
+                change = (timings["p50_ms"] - old) / old * 100
+                print(f"{scenario:<12} {stage:<20} {old:>10.3f} -> {timings['p50_ms']:>10.3f} ms {change:>+7.1f}%")
+
+
+def main():
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    source = PostgresStandIn(dsn) if dsn else SqliteStandIn()
+    commit = git_commit()
+
+    results = {
+        "commit": commit,
+        "backend": source.name,
+        "repeat": REPEAT,
+        "python": platform.python_version(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "scenarios": {},
+    }
+    print(f"backend: {source.name}, {REPEAT} finished goods per scenario")
+    print(f"{'scenario':<12} {'stage':<20} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak KiB':>9}")
+    try:
+        for scenario, params in SCENARIOS.items():
+            result = results["scenarios"][scenario] = run_scenario(source, params)
+            for stage, timings in result["stages"].items():
+                print(f"{scenario:<12} {stage:<20} {timings['p50_ms']:>9.3f} {timings['p90_ms']:>9.3f} "
+                      f"{timings['p99_ms']:>9.3f} {timings['peak_kib']:>9.1f}")
+    finally:
+        source.close()
+
+    output = os.getenv("BENCH_OUTPUT") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if len(sys.argv) > 1:
+        compare(results, sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Randomised cross-check of fetch_data.max_buildable against a brute-force
+search on small BOMs, plus its timing against calculate_max_units on
+tree-shaped BOMs and on DAGs with shared subassemblies.
+
+The brute force is independent of the solver: it tries 0, 1, 2, ...
+units with a plain recursive simulation that draws every item from one
+shared stock pool and builds what is missing from its children, until a
+count cannot be built. BOMs are random trees and DAGs with shared
+subassemblies, fractional Extended_Quantity and stock at every level; all
+quantities are exact binary fractions, so the two sides see the same
+arithmetic. Exits non-zero on the first mismatch, printing the BOM.
+
+    python benchmarks/check_max_buildable.py
+    CHECK_CASES=20000 CHECK_SEED=7 python benchmarks/check_max_buildable.py
+"""
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bom_graph import BomGraph
+import fetch_data
+from fetch_data import calculate_max_units, max_buildable
+from synthetic_bom import generate_catalog, as_tuples
+
+CASES = int(os.getenv("CHECK_CASES", "5000"))
+SEED = int(os.getenv("CHECK_SEED", "0"))
+BRUTE_FORCE_LIMIT = 500
+
+
+def random_bom(rng):
+    """(item_data, tree, fg_code) for a random BOM of up to ~12 items."""
+    fg_code = "FG"
+    item_data = {fg_code: {"On_hand_Qty": 0, "Extended_Quantity": 1, "Type": "finished_good", "Item_Level": 0}}
+    tree = defaultdict(list)
+    levels = [[fg_code]]
+    for depth in range(1, rng.randint(1, 4) + 1):
+        level = []
+        for _ in range(rng.randint(1, 4)):
+            item_code = f"I{depth}_{len(level)}"
+            item_data[item_code] = {
+                "On_hand_Qty": rng.choice([0, 0, 1, 2, 3, 5, 8, 13, 2.5, 0.75]),
+                "Extended_Quantity": rng.choice([1, 1, 2, 3, 0.5, 0.25, 1.5]),
+                "Item_Level": depth,
+            }
+            level.append(item_code)
+            tree[rng.choice(levels[-1])].append(item_code)
+        # Shared subassemblies: extra edges from other parents one level up
+        for item_code in level:
+            for parent in levels[-1]:
+                if item_code not in tree[parent] and rng.random() < 0.2:
+                    tree[parent].append(item_code)
+        levels.append(level)
+    return item_data, tree, fg_code
+
+
+def can_build(tree, item_data, fg_code, units):
+    """Whether `units` of `fg_code` can be drawn from stock, building shortfalls from children."""
+    stock = {item_code: float(item["On_hand_Qty"] or 0) for item_code, item in item_data.items()}
+
+    def draw(item_code, needed):
+        item = item_data.get(item_code)
+        if item is None:
+            return False
+        taken = min(needed, stock[item_code])
+        stock[item_code] -= taken
+        missing = needed - taken
+        if missing <= 0:
+            return True
+        if item.get("Make/Buy", "make").lower() == "buy" or not tree.get(item_code):
+            return False
+        built = True
+        for child in tree[item_code]:
+            built = draw(child, missing * float(item_data[child]["Extended_Quantity"])) and built
+        return built
+
+    return draw(fg_code, units)
+
+
+def brute_force(tree, item_data, fg_code):
+    units = 0
+    while units < BRUTE_FORCE_LIMIT and can_build(tree, item_data, fg_code, units + 1):
+        units += 1
+    return units
+
+
+def check(cases):
+    rng = random.Random(SEED)
+    for case in range(cases):
+        item_data, tree, fg_code = random_bom(rng)
+        expected = brute_force(tree, item_data, fg_code)
+        if expected >= BRUTE_FORCE_LIMIT:
+            continue
+        actual, shortages = max_buildable(tree, item_data, fg_code)
+        if actual != expected or not shortages:
+            print(f"Mismatch in case {case}: max_buildable={actual} brute force={expected} shortages={shortages}")
+            print(f"tree={dict(tree)}")
+            print(f"item_data={item_data}")
+            sys.exit(1)
+    print(f"{cases} random BOMs: max_buildable matches brute force")
+
+
+def timing():
+    """
+    max_buildable against one calculate_max_units run, on tree-shaped BOMs
+    (reuse=0) and on DAGs with shared subassemblies (reuse=0.5). Trees take
+    the capacity pass and two netting runs: at the bound, and one unit
+    above it for the shortages. DAGs whose bound is too high also binary
+    search below it, about log2(bound) netting runs more. `passes` counts
+    the netting runs.
+    """
+    feasible = fetch_data._feasible
+    passes = [0]
+
+    def counted(*args):
+        passes[0] += 1
+        return feasible(*args)
+
+    fetch_data._feasible = counted
+    print(f"\n{'shape':>5} {'depth':>5} {'nodes':>7} {'passes':>6} {'max_buildable ms':>17} "
+          f"{'us/node':>8} {'calculate_max_units ms':>23} {'units':>6}")
+    try:
+        for shape, reuse in (("tree", 0.0), ("dag", 0.5)):
+            for depth in (3, 4, 5, 6):
+                fg_codes, rows = generate_catalog(finished_goods=1, depth=depth, fanout=6, reuse=reuse,
+                                                  stock_level=200.0, make_stock_share=0.5, seed=depth)
+                item_data, tree = BomGraph.from_rows(as_tuples(rows)).subtree(fg_codes[0])
+                passes[0] = 1
+                started = time.perf_counter()
+                units, _ = max_buildable(tree, item_data, fg_codes[0])
+                exact = time.perf_counter() - started
+                started = time.perf_counter()
+                calculate_max_units(tree, item_data, fg_codes[0], 1)
+                single = time.perf_counter() - started
+                print(f"{shape:>5} {depth:>5} {len(item_data):>7} {passes[0]:>6} {exact * 1000:>17.2f} "
+                      f"{exact * 1e6 / len(item_data):>8.1f} {single * 1000:>23.2f} {units:>6}")
+    finally:
+        fetch_data._feasible = feasible
+
+
+if __name__ == "__main__":
+    check(CASES)
+    timing()
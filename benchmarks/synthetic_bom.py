@@ -0,0 +1,94 @@
+"""
+Synthetic admin_parts catalogs for the benchmarks.
+
+Every MAKE item is its own BOM (numeric code, level-1 rows for its direct
+children), which is how fetch_bom_data's recursive CTE expects sub-BOMs to
+be stored, so the number of rows grows with the number of edges rather
+than the number of root-to-leaf paths.
+"""
+import random
+
+
+def generate_catalog(finished_goods=10, depth=4, fanout=4, reuse=0.5, buy_share=0.3,
+                     stock_level=1.0, make_stock_share=0.2, seed=0):
+    """
+    Returns admin_parts rows as dicts.
+
+    finished_goods  number of top-level BOMs
+    depth           levels below each finished good
+    fanout          children per MAKE item
+    reuse           probability a child is an existing item of that level
+                    instead of a new one (shared subassemblies)
+    buy_share       probability a non-leaf child is a BUY part
+    stock_level     scales on-hand quantities; ~1.0 covers a few units
+    make_stock_share
+                    probability a MAKE item has finished subassemblies in
+                    stock, which lets the solver prune below it
+    """
+    rng = random.Random(seed)
+    rows = []
+    next_code = [100000000]
+    levels = [[] for _ in range(depth + 1)]  # existing item codes per level
+    defined = set()
+    buy_count = [0]
+
+    def new_make():
+        next_code[0] += 1
+        return str(next_code[0])
+
+    def new_buy():
+        buy_count[0] += 1
+        return f"BUY{buy_count[0]:07d}"
+
+    def stock(is_buy):
+        if is_buy:
+            return round(rng.uniform(0, 20) * stock_level, 3)
+        return float(rng.randint(0, 2)) if rng.random() < make_stock_share else 0.0
+
+    def define(code, level):
+        pending = [(code, level)]
+        while pending:
+            parent, parent_level = pending.pop()
+            if parent in defined:
+                continue
+            defined.add(parent)
+            child_level = parent_level + 1
+            for _ in range(fanout):
+                is_buy = child_level == depth or rng.random() < buy_share
+                pool = levels[child_level]
+                if pool and rng.random() < reuse:
+                    child = rng.choice(pool)
+                    is_buy = not child.isdigit()
+                else:
+                    child = new_buy() if is_buy else new_make()
+                    pool.append(child)
+                rows.append({
+                    "bom_number": parent,
+                    "Item_Level": 1,
+                    "Item_code": child,
+                    "Type": "BUY" if is_buy else "MAKE",
+                    "On_hand_Qty": stock(is_buy),
+                    "Extended_Quantity": rng.choice([1, 1, 1, 2, 0.5, 0.25]),
+                })
+                if not is_buy:
+                    pending.append((child, child_level))
+
+    fg_codes = []
+    for _ in range(finished_goods):
+        fg = new_make()
+        fg_codes.append(fg)
+        define(fg, 0)
+
+    return fg_codes, rows
+
+
+def as_tuples(rows):
+    """Rows in the column order BomGraph.from_rows expects, grouped by bom_number."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row["bom_number"], []).append(row)
+    return [
+        (row["bom_number"], row["Item_Level"], row["Item_code"], row["Type"],
+         row["On_hand_Qty"], row["Extended_Quantity"])
+        for bom_rows in grouped.values() for row in bom_rows
+    ]
@@ -0,0 +1,137 @@
+"""
+Materialized, flattened BOMs in the bom_exploded table (migrations/003).
+
+Each finished good (every bom_number) has one row per admin_parts row its
+recursive explosion reaches, in the order fetch_bom_data returns them, with
+the cumulative Extended_Quantity along the sub-BOM path. The table only
+holds structure; fetch_bom_data joins the live On_hand_Qty back in through
+source_id. Structure edits call refresh_exploded() for the BOMs they touched.
+
+    python bom_exploded.py      # full rebuild, e.g. after the migration or bulk SQL edits
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Explosion of the given finished goods, numbered in output order: by depth,
+# then admin_parts id, which is the order the recursive CTE in
+# fetch_bom_data yields (build_bom_tree depends on it). The ANY(path) cycle
+# check lives here, paid once per structure change instead of on every read.
+EXPLODE_QUERY = """
+    WITH RECURSIVE tree AS (
+        SELECT
+            a."bom_number"::text AS fg_code,
+            a.id AS source_id,
+            a."bom_number"::text AS code,
+            a."Item_code" AS item_code,
+            0 AS depth,
+            a."Extended_Quantity"::float8 AS cumulative_qty,
+            ARRAY[a."bom_number"::text] AS path,
+            ARRAY[a.id] AS sort_key
+        FROM "admin_parts" a
+        WHERE a."bom_number"::text = ANY(%(fg_codes)s)
+
+        UNION ALL
+
+        SELECT
+            t.fg_code,
+            b.id,
+            b."bom_number"::text,
+            b."Item_code",
+            t.depth + 1,
+            t.cumulative_qty * b."Extended_Quantity",
+            t.path || b."bom_number"::text,
+            t.sort_key || b.id
+        FROM "admin_parts" b
+        INNER JOIN tree t ON b."bom_number"::text = t.item_code
+        WHERE NOT b."bom_number"::text = ANY(t.path)
+    ), numbered AS (
+        SELECT tree.*, row_number() OVER (PARTITION BY fg_code ORDER BY depth, source_id, sort_key) AS seq
+        FROM tree
+    )
+    INSERT INTO bom_exploded (
+        fg_code, seq, path_id, source_id, code, "Item_Level", "Item_code", "Type",
+        "Extended_Quantity", cumulative_qty, depth
+    )
+    SELECT n.fg_code, n.seq, parent.seq, n.source_id, n.code, a."Item_Level", a."Item_code", a."Type",
+           a."Extended_Quantity", n.cumulative_qty, n.depth
+    FROM numbered n
+    JOIN "admin_parts" a ON a.id = n.source_id
+    LEFT JOIN numbered parent
+        ON parent.fg_code = n.fg_code AND parent.sort_key = n.sort_key[1:n.depth]
+"""
+
+# Finished goods whose explosion goes through any of the given BOMs, or
+# names one of them as an item (a new sub-BOM it now has to expand)
+AFFECTED_QUERY = """
+    SELECT DISTINCT fg_code FROM bom_exploded
+    WHERE code = ANY(%(codes)s) OR "Item_code" = ANY(%(codes)s)
+"""
+
+_available = {}
+_available_lock = threading.Lock()
+
+
+def exploded_table_ready(connection):
+    """Whether the bom_exploded table exists; checked once per process."""
+    with _available_lock:
+        if "ready" not in _available:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass('bom_exploded') IS NOT NULL AS ready")
+                row = cursor.fetchone()
+            _available["ready"] = bool(row["ready"] if isinstance(row, dict) else row[0])
+        return _available["ready"]
+
+
+def rebuild_exploded(connection, fg_codes):
+    """
+    Re-explodes `fg_codes` into bom_exploded, replacing their rows.
+    Returns the number of rows written. Does not commit.
+    """
+    fg_codes = sorted({str(code) for code in fg_codes})
+    if not fg_codes:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM bom_exploded WHERE fg_code = ANY(%s)", (fg_codes,))
+        cursor.execute(EXPLODE_QUERY, {"fg_codes": fg_codes})
+        return cursor.rowcount
+
+
+def refresh_exploded(connection, bom_numbers):
+    """
+    Brings bom_exploded up to date after the rows of `bom_numbers` changed:
+    those BOMs and every finished good that uses them are re-exploded.
+    No-op when the table hasn't been created. Does not commit.
+    """
+    if not exploded_table_ready(connection):
+        return 0
+    codes = sorted({str(code) for code in bom_numbers})
+    if not codes:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(AFFECTED_QUERY, {"codes": codes})
+        affected = {row["fg_code"] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+    return rebuild_exploded(connection, affected | set(codes))
+
+
+def rebuild_all(connection):
+    """Re-explodes every BOM in admin_parts. Does not commit."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT DISTINCT "bom_number"::text AS fg_code FROM "admin_parts"')
+        fg_codes = [row["fg_code"] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+        cursor.execute("TRUNCATE bom_exploded")
+    return rebuild_exploded(connection, fg_codes)
+
+
+if __name__ == "__main__":
+    from db_connection import connect_to_database
+
+    logging.basicConfig(level=logging.INFO)
+    connection = connect_to_database()
+    started = time.perf_counter()
+    rows = rebuild_all(connection)
+    connection.commit()
+    connection.close()
+    logger.info("Rebuilt bom_exploded: %d rows in %.1fs", rows, time.perf_counter() - started)
@@ -0,0 +1,509 @@
+import sys
+import threading
+from array import array
+from collections import defaultdict
+import numpy as np
+from psycopg2 import extensions
+
+# type_ids sentinels: code only seen as a bom_number / item row without a Type
+NOT_AN_ITEM = -2
+NO_TYPE = -1
+
+class BomGraph:
+    """
+    Whole-catalog BOM structure held in memory.
+
+    Item codes are interned to integer ids and parent -> child edges are
+    stored CSR-style: the children of node `i` are
+    `child_ids[offsets[i]:offsets[i + 1]]` with the matching per-parent
+    quantities in `quantities`, summed when a BOM lists the same part
+    under a parent more than once (`edge_rows` counts those rows).
+    Per-node attributes (stock, type, level, Extended_Quantity) are kept
+    in parallel arrays and hold the last admin_parts row seen for that item
+    anywhere in the catalog. They are not per-edge values: the quantity a
+    particular parent uses is the edge's entry in `quantities`.
+    """
+
+    def __init__(self, codes, offsets, child_ids, quantities, edge_rows, on_hand, ext_qty, levels, type_ids,
+                 type_names, fg_ids):
+        self.codes = codes
+        self.index = {code: i for i, code in enumerate(codes)}
+        self.offsets = offsets
+        self.child_ids = child_ids
+        self.quantities = quantities
+        self.edge_rows = edge_rows
+        self.on_hand = on_hand
+        self.ext_qty = ext_qty
+        self.levels = levels
+        self.type_ids = type_ids
+        self.type_names = type_names
+        self.fg_ids = fg_ids
+        self._requirements = None
+        self._reverse = None
+        self._fg_rows = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the graph from (bom_number, Item_Level, Item_code, Type,
+        On_hand_Qty, Extended_Quantity) tuples, grouped by bom_number and in
+        admin_parts row order within each group.
+
+        A parent -> child edge repeated within one BOM adds up its rows'
+        quantities, as build_bom_tree does; the same edge in another BOM's
+        rows describes the same subassembly and is kept from the first.
+        """
+        codes = []
+        index = {}
+        on_hand = array("d")
+        ext_qty = array("d")
+        levels = array("i")
+        type_ids = array("i")  # Type is free text, so there can be many distinct values
+        type_names = []
+        type_index = {}
+        fg_ids = array("l")
+        fg_seen = set()
+
+        def intern(code):
+            node = index.get(code)
+            if node is None:
+                node = index[code] = len(codes)
+                codes.append(code)
+                on_hand.append(0.0)
+                ext_qty.append(1.0)
+                levels.append(0)
+                type_ids.append(NOT_AN_ITEM)
+            return node
+
+        parents = array("l")
+        children = array("l")
+        edge_qty = array("d")
+        edge_count = array("i")
+        edge_pos = {}       # (parent << 32 | child) -> position in the COO arrays
+        bom_edges = set()   # edges added by the current bom_number group
+
+        current_bom = None
+        fg_node = None
+        parent_stack = []
+
+        for bom_number, item_level, item_code, item_type, on_hand_qty, extended_qty in rows:
+            bom_code = str(bom_number)
+            if bom_code != current_bom:
+                current_bom = bom_code
+                fg_node = intern(bom_code)
+                if fg_node not in fg_seen:
+                    fg_seen.add(fg_node)
+                    fg_ids.append(fg_node)
+                parent_stack = []
+                bom_edges = set()
+
+            node = intern(str(item_code))
+            level = int(item_level or 0)
+            on_hand[node] = float(on_hand_qty or 0)
+            ext_qty[node] = float(extended_qty if extended_qty is not None else 1)
+            levels[node] = level
+            type_ids[node] = NO_TYPE
+            if item_type is not None:
+                type_id = type_index.get(item_type)
+                if type_id is None:
+                    type_id = type_index[item_type] = len(type_names)
+                    type_names.append(item_type)
+                type_ids[node] = type_id
+
+            if node == fg_node:
+                continue
+
+            while parent_stack and parent_stack[-1][1] >= level:
+                parent_stack.pop()
+            parent = parent_stack[-1][0] if parent_stack else fg_node
+            parent_stack.append((node, level))
+
+            if parent == node:
+                continue
+            key = (parent << 32) | node
+            pos = edge_pos.get(key)
+            if pos is None:
+                edge_pos[key] = len(edge_qty)
+                bom_edges.add(key)
+                parents.append(parent)
+                children.append(node)
+                edge_qty.append(ext_qty[node])
+                edge_count.append(1)
+            elif key in bom_edges:
+                edge_qty[pos] += ext_qty[node]
+                edge_count[pos] += 1
+
+        del edge_pos, bom_edges
+
+        # Counting sort of the COO edge list into CSR form
+        node_count = len(codes)
+        offsets = array("l", [0]) * (node_count + 1)
+        for parent in parents:
+            offsets[parent + 1] += 1
+        for i in range(node_count):
+            offsets[i + 1] += offsets[i]
+
+        cursor_pos = array("l", offsets[:-1]) if node_count else array("l")
+        child_ids = array("l", [0]) * len(children)
+        quantities = array("d", [0.0]) * len(children)
+        edge_rows = array("i", [0]) * len(children)
+        for parent, child, qty, count in zip(parents, children, edge_qty, edge_count):
+            pos = cursor_pos[parent]
+            child_ids[pos] = child
+            quantities[pos] = qty
+            edge_rows[pos] = count
+            cursor_pos[parent] = pos + 1
+
+        return cls(codes, offsets, child_ids, quantities, edge_rows, on_hand, ext_qty, levels, type_ids,
+                   type_names, fg_ids)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def edge_count(self):
+        return len(self.child_ids)
+
+    def node_id(self, code):
+        return self.index.get(str(code))
+
+    def children_of(self, node):
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return self.child_ids[start:end], self.quantities[start:end]
+
+    def item_type(self, node):
+        type_id = self.type_ids[node]
+        return self.type_names[type_id] if type_id >= 0 else None
+
+    def topological_order(self, root):
+        """
+        Nodes reachable from `root`, parents before children.
+        Edges that would close a cycle are ignored.
+        """
+        return self._topological(root, self.offsets, self.child_ids)
+
+    @staticmethod
+    def _topological(root, offsets, targets):
+        visited = {root}
+        postorder = []
+        stack = [(root, offsets[root])]
+
+        while stack:
+            node, pos = stack[-1]
+            if pos < offsets[node + 1]:
+                stack[-1] = (node, pos + 1)
+                child = targets[pos]
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, offsets[child]))
+            else:
+                stack.pop()
+                postorder.append(node)
+
+        postorder.reverse()
+        return postorder
+
+    def _reverse_edges(self):
+        """
+        Child -> parent edges in CSR form, built on first use: the parents of
+        node `i` are `parent_ids[parent_offsets[i]:parent_offsets[i + 1]]`
+        and `edge_pos` maps each back to its position in child_ids.
+        """
+        if self._reverse is None:
+            node_count = len(self.codes)
+            offsets = np.frombuffer(self.offsets, dtype=np.dtype(self.offsets.typecode)).astype(np.int64)
+            child_ids = np.frombuffer(self.child_ids, dtype=np.dtype(self.child_ids.typecode)).astype(np.int64)
+            parents = np.repeat(np.arange(node_count, dtype=np.int64), np.diff(offsets))
+            edge_pos = np.argsort(child_ids, kind="stable")
+            parent_offsets = np.zeros(node_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(child_ids, minlength=node_count), out=parent_offsets[1:])
+            self._reverse = (parent_offsets, parents[edge_pos], edge_pos)
+        return self._reverse
+
+    def parents_of(self, node):
+        """Direct parents of `node` with the quantity each uses per unit."""
+        parent_offsets, parent_ids, edge_pos = self._reverse_edges()
+        start, end = parent_offsets[node], parent_offsets[node + 1]
+        return parent_ids[start:end].tolist(), [self.quantities[pos] for pos in edge_pos[start:end].tolist()]
+
+    def where_used_ids(self, node):
+        """
+        Every assembly that consumes `node` directly or through
+        subassemblies, as {ancestor id: quantity of `node` per unit of it}.
+        """
+        parent_offsets, parent_ids, edge_pos = self._reverse_edges()
+        order = self._topological(node, parent_offsets, parent_ids)
+        order_pos = {ancestor: i for i, ancestor in enumerate(order)}
+        quantities = self.quantities
+
+        per_unit = {node: 1.0}
+        for current in order:
+            current_qty = per_unit.get(current, 0.0)
+            for pos in range(parent_offsets[current], parent_offsets[current + 1]):
+                parent = int(parent_ids[pos])
+                if self._is_back_edge(order_pos, current, parent):
+                    continue
+                per_unit[parent] = per_unit.get(parent, 0.0) + current_qty * quantities[int(edge_pos[pos])]
+
+        del per_unit[node]
+        return per_unit
+
+    def where_used(self, item_code):
+        """
+        Reverse lookup for one item code: its direct parents, and every
+        subassembly and top-level finished good that needs it, with the
+        cumulative quantity per unit. None for unknown codes.
+        """
+        node = self.node_id(item_code)
+        if node is None:
+            return None
+        codes = self.codes
+        parent_offsets = self._reverse_edges()[0]
+
+        parents, quantities = self.parents_of(node)
+        assemblies, finished_goods = [], []
+        for ancestor, qty in sorted(self.where_used_ids(node).items(), key=lambda entry: codes[entry[0]]):
+            entry = {"item_code": codes[ancestor], "quantity_per_unit": qty}
+            if parent_offsets[ancestor] == parent_offsets[ancestor + 1]:
+                finished_goods.append(entry)
+            else:
+                assemblies.append(entry)
+
+        return {
+            "item_code": codes[node],
+            "used_in": [{"item_code": codes[parent], "quantity": qty} for parent, qty in zip(parents, quantities)],
+            "assemblies": assemblies,
+            "finished_goods": finished_goods,
+        }
+
+    def _fg_row_index(self):
+        if self._fg_rows is None:
+            self._fg_rows = {fg: row for row, fg in enumerate(self.fg_ids)}
+        return self._fg_rows
+
+    def fg_row(self, finished_good_code):
+        """Row of fg_ids (and of requirements_matrix) for a finished good, or None."""
+        node = self.node_id(finished_good_code)
+        return None if node is None else self._fg_row_index().get(node)
+
+    def affected_fg_rows(self, item_codes):
+        """
+        Rows of fg_ids (and of requirements_matrix) whose BOM contains any
+        of `item_codes`, or is one of them: the finished goods whose
+        craftability can change when those items' stock changes.
+        """
+        fg_rows = self._fg_row_index()
+        parent_offsets, parent_ids, _ = self._reverse_edges()
+
+        # One walk up from all changed items together, so shared ancestors are visited once
+        pending = [node for node in map(self.node_id, item_codes) if node is not None]
+        seen = set(pending)
+        while pending:
+            node = pending.pop()
+            for parent in parent_ids[parent_offsets[node]:parent_offsets[node + 1]].tolist():
+                if parent not in seen:
+                    seen.add(parent)
+                    pending.append(parent)
+        return sorted(fg_rows[node] for node in seen if node in fg_rows)
+
+    def _is_back_edge(self, order_pos, parent, child):
+        return order_pos[child] <= order_pos[parent]
+
+    def explode_ids(self, root, leaves_only=False):
+        """
+        Cumulative quantity of every descendant per unit of `root`, keyed by
+        node id. Quantities along a path are multiplied and summed across
+        paths, so shared subassemblies are walked once.
+        """
+        order = self.topological_order(root)
+        order_pos = {node: i for i, node in enumerate(order)}
+        offsets, child_ids, quantities = self.offsets, self.child_ids, self.quantities
+
+        totals = {root: 1.0}
+        for node in order:
+            node_total = totals.get(node, 0.0)
+            for pos in range(offsets[node], offsets[node + 1]):
+                child = child_ids[pos]
+                if self._is_back_edge(order_pos, node, child):
+                    continue
+                totals[child] = totals.get(child, 0.0) + node_total * quantities[pos]
+
+        del totals[root]
+        if leaves_only:
+            return {node: qty for node, qty in totals.items() if offsets[node] == offsets[node + 1]}
+        return totals
+
+    def explode(self, finished_good_code, leaves_only=False):
+        """
+        Flattened requirements of a finished good as {item_code: qty per unit}.
+        Returns an empty dict for unknown codes.
+        """
+        root = self.node_id(finished_good_code)
+        if root is None:
+            return {}
+        codes = self.codes
+        return {codes[node]: qty for node, qty in self.explode_ids(root, leaves_only).items()}
+
+    def subtree(self, finished_good_code):
+        """
+        Returns (item_data, tree) for one finished good in the same shape as
+        fetch_data.build_bom_tree, built without touching the database.
+
+        Extended_Quantity comes from the edge each item is used on, so a
+        part with different quantities in different BOMs gets this BOM's
+        quantity. Like build_bom_tree, item_data holds one quantity per item
+        code, so within one BOM an item used under several parents keeps
+        the last one visited.
+        """
+        fg_code = str(finished_good_code)
+        root = self.node_id(fg_code)
+        tree = defaultdict(list)
+        item_data = {}
+        if root is None:
+            return item_data, tree
+
+        codes = self.codes
+        order = self.topological_order(root)
+        order_pos = {node: i for i, node in enumerate(order)}
+        depth = {root: 0}
+        edge_qty = {root: self.ext_qty[root]}  # node -> quantity per unit of its parent
+        for node in order:
+            code = codes[node]
+            item_data[code] = {
+                "Code": fg_code,
+                "Item_Level": depth[node],
+                "Item_code": code,
+                "Type": self.item_type(node),
+                "On_hand_Qty": self.on_hand[node],
+                "Extended_Quantity": edge_qty[node],
+            }
+            for pos in range(self.offsets[node], self.offsets[node + 1]):
+                child = self.child_ids[pos]
+                if self._is_back_edge(order_pos, node, child):
+                    continue
+                # One entry per admin_parts row, like build_bom_tree
+                tree[code].extend([codes[child]] * self.edge_rows[pos])
+                edge_qty[child] = self.quantities[pos] / self.edge_rows[pos]
+                depth[child] = max(depth.get(child, 0), depth[node] + 1)
+
+        root_item = item_data[fg_code]
+        if self.type_ids[root] == NOT_AN_ITEM:
+            # Same default build_bom_tree uses when the FG has no row of its own
+            root_item.update({"On_hand_Qty": 0, "Extended_Quantity": 1, "Type": "finished_good"})
+        return item_data, tree
+
+    def requirements_matrix(self):
+        """
+        Exploded leaf requirements of every finished good as a sparse
+        (finished goods x items) matrix in CSR form: row `r` (fg_ids[r]) needs
+        `quantities[row_ptr[r]:row_ptr[r + 1]]` of the items with those node
+        ids in `item_ids`. Built once per graph.
+        """
+        if self._requirements is None:
+            row_ptr = np.zeros(len(self.fg_ids) + 1, dtype=np.int64)
+            item_ids = array("l")
+            quantities = array("d")
+            for row, fg in enumerate(self.fg_ids):
+                for node, qty in self.explode_ids(fg, leaves_only=True).items():
+                    if qty > 0:
+                        item_ids.append(node)
+                        quantities.append(qty)
+                row_ptr[row + 1] = len(item_ids)
+            self._requirements = (
+                row_ptr,
+                np.frombuffer(item_ids, dtype=np.dtype(item_ids.typecode)).astype(np.int64),
+                np.frombuffer(quantities, dtype=np.float64).copy(),
+            )
+        return self._requirements
+
+    def stock_vector(self, rows=None):
+        """
+        On-hand quantity per node id as a NumPy array. Without `rows` the
+        graph's own snapshot is used; otherwise (Item_code, On_hand_Qty) rows
+        are applied on top of it, later rows winning.
+        """
+        stock = np.frombuffer(self.on_hand, dtype=np.float64).copy()
+        if rows is not None:
+            index = self.index
+            for item_code, on_hand_qty in rows:
+                node = index.get(str(item_code))
+                if node is not None:
+                    stock[node] = float(on_hand_qty or 0)
+        return stock
+
+    def update_stock(self, rows):
+        """Refreshes On_hand_Qty from (Item_code, On_hand_Qty) rows."""
+        index, on_hand = self.index, self.on_hand
+        for item_code, on_hand_qty in rows:
+            node = index.get(str(item_code))
+            if node is not None:
+                on_hand[node] = float(on_hand_qty or 0)
+
+    def memory_usage(self):
+        """Approximate bytes held by the graph (arrays, codes and index)."""
+        arrays = (self.offsets, self.child_ids, self.quantities, self.edge_rows, self.on_hand,
+                  self.ext_qty, self.levels, self.type_ids, self.fg_ids)
+        total = sum(a.itemsize * len(a) for a in arrays)
+        total += sys.getsizeof(self.codes) + sum(sys.getsizeof(code) for code in self.codes)
+        total += sys.getsizeof(self.index)
+        if self._requirements is not None:
+            total += sum(a.nbytes for a in self._requirements)
+        if self._reverse is not None:
+            total += sum(a.nbytes for a in self._reverse)
+        return total
+
+
+BOM_GRAPH_QUERY = """
+    SELECT "bom_number", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity"
+    FROM "admin_parts"
+    ORDER BY "bom_number", id
+"""
+
+STOCK_QUERY = """
+    SELECT "Item_code", "On_hand_Qty"
+    FROM "admin_parts"
+    ORDER BY id
+"""
+
+
+def load_bom_graph(connection, itersize=20000):
+    """
+    Loads the whole admin_parts structure in one pass through a server-side
+    cursor, so rows are never materialised as dicts.
+    """
+    with connection.cursor(name="bom_graph_load", cursor_factory=extensions.cursor) as cursor:
+        cursor.itersize = itersize
+        cursor.execute(BOM_GRAPH_QUERY)
+        graph = BomGraph.from_rows(cursor)
+    connection.rollback()
+    return graph
+
+
+def fetch_stock_vector(connection, graph):
+    """Current on-hand quantities for every node of `graph`, read in one query."""
+    with connection.cursor(cursor_factory=extensions.cursor) as cursor:
+        cursor.execute(STOCK_QUERY)
+        return graph.stock_vector(cursor)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_bom_graph(connection):
+    """Returns the process-wide graph, loading it on first use."""
+    global _graph
+    graph = _graph
+    if graph is not None:
+        return graph
+    with _graph_lock:
+        if _graph is None:
+            _graph = load_bom_graph(connection)
+        return _graph
+
+
+def invalidate_bom_graph():
+    """Drops the cached graph; the next get_bom_graph() call reloads it."""
+    global _graph
+    with _graph_lock:
+        _graph = None
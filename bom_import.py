@@ -0,0 +1,231 @@
+import io
+import csv
+import time
+import openpyxl
+
+# Canonical column -> header text in the uploaded workbook (matched case- and space-insensitively)
+IMPORT_COLUMNS = {
+    "code": "Code",
+    "level": "Level",
+    "item_code": "Item Code",
+    "extended_quantity": "Extended Quantity",
+}
+# Rows scanned for the header before giving up; exported sheets often start with a title block
+HEADER_SEARCH_ROWS = 20
+MAX_REPORTED_ERRORS = 1000
+
+STAGING_TABLE = """
+    CREATE TEMP TABLE admin_parts_import (
+        seq integer,
+        bom_number integer,
+        "Item_Level" integer,
+        "Item_code" text,
+        "Type" text,
+        "Extended_Quantity" double precision
+    ) ON COMMIT DROP
+"""
+
+MERGE_QUERY = """
+    WITH existing AS (
+        SELECT DISTINCT ON ("Item_code") "Item_code", "On_hand_Qty", description
+        FROM admin_parts
+        WHERE "Item_code" IN (SELECT "Item_code" FROM admin_parts_import)
+        ORDER BY "Item_code", id DESC
+    ), removed AS (
+        DELETE FROM admin_parts
+        WHERE bom_number IN (SELECT bom_number FROM admin_parts_import)
+        RETURNING id
+    ), inserted AS (
+        INSERT INTO admin_parts (
+            bom_number, "Item_code", "Item_Level", description, "Type",
+            "On_hand_Qty", "Extended_Quantity", is_active, created_date, created_by
+        )
+        SELECT s.bom_number, s."Item_code", s."Item_Level", COALESCE(e.description, ''),
+               CASE WHEN s."Type" = 'MAKE' OR EXISTS (
+                        SELECT 1 FROM admin_parts p WHERE p.bom_number::text = s."Item_code"
+                    ) THEN 'MAKE' ELSE 'BUY' END,
+               COALESCE(e."On_hand_Qty", 0), s."Extended_Quantity", TRUE, CURRENT_DATE, %s
+        FROM admin_parts_import s
+        LEFT JOIN existing e ON e."Item_code" = s."Item_code"
+        ORDER BY s.seq
+        RETURNING id
+    )
+    SELECT (SELECT COUNT(*) FROM removed) AS removed, (SELECT COUNT(*) FROM inserted) AS inserted
+"""
+
+
+class ImportResult:
+    """Outcome of parsing an uploaded BOM workbook."""
+
+    def __init__(self):
+        self.rows = []          # (seq, bom_number, level, item_code, type, extended_quantity)
+        self.errors = []        # {"row": sheet row number, "error": message}
+        self.error_count = 0
+        self.rejected_boms = set()
+        self.skipped_rows = 0
+
+    def add_error(self, row_number, message, bom_number=None):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+        if bom_number is not None:
+            self.rejected_boms.add(bom_number)
+
+    def valid_rows(self):
+        """Rows of the BOMs that had no errors."""
+        return [row for row in self.rows if row[1] not in self.rejected_boms]
+
+
+def _normalise_header(value):
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def _clean_code(value):
+    """Item and BOM codes as text; Excel hands numeric codes back as floats."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _find_header(rows):
+    wanted = {_normalise_header(header): key for key, header in IMPORT_COLUMNS.items()}
+    for row_number, values in rows:
+        positions = {}
+        for position, value in enumerate(values):
+            key = wanted.get(_normalise_header(value))
+            if key and key not in positions:
+                positions[key] = position
+        if len(positions) == len(IMPORT_COLUMNS):
+            return row_number, positions
+        if row_number >= HEADER_SEARCH_ROWS:
+            break
+    return None, None
+
+
+def parse_bom_workbook(fileobj, sheet_name=None):
+    """
+    Streams the workbook in read-only mode and extracts the Code, Level,
+    Item Code and Extended Quantity columns, validating as it goes.
+
+    Every BOM (Code) must be one contiguous block of rows whose levels start
+    at 1 and go at most one level deeper from one row to the next. A level 0
+    row naming the BOM itself is the root line and is skipped. Items with
+    children in the file are typed MAKE, the rest BUY. A BOM with any
+    invalid row is rejected as a whole so no half-imported structure is
+    left behind.
+    """
+    result = ImportResult()
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.active
+        rows = enumerate(worksheet.iter_rows(values_only=True), start=1)
+
+        header_row, positions = _find_header(rows)
+        if header_row is None:
+            result.add_error(0, "Header row with columns " + ", ".join(IMPORT_COLUMNS.values()) + " not found")
+            return result
+
+        seen_boms = set()
+        current_bom = None
+        previous_level = 0
+        for row_number, values in rows:
+            cells = {key: values[position] if position < len(values) else None
+                     for key, position in positions.items()}
+            code, item_code = _clean_code(cells["code"]), _clean_code(cells["item_code"])
+            level, quantity = cells["level"], cells["extended_quantity"]
+            if not code and not item_code and level is None and quantity is None:
+                result.skipped_rows += 1
+                continue
+
+            try:
+                bom_number = int(code)
+            except ValueError:
+                result.add_error(row_number, f"Code must be an integer BOM number, got {code!r}")
+                continue
+
+            if bom_number != current_bom:
+                if bom_number in seen_boms:
+                    result.add_error(row_number, f"Rows for Code {bom_number} are not contiguous", bom_number)
+                seen_boms.add(bom_number)
+                current_bom = bom_number
+                previous_level = 0
+
+            try:
+                level = int(cells["level"])
+                if level != float(cells["level"]):
+                    raise ValueError
+            except (TypeError, ValueError):
+                result.add_error(row_number, f"Level must be a whole number, got {cells['level']!r}", bom_number)
+                continue
+
+            if level == 0:
+                if item_code and item_code != code:
+                    result.add_error(row_number, "Level 0 is the root line and must name the BOM itself", bom_number)
+                else:
+                    result.skipped_rows += 1
+                continue
+
+            if level < 1 or level > previous_level + 1:
+                result.add_error(
+                    row_number, f"Level {level} cannot follow level {previous_level} (levels may only go one deeper)",
+                    bom_number,
+                )
+                previous_level = max(level, 0)
+                continue
+            previous_level = level
+
+            if not item_code:
+                result.add_error(row_number, "Item Code is empty", bom_number)
+                continue
+
+            try:
+                quantity = float(quantity)
+                if not quantity > 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                result.add_error(row_number, f"Extended Quantity must be a positive number, got {cells['extended_quantity']!r}", bom_number)
+                continue
+
+            result.rows.append((row_number, bom_number, level, item_code, "BUY", quantity))
+    finally:
+        workbook.close()
+
+    # An item is MAKE when the next line of its BOM sits one level below it
+    for i, row in enumerate(result.rows[:-1]):
+        following = result.rows[i + 1]
+        if following[1] == row[1] and following[2] == row[2] + 1:
+            result.rows[i] = row[:4] + ("MAKE",) + row[5:]
+    return result
+
+
+def copy_and_merge(connection, rows, user):
+    """
+    COPYs `rows` into a temporary staging table and replaces the BOMs they
+    belong to in admin_parts with one statement, inside the caller's
+    transaction. On-hand quantities and descriptions are carried over from
+    existing rows with the same item code. Returns (removed, inserted,
+    copy_seconds, merge_seconds). Does not commit.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    with connection.cursor() as cursor:
+        started = time.perf_counter()
+        cursor.execute(STAGING_TABLE)
+        cursor.copy_expert(
+            'COPY admin_parts_import (seq, bom_number, "Item_Level", "Item_code", "Type", "Extended_Quantity") '
+            "FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+        copied = time.perf_counter()
+
+        cursor.execute(MERGE_QUERY, (user,))
+        counts = cursor.fetchone()
+        merged = time.perf_counter()
+
+    if isinstance(counts, dict):
+        counts = (counts["removed"], counts["inserted"])
+    return counts[0], counts[1], copied - started, merged - copied
@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.errors import QueryCanceled
+from db_connection import get_connection
+from fetch_data import fetch_bom_data
+
+# Default per-request deadline (seconds) for craftability work
+CRAFT_DEADLINE = float(os.getenv("CRAFT_DEADLINE", "30"))
+# BOM explosions in flight at once per request; keep below DB_POOL_SIZE
+BOM_FETCH_CONCURRENCY = int(os.getenv("BOM_FETCH_CONCURRENCY", "8"))
+
+# psycopg2 blocks, so the event loop hands each query to one of these threads
+fetch_executor = ThreadPoolExecutor(max_workers=BOM_FETCH_CONCURRENCY, thread_name_prefix="bom-fetch")
+
+
+class _Batch:
+    """Connections currently in use by one request's tasks, so they can be cancelled."""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.active = {}
+        self.cancelled = set()
+        self.lock = threading.Lock()
+
+    def cancel_running(self):
+        with self.lock:
+            for code, connection in self.active.items():
+                self.cancelled.add(code)
+                try:
+                    connection.cancel()
+                except Exception as e:
+                    print(f"Failed to cancel query for {code}: {e}")
+
+
+def _run_task(batch, code, work):
+    remaining = batch.deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(code)
+
+    with get_connection() as connection:
+        if not connection:
+            raise RuntimeError("Database connection failed")
+
+        with batch.lock:
+            if code in batch.cancelled:
+                raise TimeoutError(code)
+            batch.active[code] = connection
+        try:
+            # Transaction-scoped, so it is cleared when the pool rolls back
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (max(1, int(remaining * 1000)),))
+            try:
+                result = work(connection, code)
+            except QueryCanceled:
+                # Hit statement_timeout or was cancelled at the deadline
+                raise TimeoutError(code)
+            if time.monotonic() >= batch.deadline:
+                raise TimeoutError(code)
+            return result
+        finally:
+            with batch.lock:
+                batch.active.pop(code, None)
+
+
+async def _fetch_all(batch, codes, concurrency):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(code):
+        async with semaphore:
+            return await loop.run_in_executor(fetch_executor, contextvars.copy_context().run,
+                                              _run_task, batch, code, fetch_bom_data)
+
+    tasks = {asyncio.ensure_future(fetch(code)): code for code in codes}
+    if tasks:
+        await asyncio.wait(tasks, timeout=max(0, batch.deadline - time.monotonic()))
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+    batch.cancel_running()
+    return tasks
+
+
+def fetch_boms(codes, concurrency=BOM_FETCH_CONCURRENCY, deadline=CRAFT_DEADLINE):
+    """
+    Fetches the BOM rows of every code concurrently from an asyncio event
+    loop, at most `concurrency` at a time, each on its own pooled
+    connection, within one deadline (seconds) for the whole batch. Wall
+    time is close to the slowest round trip instead of the sum of all.
+
+    The time left is sent to Postgres as statement_timeout, and queries
+    still running at the deadline are cancelled, so timed-out fetches stop
+    instead of running on in the background. Returns (bom_data, errors,
+    timed_out): {code: rows}, {code: message} and the codes that did not
+    finish in time.
+    """
+    batch = _Batch(time.monotonic() + deadline)
+    tasks = asyncio.run(_fetch_all(batch, codes, concurrency))
+
+    bom_data, errors, timed_out = {}, {}, []
+    for task, code in tasks.items():
+        if task.cancelled() or code in batch.cancelled:
+            timed_out.append(code)
+            continue
+        error = task.exception()
+        if isinstance(error, TimeoutError):
+            timed_out.append(code)
+        elif error is not None:
+            errors[code] = str(error)
+        else:
+            bom_data[code] = task.result()
+    return bom_data, errors, timed_out
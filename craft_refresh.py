@@ -0,0 +1,41 @@
+import json
+from assembly_manager import store_craftability_snapshot
+from bom_graph import get_bom_graph
+from fetch_data import fetch_bom_data_many
+from solver_cache import solve_rows, stock_snapshot
+
+
+def refresh_craftability(connection, item_codes):
+    """
+    Re-evaluates only the finished goods whose BOMs use `item_codes` after
+    their stock changed, found through the graph's where-used index, and
+    upserts their rows in craftability_snapshot.
+
+    The BOM rows of all affected goods are read in one query and each good
+    is solved as /get_craftable_goods does without a quantity
+    (solver_cache.solve_rows, so max_buildable on live rows), so the
+    snapshot and that route agree. Writes the snapshot in one statement
+    and commits. Returns the number of goods refreshed.
+    """
+    item_codes = sorted({str(item_code) for item_code in item_codes})
+    if not item_codes:
+        return 0
+
+    graph = get_bom_graph(connection)
+    fg_rows = graph.affected_fg_rows(item_codes)
+    if not fg_rows:
+        return 0
+
+    fg_codes = [graph.codes[graph.fg_ids[row]] for row in fg_rows]
+    snapshot = stock_snapshot()
+    bom_data = fetch_bom_data_many(connection, fg_codes)
+
+    snapshot_rows = []
+    for fg_code in fg_codes:
+        if fg_code not in bom_data:
+            continue
+        _, _, (max_units, shortages, _) = solve_rows(bom_data[fg_code], fg_code, None, snapshot)
+        snapshot_rows.append((fg_code, int(max_units), json.dumps([item[0] for item in shortages])))
+
+    store_craftability_snapshot(connection, snapshot_rows)
+    return len(snapshot_rows)
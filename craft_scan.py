@@ -0,0 +1,115 @@
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from psycopg2 import extensions
+from db_connection import connect_to_database, get_connection
+from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units, max_buildable
+
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(os.cpu_count() or 2)))
+# Max finished goods in flight per scan; bounds server memory regardless of catalog size
+SCAN_WINDOW = int(os.getenv("SCAN_WINDOW", str(SCAN_WORKERS * 4)))
+SCAN_FETCH_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# One connection per worker process, opened on first use
+_worker_connection = None
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=SCAN_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _worker_db():
+    global _worker_connection
+    if _worker_connection is None or _worker_connection.closed:
+        _worker_connection = connect_to_database()
+    return _worker_connection
+
+
+def evaluate_finished_good(fg_code, craft_quantity):
+    """
+    Runs in a worker process. Returns one NDJSON-ready result for `fg_code`,
+    in the same shape as the get_craftable_goods entries plus a `status`.
+    """
+    connection = _worker_db()
+    if connection is None:
+        return {"finished_good_code": fg_code, "status": "error", "error": "Database connection failed"}
+
+    try:
+        bom_data = fetch_bom_data(connection, fg_code)
+        connection.rollback()
+        if not bom_data:
+            return {"finished_good_code": fg_code, "status": "no_bom"}
+
+        item_data, tree = build_bom_tree(bom_data, fg_code)
+        if craft_quantity:
+            max_units, shortages, _ = calculate_max_units(tree, item_data, fg_code, craft_quantity)
+        else:
+            max_units, shortages = max_buildable(tree, item_data, fg_code)
+            if max_units:
+                shortages = []
+    except Exception as e:
+        return {"finished_good_code": fg_code, "status": "error", "error": str(e)}
+
+    if shortages:
+        if craft_quantity:
+            missing_items = [{"item_code": item[0], "missing_qty": item[1]} for item in shortages]
+        else:
+            missing_items = [item[0] for item in shortages]
+        return {"finished_good_code": fg_code, "status": "non_craftable", "missing_items": missing_items}
+    if craft_quantity:
+        return {"finished_good_code": fg_code, "status": "craftable", "can_craft_quantity": craft_quantity}
+    if max_units > 0:
+        return {"finished_good_code": fg_code, "status": "craftable", "max_units": max_units}
+    return {"finished_good_code": fg_code, "status": "non_craftable", "missing_items": []}
+
+
+def _iter_finished_goods(connection):
+    with connection.cursor(name="craft_scan_codes", cursor_factory=extensions.cursor) as cursor:
+        cursor.itersize = SCAN_FETCH_SIZE
+        cursor.execute('SELECT DISTINCT "bom_number" FROM "admin_parts"')
+        for (bom_number,) in cursor:
+            yield bom_number
+
+
+def scan_craftable_goods(craft_quantity=None, window=SCAN_WINDOW):
+    """
+    Evaluates every finished good in the catalog across the process pool and
+    yields one JSON line per finished good as soon as its result is ready.
+    At most `window` finished goods are in flight at any time.
+    """
+    executor = _get_executor()
+
+    with get_connection() as connection:
+        if not connection:
+            yield json.dumps({"status": "error", "error": "Database connection failed"}) + "\n"
+            return
+
+        pending = set()
+        try:
+            for fg_code in _iter_finished_goods(connection):
+                pending.add(executor.submit(evaluate_finished_good, fg_code, craft_quantity))
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield json.dumps(future.result(), default=str) + "\n"
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield json.dumps(future.result(), default=str) + "\n"
+        finally:
+            # Client went away or the scan failed: drop work that hasn't started
+            for future in pending:
+                future.cancel()
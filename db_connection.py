@@ -1,23 +1,214 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
+load_dotenv()
+
+# No fallbacks for where to connect or the password: a missing setting fails at startup
+_missing_settings = [name for name in ("DB_HOST", "DB_PASSWORD") if not os.getenv(name)]
+if _missing_settings:
+    raise RuntimeError(f"Database is not configured, set {' and '.join(_missing_settings)} "
+                       "in the environment or a .env file")
+
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "postgres"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST"),
+    "port": os.getenv("DB_PORT", "5432"),
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections older than this are pinged with SELECT 1 before being handed out
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30"))
+
+
 def connect_to_database():
     """
-    Establishes a new database connection for each request.
+    Establishes a new, unpooled database connection.
+    Routes should use get_connection() instead.
     """
     try:
-        connection = psycopg2.connect(
-            dbname="postgres",
-            user="postgres.qfgubwgzlkdckpaugrcq",
-            password="GexLiP4Mm8tv1oQQ",
-            host="aws-0-ap-southeast-1.pooler.supabase.com",
-            port="5432",
-            cursor_factory=RealDictCursor
-        )
+        connection = psycopg2.connect(cursor_factory=RealDictCursor, **DB_CONFIG)
         return connection
     except Exception as e:
         print(f"Failed to connect to the database: {e}")
         return None
 
+
+class ConnectionPool:
+    """
+    Fixed-size, thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to `size`. Callers block for up to
+    `timeout` seconds when all connections are checked out.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_after=DB_POOL_HEALTHCHECK_AFTER, connect=connect_to_database):
+        self.size = size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self._connect = connect
+        self._idle = deque()  # (connection, returned_at)
+        self._opened = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._lock = threading.Condition()
+
+        # Metrics
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+        self._discarded = 0
+
+    def _is_healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.healthcheck_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._opened -= 1
+            self._discarded += 1
+            self._lock.notify()
+
+    def getconn(self):
+        """
+        Checks out a healthy connection, or returns None if none could be
+        obtained within the pool timeout.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        connection = None
+
+        while connection is None:
+            with self._lock:
+                while not self._idle and self._opened >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._checkout_failures += 1
+                        print("Failed to get a database connection: pool exhausted")
+                        return None
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    self._in_use += 1
+                else:
+                    candidate, returned_at = None, None
+                    self._opened += 1
+                    self._in_use += 1
+
+            if candidate is None:
+                connection = self._connect()
+                if connection is None:
+                    with self._lock:
+                        self._opened -= 1
+                        self._in_use -= 1
+                        self._checkout_failures += 1
+                        self._lock.notify()
+                    return None
+            elif self._is_healthy(candidate, returned_at):
+                connection = candidate
+            else:
+                with self._lock:
+                    self._in_use -= 1
+                self._discard(candidate)
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return connection
+
+    def putconn(self, connection):
+        """
+        Returns a connection to the pool, rolling back any open transaction.
+        Broken connections are closed and their slot freed.
+        """
+        healthy = not connection.closed
+        if healthy and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((connection, time.monotonic()))
+                self._lock.notify()
+        if not healthy:
+            self._discard(connection)
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+            self._opened -= len(idle)
+            self._lock.notify_all()
+        for connection, _ in idle:
+            connection.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "checkout_failures": self._checkout_failures,
+                "discarded": self._discarded,
+                "checkout_latency_avg_ms": (
+                    self._checkout_time_total / self._checkouts * 1000 if self._checkouts else 0.0
+                ),
+                "checkout_latency_max_ms": self._checkout_time_max * 1000,
+            }
+
+
+pool = ConnectionPool()
+
+
+@contextmanager
+def get_connection():
+    """
+    Checks a connection out of the shared pool and returns it on exit.
+    Yields None if no connection could be obtained.
+    """
+    connection = pool.getconn()
+    try:
+        yield connection
+    finally:
+        if connection is not None:
+            pool.putconn(connection)
+
+
+def pool_stats():
+    return pool.stats()
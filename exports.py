@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+import os
+import uuid
+import xlsxwriter
+from psycopg2 import extensions
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+MAX_COLUMN_WIDTH = 80
+
+
+def iter_query(connection, query, params=(), chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Runs `query` through a server-side named cursor.
+
+    Returns (columns, type_codes, chunks, has_rows): type_codes are the
+    Postgres type OIDs of the columns, and chunks yields lists of at most
+    `chunk_size` row tuples and closes the cursor when exhausted, so only
+    one chunk is ever held in memory.
+    """
+    cursor = connection.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=extensions.cursor)
+    try:
+        cursor.execute(query, params)
+        first = cursor.fetchmany(chunk_size)
+        columns = [column[0] for column in cursor.description]
+        type_codes = [column[1] for column in cursor.description]
+    except Exception:
+        cursor.close()
+        raise
+
+    def chunks():
+        try:
+            chunk = first
+            while chunk:
+                yield chunk
+                chunk = cursor.fetchmany(chunk_size)
+        finally:
+            cursor.close()
+
+    return columns, type_codes, chunks(), bool(first)
+
+
+def write_xlsx(fileobj, sheet_name, columns, chunks):
+    """
+    Writes rows to an .xlsx in xlsxwriter's constant-memory mode. Column
+    widths are tracked while rows stream through and applied at the end.
+    Returns the number of data rows written.
+    """
+    workbook = xlsxwriter.Workbook(fileobj, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, columns)
+    widths = [len(column) for column in columns]
+
+    row_number = 0
+    for chunk in chunks:
+        for row in chunk:
+            row_number += 1
+            values = [value if value is None or isinstance(value, (int, float, str)) else str(value)
+                      for value in row]
+            worksheet.write_row(row_number, 0, values)
+            for i, value in enumerate(values):
+                width = len(str(value))
+                if width > widths[i]:
+                    widths[i] = width
+
+    for i, width in enumerate(widths):
+        worksheet.set_column(i, i, min(width + 2, MAX_COLUMN_WIDTH))
+    workbook.close()
+    return row_number
+
+
+def csv_chunks(columns, chunks):
+    """Yields CSV text one chunk of rows at a time, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(columns, chunks):
+    """
+    Yields one JSON object per row, a chunk of rows at a time. Keys are
+    encoded once up front, so only the values are encoded per row.
+    """
+    encode = json.JSONEncoder(default=str, check_circular=False).encode
+    template = "{" + ",".join(json.dumps(column).replace("%", "%%") + ":%s" for column in columns) + "}\n"
+    for chunk in chunks:
+        yield "".join(template % tuple(map(encode, row)) for row in chunk)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+# Postgres type OID -> Arrow type name; anything else is exported as text
+ARROW_TYPES = {
+    16: "bool_",
+    20: "int64", 21: "int64", 23: "int64",
+    700: "float64", 701: "float64", 1700: "float64",
+    1082: "date32",
+}
+
+
+def arrow_schema(columns, type_codes):
+    """Arrow schema for a query result; raises RuntimeError if pyarrow is missing."""
+    pa = _pyarrow()
+    return pa.schema([
+        (column, getattr(pa, ARROW_TYPES.get(type_code, "string"))())
+        for column, type_code in zip(columns, type_codes)
+    ])
+
+
+def arrow_batches(schema, chunks):
+    """
+    Yields one Arrow RecordBatch per chunk, built column by column straight
+    from the row tuples.
+    """
+    pa = _pyarrow()
+    for chunk in chunks:
+        arrays = []
+        for field, values in zip(schema, zip(*chunk)):
+            if pa.types.is_string(field.type):
+                values = [value if value is None or isinstance(value, str) else str(value) for value in values]
+            elif pa.types.is_floating(field.type):
+                values = [value if value is None else float(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_parquet(fileobj, schema, chunks):
+    """Writes rows to `fileobj` as Parquet, one row group per chunk. Returns the row count."""
+    import pyarrow.parquet as pq
+
+    rows = 0
+    with pq.ParquetWriter(fileobj, schema) as writer:
+        for batch in arrow_batches(schema, chunks):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def arrow_stream_chunks(schema, chunks):
+    """Yields the bytes of an Arrow IPC stream, one record batch at a time."""
+    pa = _pyarrow()
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in arrow_batches(schema, chunks):
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
@@ -2,10 +2,77 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 from collections import defaultdict
 import json
-
+import logging
+import math
+import os
+import numpy as np
+from bom_exploded import exploded_table_ready
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Log 1 in N solver nodes at DEBUG level
+SOLVER_LOG_SAMPLE = max(1, int(os.getenv("SOLVER_LOG_SAMPLE", "100")))
+# Max debug_log entries returned per finished good when tracing a request
+TRACE_LIMIT = int(os.getenv("SOLVER_TRACE_LIMIT", "500"))
+
+# bom_exploded keeps code as text; cast back so "Code" is the integer bom_number the CTE returns
+EXPLODED_BOM_QUERY = """
+    SELECT e.code::integer AS "Code", e."Item_Level", e."Item_code", e."Type", a."On_hand_Qty", e."Extended_Quantity"
+    FROM bom_exploded e
+    JOIN "admin_parts" a ON a.id = e.source_id
+    WHERE e.fg_code = %s
+    ORDER BY e.seq
+"""
+
+# Several finished goods at once, for refreshes that re-solve many goods
+EXPLODED_BOMS_QUERY = """
+    SELECT e.fg_code, e.code::integer AS "Code", e."Item_Level", e."Item_code", e."Type", a."On_hand_Qty", e."Extended_Quantity"
+    FROM bom_exploded e
+    JOIN "admin_parts" a ON a.id = e.source_id
+    WHERE e.fg_code = ANY(%s)
+    ORDER BY e.fg_code, e.seq
+"""
+
+@timed("fetch_bom_data")
+def fetch_bom_data_many(connection, finished_good_codes):
+    """
+    {code: BOM rows} for several finished goods, read from bom_exploded in
+    one query. Goods it has no rows for go through fetch_bom_data one at a
+    time, and goods with no BOM at all are left out.
+    """
+    codes = sorted({str(code) for code in finished_good_codes})
+    bom_data = defaultdict(list)
+    if codes and exploded_table_ready(connection):
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(EXPLODED_BOMS_QUERY, (codes,))
+            for row in cursor:
+                bom_data[row.pop("fg_code")].append(row)
+
+    for code in codes:
+        if code not in bom_data:
+            rows = fetch_bom_data(connection, code)
+            if rows:
+                bom_data[code] = rows
+    return dict(bom_data)
+
+@timed("fetch_bom_data")
 def fetch_bom_data(connection, finished_good_code):
+    """
+    BOM rows of a finished good and all its sub-BOMs. Reads the
+    precomputed explosion in bom_exploded and joins only the live stock;
+    falls back to the recursive CTE when the table is missing or has no
+    rows for this finished good. Query errors give [], except a cancelled
+    query (QueryCanceled), which is raised.
+    """
     try:
         with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            if exploded_table_ready(connection):
+                cursor.execute(EXPLODED_BOM_QUERY, (str(finished_good_code),))
+                bom_data = cursor.fetchall()
+                if bom_data:
+                    return bom_data
+
             query = """
             WITH RECURSIVE BOM_Tree AS (
                 SELECT 
@@ -39,30 +106,31 @@ def fetch_bom_data(connection, finished_good_code):
             cursor.execute(query, (finished_good_code,))
             bom_data = cursor.fetchall()
             return bom_data if bom_data else []
+    except psycopg2.errors.QueryCanceled:
+        # statement_timeout or a deadline cancel: the caller must not read this as an empty BOM
+        raise
     except Exception as e:
-        print(f"Error fetching BOM data: {e}")
+        logger.error("Error fetching BOM data for %s: %s", finished_good_code, e)
         return []
 
 from collections import defaultdict
 
 def build_bom_tree(bom_data, finished_good_code):
-    print(f"Input BOM data for {finished_good_code}: {bom_data}")
+    logger.debug("Building BOM tree for %s from %d rows", finished_good_code, len(bom_data))
     
     item_data = {row["Item_code"]: row for row in bom_data}
-    print(f"Initial item_data: {item_data}")
     
     tree = defaultdict(list)
     parent_stack = []  
    
     if finished_good_code not in item_data:
-        print(f"Creating default entry for {finished_good_code}")
+        logger.debug("Creating default entry for %s", finished_good_code)
         item_data[finished_good_code] = {
             "On_hand_Qty": 0,
             "Extended_Quantity": 1,  
             "Type": "finished_good",
             "Item_Level": 0
         }
-        # print(f"Updated item_data with default entry: {item_data}")
 
     for row in bom_data:
         item_code = row["Item_code"]
@@ -150,7 +218,79 @@ def build_bom_tree(bom_data, finished_good_code):
 #     return max_units, shortages, used_items
 
 
-def calculate_max_units(tree, item_data, finished_good_code, required_quantity):
+def topological_order(tree, root):
+    """
+    Items reachable from `root` in `tree`, parents before children.
+    Uses an explicit stack, so deep BOMs don't hit the recursion limit.
+    Edges that would close a cycle are ignored.
+    """
+    visited = {root}
+    postorder = []
+    stack = [(root, iter(tree.get(root, ())))]
+
+    while stack:
+        item_code, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            postorder.append(item_code)
+        elif child not in visited:
+            visited.add(child)
+            stack.append((child, iter(tree.get(child, ()))))
+
+    postorder.reverse()
+    return postorder
+
+
+class SolverTrace:
+    """
+    Bounded per-request debug log for calculate_max_units.
+    Keeps the first `limit` nodes and counts the rest as dropped.
+    """
+
+    def __init__(self, limit=TRACE_LIMIT):
+        self.limit = limit
+        self.entries = []
+        self.dropped = 0
+
+    def record(self, item_code, make_or_buy, on_hand_qty, required_qty, quantity_needed, reason):
+        if len(self.entries) >= self.limit:
+            self.dropped += 1
+            return
+        self.entries.append({
+            "node": item_code,
+            "type": make_or_buy.upper(),
+            "on_hand": on_hand_qty,
+            "req_per_unit": required_qty,
+            "needed": quantity_needed,
+            "possible": on_hand_qty / required_qty,
+            "reason": reason,
+        })
+
+    def to_dict(self):
+        return {"debug_log": self.entries, "debug_log_dropped": self.dropped}
+
+
+def _log_node(visited, item_code, make_or_buy, on_hand_qty, required_qty, quantity_needed, reason):
+    if visited % SOLVER_LOG_SAMPLE == 0:
+        logger.debug(
+            "node=%s type=%s on_hand=%s req_per_unit=%s needed=%s reason=%s",
+            item_code, make_or_buy.upper(), on_hand_qty, required_qty, quantity_needed, reason,
+        )
+
+
+def calculate_max_units(tree, item_data, finished_good_code, required_quantity, trace=None):
+    """
+    Nets the demand for `required_quantity` units of a finished good against
+    stock and returns (max_units, shortages, used_items).
+
+    Items are visited once, in topological order. An item shared by several
+    parents first collects the demand of all of them, is netted against its
+    stock once, and its result is reused by every parent.
+
+    Pass a SolverTrace as `trace` to collect a per-node debug log. Sampled
+    per-node logging happens only when this module logs at DEBUG.
+    """
     shortages = []  # Track missing BUY or leaf MAKE items
     used_items = {}  # Track how much of each item is used
 
@@ -160,21 +300,43 @@ def calculate_max_units(tree, item_data, finished_good_code, required_quantity):
     # If no quantity is given, we're calculating max possible units
     quantity_to_check = required_quantity if is_user_quantity_input else float("inf")
 
-    # Set once a BUY shortage is found — enables shortage collection
-    collect_all_missing_buy_items = {"flag": False}
+    order = topological_order(tree, finished_good_code)
+    position = {item_code: i for i, item_code in enumerate(order)}
+
+    demand = {finished_good_code: quantity_to_check}
+    expanded = {}  # MAKE items whose remaining demand was pushed to their children
+    units = {}
+
+    log_nodes = logger.isEnabledFor(logging.DEBUG)
+    tracing = trace is not None or log_nodes
+    visited = 0
+
+    def note(reason):
+        if trace is not None:
+            trace.record(item_code, make_or_buy, on_hand_qty, required_qty, quantity_needed, reason)
+        if log_nodes:
+            _log_node(visited, item_code, make_or_buy, on_hand_qty, required_qty, quantity_needed, reason)
+
+    # 1. Top-down: aggregate demand per item and net it against stock once
+    for item_code in order:
+        if item_code not in demand:
+            continue  # Only reachable through parents that were covered by stock
 
-    def recursive_calculate(item_code, quantity_needed):
+        visited += 1
+        quantity_needed = demand[item_code]
         if item_code not in item_data:
             shortages.append((item_code, "Unknown"))
-            return 0
+            units[item_code] = 0
+            if tracing:
+                make_or_buy, on_hand_qty, required_qty = "unknown", 0.0, 1.0
+                note("unknown item")
+            continue
 
         item = item_data[item_code]
-        on_hand_qty = float(item["On_hand_Qty"]) or 0
+        on_hand_qty = float(item["On_hand_Qty"] or 0)
         required_qty = max(1, float(item["Extended_Quantity"]))  # Prevent divide-by-zero
         make_or_buy = item.get("Make/Buy", "make").lower().strip()
 
-        print(f"Processing '{item_code}' ({make_or_buy.upper()}) - Needed: {quantity_needed}, Available: {on_hand_qty}, Required/unit: {required_qty}")
-
         remaining_needed = max(0, quantity_needed - on_hand_qty)
 
         # ✅ Track how much we're using
@@ -186,50 +348,172 @@ def calculate_max_units(tree, item_data, finished_good_code, required_quantity):
             if quantity_needed > on_hand_qty:
                 if is_user_quantity_input:
                     shortages.append((item_code, quantity_needed - on_hand_qty))
-                    collect_all_missing_buy_items["flag"] = True
-                return 0
-            return on_hand_qty // required_qty
-
-        # ✅ MAKE item logic
-        if not collect_all_missing_buy_items["flag"]:
-            # Normal mode (max units or no shortage yet)
-            if on_hand_qty >= quantity_needed:
-                return on_hand_qty // required_qty
-        else:
-            # In shortage-collection mode: if MAKE item has enough, stop
-            if on_hand_qty >= quantity_needed:
-                return on_hand_qty // required_qty
-
-        # 🔁 Traverse children to fulfill remaining_needed
-        if item_code in tree:
-            child_units = []
-            can_fulfill = True
-
-            for child in tree[item_code]:
-                child_required = float(item_data[child]["Extended_Quantity"])
-                total_child_needed = remaining_needed * child_required
-
-                units = recursive_calculate(child, total_child_needed)
-
-                if units == 0:
-                    can_fulfill = False
-                else:
-                    child_units.append(units)
-
-            return min(child_units) if can_fulfill and child_units else 0
+                units[item_code] = 0
+                if tracing:
+                    note("BUY shortage, branch stopped")
+            else:
+                units[item_code] = on_hand_qty // required_qty
+                if tracing:
+                    note("covered by stock")
+            continue
+
+        # ✅ MAKE item logic: enough stock, stop here
+        if on_hand_qty >= quantity_needed:
+            units[item_code] = on_hand_qty // required_qty
+            if tracing:
+                note("covered by stock, children pruned")
+            continue
+
+        # 🔁 Push remaining_needed down to the children
+        children = [
+            child for child in tree.get(item_code, ())
+            if position.get(child, -1) > position[item_code]
+        ]
+        if children:
+            expanded[item_code] = children
+            if tracing:
+                note(f"expanded remaining {remaining_needed} into {len(children)} children")
+            for child in children:
+                child_item = item_data.get(child)
+                child_required = float(child_item["Extended_Quantity"]) if child_item else 1
+                demand[child] = demand.get(child, 0) + remaining_needed * child_required
+            continue
 
         # 🟥 Leaf MAKE with no children and not enough stock — only in user-input mode
         if remaining_needed > 0 and is_user_quantity_input:
             shortages.append((item_code, remaining_needed))
+        units[item_code] = 0
+        if tracing:
+            note("leaf MAKE shortage")
+
+    # 2. Bottom-up: an expanded item can build as many units as its weakest child
+    for item_code in reversed(order):
+        children = expanded.get(item_code)
+        if children is None:
+            continue
+        child_units = [units.get(child, 0) for child in children]
+        units[item_code] = min(child_units) if all(child_units) else 0
+
+    max_units = units.get(finished_good_code, 0)
+    return max_units, shortages, used_items
 
-        return 0
-
-    # Start from root
-    max_units = recursive_calculate(finished_good_code, quantity_to_check)
-
-    print("\n== FINAL REPORT ==")
-    print("Max Units:", max_units)
-    print("Used Items:", used_items)
-    print("Shortages:", shortages)
 
-    return max_units, shortages, used_items
+# Absorbs float error in bottom-up capacities, e.g. 2.9999999999 meaning 3
+CAPACITY_EPSILON = 1e-9
+# Largest count max_buildable reports when the BOM puts no limit on it
+MAX_BUILDABLE_LIMIT = 2 ** 53
+
+
+def _build_capacity(tree, item_data, finished_good_code):
+    """
+    One bottom-up pass over the BOM: the most units of each item that its
+    own stock plus what its children can supply would cover, with
+    fractional Extended_Quantity and the same netting rules as
+    calculate_max_units. Returns the finished good's capacity, which is
+    exact for trees and an upper bound when items are shared, since every
+    parent is credited with the shared item's full stock.
+    """
+    order = topological_order(tree, finished_good_code)
+    position = {item_code: i for i, item_code in enumerate(order)}
+    capacity = {}
+
+    for item_code in reversed(order):
+        item = item_data.get(item_code)
+        if item is None:
+            capacity[item_code] = 0.0
+            continue
+        on_hand_qty = float(item["On_hand_Qty"] or 0)
+        make_or_buy = item.get("Make/Buy", "make").lower().strip()
+        children = [child for child in tree.get(item_code, ()) if position.get(child, -1) > position[item_code]]
+        if make_or_buy == "buy" or not children:
+            capacity[item_code] = on_hand_qty
+            continue
+
+        from_children = math.inf
+        for child in children:
+            child_item = item_data.get(child)
+            child_required = float(child_item["Extended_Quantity"]) if child_item else 1
+            if child_required > 0:
+                from_children = min(from_children, capacity[child] / child_required)
+        capacity[item_code] = on_hand_qty + max(from_children, 0)
+
+    return capacity.get(finished_good_code, 0.0)
+
+
+def _feasible(tree, item_data, finished_good_code, quantity):
+    return not calculate_max_units(tree, item_data, finished_good_code, quantity)[1]
+
+
+def max_buildable(tree, item_data, finished_good_code):
+    """
+    The largest whole number of units of a finished good that stock
+    covers, counting subassemblies in stock and those buildable from their
+    children, as (max_units, shortages). `shortages` lists what is missing
+    for one unit more, in calculate_max_units form.
+
+    Feasibility is calculate_max_units' own netting. A bottom-up pass
+    bounds the answer from above and is exact for tree-shaped BOMs, so
+    those take O(n): the pass plus one netting run at the bound. This is
+    not a single pass for DAGs: when subassemblies are shared the bound can
+    be too high, and the answer is binary searched below it, O(n log U)
+    for a bound of U units (benchmarks/check_max_buildable.py).
+    """
+    capacity = _build_capacity(tree, item_data, finished_good_code)
+    upper = MAX_BUILDABLE_LIMIT if math.isinf(capacity) else min(
+        MAX_BUILDABLE_LIMIT, max(0, math.floor(capacity + CAPACITY_EPSILON)))
+
+    if _feasible(tree, item_data, finished_good_code, upper):
+        units = upper
+    else:
+        # Feasibility is monotone in the quantity, so the largest feasible count lies below the bound
+        low, high = 0, upper - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if _feasible(tree, item_data, finished_good_code, middle):
+                low = middle
+            else:
+                high = middle - 1
+        units = low
+
+    _, shortages, _ = calculate_max_units(tree, item_data, finished_good_code, units + 1)
+    return units, shortages
+
+
+def calculate_max_units_batch(graph, stock=None):
+    """
+    Max buildable units of every finished good in `graph` at once.
+
+    Uses the exploded leaf requirements (README formula
+    `min(on_hand_qty[i] // extended_qty[i])`), so stock held at
+    subassembly level is not counted. `stock` is an on-hand vector indexed
+    by node id (see BomGraph.stock_vector); defaults to the graph snapshot.
+
+    Returns (fg_codes, max_units, limiting_items): parallel lists, with
+    limiting_items naming the leaf item that caps each finished good
+    (None when it has no leaf requirements).
+    """
+    row_ptr, item_ids, quantities = graph.requirements_matrix()
+    if stock is None:
+        stock = graph.stock_vector()
+
+    fg_count = len(row_ptr) - 1
+    max_units = np.zeros(fg_count)
+    limiting = np.full(fg_count, -1, dtype=np.int64)
+
+    if len(item_ids):
+        per_item = np.floor_divide(np.maximum(stock[item_ids], 0), quantities)
+
+        starts = row_ptr[:-1]
+        non_empty = starts < row_ptr[1:]
+        max_units[non_empty] = np.minimum.reduceat(per_item, starts[non_empty])
+
+        # First item per row that hits the row minimum
+        rows = np.repeat(np.arange(fg_count), np.diff(row_ptr))
+        hits = np.flatnonzero(per_item == max_units[rows])
+        hit_rows, first = np.unique(rows[hits], return_index=True)
+        limiting[hit_rows] = item_ids[hits[first]]
+
+    codes = graph.codes
+    fg_codes = [codes[fg] for fg in graph.fg_ids]
+    limiting_items = [codes[node] if node >= 0 else None for node in limiting.tolist()]
+    return fg_codes, max_units.astype(np.int64).tolist(), limiting_items
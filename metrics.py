@@ -0,0 +1,114 @@
+"""
+Request and per-stage latency histograms in the Prometheus text format.
+
+Routes set the current route label with set_route(); stage() and timed()
+record into bom_stage_duration_seconds under that label, including from
+worker threads that run in a copy of the request's context. Observing is
+a bisect and two additions under a lock, about a microsecond, so it can
+wrap every fetch, solve and write of a request.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+# Upper bounds in seconds; spans sub-millisecond solver runs to multi-second CTEs
+METRICS_BUCKETS = tuple(float(bound) for bound in os.getenv(
+    "METRICS_BUCKETS", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(","))
+
+_route = ContextVar("metrics_route", default="none")
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, documentation, labelnames, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        position = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[position] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self.lock:
+            snapshot = {labels: list(series) for labels, series in self.series.items()}
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(snapshot.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_SECONDS = Histogram(
+    "bom_request_duration_seconds", "Time spent handling a request.", ("route", "method", "status"))
+STAGE_SECONDS = Histogram(
+    "bom_stage_duration_seconds", "Time spent in one stage of a request.", ("route", "stage"))
+
+
+def set_route(route):
+    """Labels the stages recorded from now on in this context with `route`."""
+    return _route.set(route)
+
+
+class stage:
+    """Context manager timing the enclosed block as `name` for the current route."""
+
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe((_route.get(), self.name), time.perf_counter() - self.started)
+        return False
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def gauge_lines(name, documentation, values, label="name"):
+    """Prometheus lines for a gauge with one sample per {label value: number}."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for key, value in sorted(values.items()):
+        lines.append(f'{name}{{{label}="{_escape(key)}"}} {float(value)}')
+    return lines
+
+
+def render(extra_lines=()):
+    """The /metrics body: both histograms plus any extra gauge lines."""
+    lines = REQUEST_SECONDS.collect() + STAGE_SECONDS.collect() + list(extra_lines)
+    return "\n".join(lines) + "\n"
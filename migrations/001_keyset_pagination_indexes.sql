@@ -0,0 +1,13 @@
+-- Indexes backing keyset (cursor) pagination in the listing routes.
+-- CONCURRENTLY avoids blocking writes; run outside a transaction:
+--   psql "$DATABASE_URL" -f migrations/001_keyset_pagination_indexes.sql
+
+-- /assembly_logs: ORDER BY created_at DESC, id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS assembly_logs_created_at_id_idx
+    ON assembly_logs (created_at DESC, id DESC);
+
+-- /crafted_goods and /approved_crafted_goods: WHERE approved = ... ORDER BY id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS crafted_goods_approved_id_idx
+    ON crafted_goods (approved, id DESC);
+
+-- /admin_parts pages by its primary key (id), which is already indexed.
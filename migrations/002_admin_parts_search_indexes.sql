@@ -0,0 +1,23 @@
+-- Indexes backing /admin_parts search and /admin_parts/autocomplete.
+-- CONCURRENTLY avoids blocking writes; run outside a transaction:
+--   psql "$DATABASE_URL" -f migrations/002_admin_parts_search_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- One trigram index per searched column, so each '%text%' ILIKE is an index
+-- lookup and the OR of them becomes a BitmapOr. The expressions must match
+-- search.SEARCH_EXPRESSIONS exactly.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admin_parts_bom_number_trgm_idx
+    ON admin_parts USING gin ((CAST("bom_number" AS TEXT)) gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admin_parts_item_code_trgm_idx
+    ON admin_parts USING gin ("Item_code" gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admin_parts_description_trgm_idx
+    ON admin_parts USING gin ("description" gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admin_parts_type_trgm_idx
+    ON admin_parts USING gin ("Type" gin_trgm_ops);
+
+-- Autocomplete: prefix range scan in sorted order on the lower-cased code.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS admin_parts_item_code_prefix_idx
+    ON admin_parts ((lower("Item_code") COLLATE "C"));
+
+ANALYZE admin_parts;
@@ -0,0 +1,24 @@
+-- Flattened BOMs maintained by bom_exploded.py; fetch_bom_data reads these
+-- rows and joins only the live On_hand_Qty from admin_parts.
+-- After creating the table, populate it once:
+--   psql "$DATABASE_URL" -f migrations/003_bom_exploded.sql
+--   python bom_exploded.py
+
+CREATE TABLE IF NOT EXISTS bom_exploded (
+    fg_code text NOT NULL,              -- finished good (root bom_number) this row belongs to
+    seq integer NOT NULL,               -- position in the explosion, parents' rows before their sub-BOMs
+    path_id integer,                    -- seq of the row that pulled in this sub-BOM; NULL on the FG's own rows
+    source_id integer NOT NULL,         -- admin_parts.id, joined for On_hand_Qty
+    code text NOT NULL,                 -- bom_number of the source row
+    "Item_Level" integer,
+    "Item_code" text,
+    "Type" text,
+    "Extended_Quantity" double precision,
+    cumulative_qty double precision,    -- Extended_Quantity multiplied along the sub-BOM path
+    depth integer NOT NULL,             -- sub-BOM nesting depth, 0 for the FG's own rows
+    PRIMARY KEY (fg_code, seq)
+);
+
+-- Finding the finished goods to re-explode when a BOM changes
+CREATE INDEX IF NOT EXISTS bom_exploded_code_idx ON bom_exploded (code);
+CREATE INDEX IF NOT EXISTS bom_exploded_item_code_idx ON bom_exploded ("Item_code");
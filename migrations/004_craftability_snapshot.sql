@@ -0,0 +1,13 @@
+-- Max buildable units per finished good, refreshed by craft_refresh.py for
+-- the goods an API stock change affects. Kept apart from crafted_goods,
+-- which only holds planned goods awaiting approval.
+--   psql "$DATABASE_URL" -f migrations/004_craftability_snapshot.sql
+
+CREATE TABLE IF NOT EXISTS craftability_snapshot (
+    bom_number text PRIMARY KEY,
+    max_units bigint NOT NULL,                       -- exact maximum, as /get_craftable_goods without a quantity
+    missing_items jsonb NOT NULL DEFAULT '[]',       -- item codes short for one unit, when max_units is 0
+    refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS craftability_snapshot_craftable_idx ON craftability_snapshot ((max_units > 0), bom_number);
@@ -0,0 +1,22 @@
+-- One planned_inventory row per (bom_number, Item_code), so plan_inventory
+-- can add to an allocation with INSERT ... ON CONFLICT. Merges any
+-- duplicates left by earlier concurrent plans into the lowest id first.
+--   psql "$DATABASE_URL" -f migrations/005_planned_inventory_unique.sql
+
+WITH merged AS (
+    SELECT min(id) AS keep_id, bom_number, "Item_code", sum("Allocation") AS allocation
+    FROM planned_inventory
+    GROUP BY bom_number, "Item_code"
+    HAVING count(*) > 1
+), kept AS (
+    UPDATE planned_inventory AS p
+    SET "Allocation" = m.allocation
+    FROM merged AS m
+    WHERE p.id = m.keep_id
+)
+DELETE FROM planned_inventory AS p
+USING merged AS m
+WHERE p.bom_number = m.bom_number AND p."Item_code" = m."Item_code" AND p.id <> m.keep_id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS planned_inventory_bom_item_key
+    ON planned_inventory (bom_number, "Item_code");
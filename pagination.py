@@ -0,0 +1,162 @@
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+
+COUNT_MODES = ("none", "exact", "estimated", "cached")
+# Seconds a "cached" total count is reused for the same table and filter
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))
+COUNT_CACHE_SIZE = 1024
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+class PageRequest:
+    """Pagination fields of a listing request, validated."""
+
+    def __init__(self, page_size, after=None, page=None, count="none"):
+        self.page_size = page_size
+        self.after = after
+        self.page = page
+        self.count = count
+
+    @property
+    def offset(self):
+        # Only legacy page-numbered requests past the first page use OFFSET
+        if self.after is None and self.page:
+            return (self.page - 1) * self.page_size
+        return 0
+
+
+def parse_page_request(data, key_size):
+    """
+    Reads page_size, cursor, page and count from a request body.
+
+    A "cursor" from a previous response continues after its last row.
+    Without one the request is a legacy page-numbered one ("page", default
+    1) and keeps the exact count by default; cursor requests default to no
+    count. Raises ValueError with a message for the client on bad input.
+    """
+    page_size = data.get("page_size", 10)
+    if not isinstance(page_size, int) or page_size <= 0:
+        raise ValueError("Invalid page size")
+
+    token = data.get("cursor")
+    after, page = None, None
+    if token:
+        after = decode_cursor(token, key_size)
+    else:
+        page = data.get("page", 1)
+        if not isinstance(page, int) or page <= 0:
+            raise ValueError("Invalid page number")
+
+    count = data.get("count", "none" if token else "exact")
+    if count not in COUNT_MODES:
+        raise ValueError(f"Invalid count mode, expected one of {', '.join(COUNT_MODES)}")
+
+    return PageRequest(page_size, after, page, count)
+
+
+def encode_cursor(values):
+    """Opaque continuation token for the sort key values of the last row on a page."""
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token, key_size):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != key_size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def fetch_page(cursor, table, where, params, keys, descending, page_request, columns="*"):
+    """
+    Fetches one page of `columns` from `table` ordered by the `keys` columns
+    (all in the same direction, last one unique, all selected) and returns
+    (rows, next_cursor).
+
+    Continuing from a cursor is a row-value comparison on the keys, so with
+    an index on them every page costs the same however deep it is.
+    next_cursor is None on the last page.
+    """
+    conditions = [where] if where else []
+    params = list(params)
+    if page_request.after is not None:
+        placeholders = ", ".join(["%s"] * len(keys))
+        conditions.append(f"({', '.join(keys)}) {'<' if descending else '>'} ({placeholders})")
+        params.extend(page_request.after)
+
+    direction = "DESC" if descending else "ASC"
+    query = f"SELECT {columns} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    query += " ORDER BY " + ", ".join(f"{key} {direction}" for key in keys)
+    query += " LIMIT %s"
+    params.append(page_request.page_size + 1)
+    if page_request.offset:
+        query += " OFFSET %s"
+        params.append(page_request.offset)
+
+    cursor.execute(query, tuple(params))
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > page_request.page_size:
+        rows = rows[:page_request.page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[key.strip('"')] for key in keys)
+    return rows, next_cursor
+
+
+def _first_value(row):
+    if isinstance(row, dict):
+        return next(iter(row.values()))
+    return row[0]
+
+
+def count_rows(cursor, table, where, params, mode):
+    """
+    Total rows of `table` matching `where`, or None for mode "none".
+
+    "estimated" reads the planner's row estimate instead of scanning;
+    "cached" reuses an exact count for COUNT_CACHE_TTL seconds.
+    """
+    if mode == "none":
+        return None
+
+    query = f"SELECT COUNT(*) FROM {table}" + (f" WHERE {where}" if where else "")
+
+    if mode == "estimated":
+        if where:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} WHERE {where}", tuple(params))
+            plan = _first_value(cursor.fetchone())
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+        cursor.execute("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass", (table,))
+        return int(_first_value(cursor.fetchone()))
+
+    cache_key = (query, tuple(params))
+    if mode == "cached":
+        with _count_cache_lock:
+            cached = _count_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+    cursor.execute(query, tuple(params))
+    total = int(_first_value(cursor.fetchone()))
+
+    if mode == "cached":
+        with _count_cache_lock:
+            if len(_count_cache) >= COUNT_CACHE_SIZE:
+                _count_cache.pop(next(iter(_count_cache)))
+            _count_cache[cache_key] = (time.monotonic() + COUNT_CACHE_TTL, total)
+    return total
@@ -0,0 +1,88 @@
+"""
+Allocates shared stock across a demand list of many finished goods.
+
+calculate_max_units answers for one finished good at a time, so goods
+sharing components each see the full stock. allocate_mix() serves the
+demand greedily by priority instead: each finished good takes as many
+units as the stock left by the goods before it allows, and that usage is
+deducted before the next one is considered. Like calculate_max_units_batch
+it works on exploded leaf requirements (BomGraph.requirements_matrix), so
+stock held at subassembly level is not counted.
+"""
+import numpy as np
+
+
+def _demand_order(demand):
+    """Indexes of `demand` by priority, highest first; equal priorities keep request order."""
+    return sorted(range(len(demand)), key=lambda i: -demand[i][2])
+
+
+def allocate_mix(graph, stock, demand):
+    """
+    Serves `demand`, a list of (fg_code, quantity, priority) with quantity
+    None for "as many as possible", from the on-hand vector `stock`
+    (indexed by node id, see BomGraph.stock_vector).
+
+    Returns (allocations, components): one dict per demand entry in request
+    order with the requested and achievable quantity and the binding
+    components that stopped it short, and {item_code: usage} for every
+    component that bound at least one finished good.
+    """
+    row_ptr, item_ids, quantities = graph.requirements_matrix()
+    remaining = np.maximum(np.asarray(stock, dtype=np.float64), 0).copy()
+    codes = graph.codes
+
+    allocations = [None] * len(demand)
+    consumers = {}  # item id -> demand indexes that took some of it, in allocation order
+    binding = {}    # item id -> demand indexes it stopped short
+
+    for i in _demand_order(demand):
+        fg_code, requested, priority = demand[i]
+        entry = {"finished_good_code": fg_code, "priority": priority, "requested": requested}
+        allocations[i] = entry
+
+        row = graph.fg_row(fg_code)
+        if row is None:
+            entry.update({"achievable": 0, "binding_components": [], "error": "Unknown finished good"})
+            continue
+
+        start, end = row_ptr[row], row_ptr[row + 1]
+        items, per_unit = item_ids[start:end], quantities[start:end]
+        if not len(items):
+            entry.update({"achievable": 0, "binding_components": [], "error": "No leaf requirements"})
+            continue
+
+        buildable = np.floor_divide(remaining[items], per_unit)
+        possible = int(buildable.min())
+        achievable = possible if requested is None else min(int(requested), possible)
+        if achievable > 0:
+            remaining[items] -= per_unit * achievable  # item ids are unique within a row
+            for item in items.tolist():
+                consumers.setdefault(item, []).append(i)
+
+        binding_components = []
+        if requested is None or achievable < requested:
+            for item, qty in zip(items[buildable == possible].tolist(), per_unit[buildable == possible].tolist()):
+                binding.setdefault(item, []).append(i)
+                binding_components.append({
+                    "item_code": codes[item],
+                    "per_unit": qty,
+                    "remaining": float(remaining[item]),
+                    "used_by_earlier_demand": [
+                        demand[j][0] for j in consumers.get(item, ()) if j != i
+                    ],
+                })
+        entry.update({"achievable": achievable, "binding_components": binding_components})
+
+    original = np.asarray(stock, dtype=np.float64)
+    components = {
+        codes[item]: {
+            "on_hand": float(original[item]),
+            "allocated": float(max(original[item], 0) - remaining[item]),
+            "remaining": float(remaining[item]),
+            "consumed_by": [demand[j][0] for j in consumers.get(item, ())],
+            "binding_for": [demand[j][0] for j in short],
+        }
+        for item, short in binding.items()
+    }
+    return allocations, components
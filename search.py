@@ -0,0 +1,88 @@
+import threading
+
+# Number of matching rows autocomplete looks at before grouping them into codes
+AUTOCOMPLETE_SCAN_LIMIT = 5000
+
+# admin_parts columns the search box matches; each has a trigram index (migrations/002)
+SEARCH_EXPRESSIONS = (
+    'CAST("bom_number" AS TEXT)',
+    '"Item_code"',
+    '"description"',
+    '"Type"',
+)
+
+_trigram_support = {}
+_trigram_lock = threading.Lock()
+
+
+def escape_like(text):
+    """Escapes LIKE wildcards so user input matches literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def has_trigram_support(cursor):
+    """Whether pg_trgm is installed in this database; checked once per process."""
+    with _trigram_lock:
+        if "enabled" not in _trigram_support:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS enabled")
+            row = cursor.fetchone()
+            _trigram_support["enabled"] = bool(row["enabled"] if isinstance(row, dict) else row[0])
+        return _trigram_support["enabled"]
+
+
+def admin_parts_search(text):
+    """
+    (where, params) matching `text` anywhere in the searchable admin_parts
+    columns. Each ILIKE is served by that column's trigram GIN index and
+    Postgres combines them with a BitmapOr, so no sequential scan is needed.
+    """
+    pattern = f"%{escape_like(text)}%"
+    where = " OR ".join(f"{expression} ILIKE %s" for expression in SEARCH_EXPRESSIONS)
+    return where, [pattern] * len(SEARCH_EXPRESSIONS)
+
+
+def ranked_admin_parts(cursor, text):
+    """
+    (table, params): admin_parts with a `rank` column for `text`, for use
+    as the table in pagination.fetch_page ordered by (rank, id).
+
+    Exact item-code matches rank first, then item-code prefixes, then by
+    trigram similarity of the item code and description when pg_trgm is
+    installed. rank is float8 so it round-trips exactly through a cursor.
+    """
+    exact = text
+    prefix = f"{escape_like(text)}%"
+    rank = """CASE WHEN lower("Item_code") = lower(%s) THEN 2
+                   WHEN "Item_code" ILIKE %s THEN 1
+                   ELSE 0 END"""
+    params = [exact, prefix]
+    if has_trigram_support(cursor):
+        rank += ' + GREATEST(similarity("Item_code", %s), word_similarity(%s, coalesce("description", \'\')))'
+        params.extend([text, text])
+    return f"(SELECT *, ({rank})::float8 AS rank FROM admin_parts) AS ranked", params
+
+
+def autocomplete_item_codes(cursor, prefix, limit=10):
+    """
+    Distinct item codes starting with `prefix` (case-insensitive), in
+    alphabetical order, with how many BOM rows use each.
+
+    The prefix match and the ordering both come from the
+    lower("Item_code") COLLATE "C" index, so only the first
+    AUTOCOMPLETE_SCAN_LIMIT matching rows are ever read.
+    """
+    cursor.execute("""
+        WITH matches AS (
+            SELECT "Item_code"
+            FROM admin_parts
+            WHERE lower("Item_code") COLLATE "C" LIKE %s
+            ORDER BY lower("Item_code") COLLATE "C"
+            LIMIT %s
+        )
+        SELECT "Item_code" AS item_code, COUNT(*) AS bom_rows
+        FROM matches
+        GROUP BY "Item_code"
+        ORDER BY lower("Item_code") COLLATE "C", "Item_code"
+        LIMIT %s
+    """, (escape_like(prefix.lower()) + "%", AUTOCOMPLETE_SCAN_LIMIT, limit))
+    return cursor.fetchall()
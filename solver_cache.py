@@ -0,0 +1,150 @@
+"""
+Bounded LRU of calculate_max_units results for one finished good and quantity.
+
+An entry remembers the item codes its BOM involves and the stock digest
+(table_versions.stock_digest) of those items when it was computed; it is
+served only while the BOM structure version and that digest are unchanged,
+so any stock write to an involved item, or any structure edit, forces a
+recompute. Callers must treat the returned item_data, tree and result as
+read-only: they are shared between requests.
+
+The versions are this process's counters (table_versions), so the cache
+only sees writes made by the same worker. With several API worker
+processes a result can be stale for up to VERSION_EPOCH_SECONDS (forever
+when 0); set SOLVER_CACHE_SIZE=0 there. Write paths never use it: they
+re-solve on rows read in their own transaction.
+"""
+import os
+import threading
+from collections import OrderedDict
+from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units, max_buildable
+from table_versions import version_tag, item_sequence, stock_digest
+from metrics import stage
+
+SOLVER_CACHE_SIZE = int(os.getenv("SOLVER_CACHE_SIZE", "512"))
+
+# Table version bumped whenever admin_parts structure (not just stock) changes
+STRUCTURE_TABLE = "bom_structure"
+
+
+class SolverCache:
+    """LRU of (item_data, tree, result) keyed by (fg, quantity, structure version)."""
+
+    def __init__(self, size=SOLVER_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is not None:
+            item_codes, digest, value = entry
+            if stock_digest(item_codes) == digest:
+                with self.lock:
+                    self.hits += 1
+                return value
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, item_codes, digest, value):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (item_codes, digest, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "size": self.size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+solver_cache = SolverCache()
+
+
+def stock_snapshot():
+    """
+    (structure version, stock version) to take before reading BOM rows that
+    will be passed to solve_rows.
+    """
+    return version_tag(STRUCTURE_TABLE), item_sequence()
+
+
+def cached_result(finished_good_code, quantity):
+    """The cached solve() value, or None when it is missing or out of date."""
+    return solver_cache.get((str(finished_good_code), quantity, version_tag(STRUCTURE_TABLE)))
+
+
+def _solve_tree(tree, item_data, finished_good_code, quantity, trace):
+    if quantity is not None:
+        return calculate_max_units(tree, item_data, finished_good_code, quantity, trace=trace)
+
+    # No quantity: the exact maximum, with what is missing for one unit reported only when none can be built
+    units, shortages = max_buildable(tree, item_data, finished_good_code)
+    if trace is not None:
+        calculate_max_units(tree, item_data, finished_good_code, units + 1, trace=trace)
+    return units, shortages if units == 0 else [], {}
+
+
+def solve_rows(bom_data, finished_good_code, quantity, snapshot, trace=None):
+    """
+    Builds the tree from already fetched `bom_data` and runs the solver,
+    caching the result unless a trace is collected. With `quantity` None
+    the result is max_buildable's exact maximum, with no used_items and
+    the traced run being the one for a unit more. `snapshot` is the
+    stock_snapshot() taken before the rows were read: a stock write landing
+    in between leaves a newer version behind and the result is not cached,
+    and a structure edit files it under the old, unreachable version.
+    """
+    with stage("build_bom_tree"):
+        item_data, tree = build_bom_tree(bom_data, finished_good_code)
+    with stage("calculate_max_units"):
+        value = (item_data, tree, _solve_tree(tree, item_data, finished_good_code, quantity, trace))
+    if trace is not None:
+        return value
+
+    structure_version, stock_version = snapshot
+    item_codes = tuple(item_data)
+    digest = stock_digest(item_codes)
+    if digest <= stock_version:
+        solver_cache.put((str(finished_good_code), quantity, structure_version), item_codes, digest, value)
+    return value
+
+
+def solve(connection, finished_good_code, quantity):
+    """
+    (item_data, tree, (max_units, shortages, used_items)) for `quantity`
+    units of a finished good (None: as many as possible), from the cache when nothing it depends on has
+    changed. None when the finished good has no BOM rows.
+    """
+    cached = cached_result(finished_good_code, quantity)
+    if cached is not None:
+        return cached
+
+    snapshot = stock_snapshot()
+    bom_data = fetch_bom_data(connection, finished_good_code)
+    if not bom_data:
+        return None
+    return solve_rows(bom_data, finished_good_code, quantity, snapshot)
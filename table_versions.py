@@ -0,0 +1,109 @@
+"""
+Per-table write counters used to build ETags and key the response cache.
+
+Every write path bumps the tables it changed right after committing, so
+a response built from an older version can never be served for newer
+data. Counters live in this process; with several API worker processes,
+set VERSION_EPOCH_SECONDS to bound how long a worker can keep answering
+304 for data another worker has changed.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+VERSION_EPOCH_SECONDS = float(os.getenv("VERSION_EPOCH_SECONDS", "0"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+# Distinguishes this process's counters from another worker's, or from before a restart
+_boot_id = uuid.uuid4().hex[:8]
+_versions = defaultdict(int)
+# Per item code: the value of _item_sequence when its stock last changed
+_item_versions = {}
+_item_sequence = 0
+_lock = threading.Lock()
+
+
+def bump(*tables):
+    """Marks `tables` as changed. Call after the write is committed."""
+    with _lock:
+        for table in tables:
+            _versions[table] += 1
+
+
+def bump_items(item_codes):
+    """Marks the stock of `item_codes` as changed. Call after the write is committed."""
+    global _item_sequence
+    with _lock:
+        for item_code in item_codes:
+            _item_sequence += 1
+            _item_versions[str(item_code)] = _item_sequence
+
+
+def item_sequence():
+    """Latest stock version handed out; snapshot it before reading stock."""
+    with _lock:
+        return _item_sequence
+
+
+def stock_digest(item_codes):
+    """
+    Newest stock version among `item_codes`. Versions come from one
+    increasing sequence, so this changes whenever any of them is bumped.
+    """
+    with _lock:
+        return max((_item_versions.get(str(item_code), 0) for item_code in item_codes), default=0)
+
+
+def current_epoch():
+    return int(time.time() // VERSION_EPOCH_SECONDS) if VERSION_EPOCH_SECONDS > 0 else 0
+
+
+def version_tag(*tables):
+    """Opaque token that changes whenever any of `tables` is written."""
+    with _lock:
+        counters = "-".join(str(_versions[table]) for table in tables)
+    return f"{_boot_id}-{current_epoch()}-{counters}"
+
+
+def versions():
+    with _lock:
+        return dict(_versions)
+
+
+class ResponseCache:
+    """Small LRU of serialized response bodies keyed by request and table version."""
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
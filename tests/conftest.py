@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules live at the repo root; benchmarks/ holds the brute-force checker the solver tests reuse
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,73 @@
+import io
+
+import openpyxl
+
+from bom_import import parse_bom_workbook
+
+HEADER = ["Code", "Level", "Item Code", "Extended Quantity"]
+
+
+def workbook(*rows, header=HEADER):
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.append(["BOM export"])  # title block above the header, as in exported sheets
+    sheet.append(header)
+    for row in rows:
+        sheet.append(list(row))
+    stream = io.BytesIO()
+    book.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def test_valid_bom_types_parents_as_make():
+    result = parse_bom_workbook(workbook(
+        (100, 0, 100, 1),
+        (100, 1, "S", 1),
+        (100, 2, "B", 2.5),
+        (100, 1, "C", 3),
+        (None, None, None, None),
+    ))
+    assert result.error_count == 0
+    assert result.skipped_rows == 2
+    assert [row[1:] for row in result.valid_rows()] == [
+        (100, 1, "S", "MAKE", 1.0),
+        (100, 2, "B", "BUY", 2.5),
+        (100, 1, "C", "BUY", 3.0),
+    ]
+
+
+def test_invalid_row_rejects_only_its_bom():
+    result = parse_bom_workbook(workbook(
+        (100, 1, "A", 1),
+        (100, 1, "B", -1),
+        (200, 1, "A", 1),
+    ))
+    assert result.error_count == 1
+    assert result.errors[0]["row"] == 4
+    assert result.rejected_boms == {100}
+    assert [row[1] for row in result.valid_rows()] == [200]
+
+
+def test_level_may_only_go_one_deeper():
+    result = parse_bom_workbook(workbook((100, 1, "A", 1), (100, 3, "B", 1)))
+    assert result.rejected_boms == {100}
+    assert "cannot follow" in result.errors[0]["error"]
+
+
+def test_bom_rows_must_be_contiguous():
+    result = parse_bom_workbook(workbook((100, 1, "A", 1), (200, 1, "A", 1), (100, 1, "B", 1)))
+    assert result.rejected_boms == {100}
+    assert "not contiguous" in result.errors[0]["error"]
+
+
+def test_non_integer_code_and_missing_item():
+    result = parse_bom_workbook(workbook(("X1", 1, "A", 1), (100, 1, None, 1), (100, 1.5, "A", 1)))
+    assert result.error_count == 3
+    assert result.rejected_boms == {100}
+
+
+def test_missing_header():
+    result = parse_bom_workbook(workbook((100, 1, "A"), header=["Code", "Level", "Item"]))
+    assert result.error_count == 1
+    assert result.rows == []
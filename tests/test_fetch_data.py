@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from check_max_buildable import brute_force, random_bom, BRUTE_FORCE_LIMIT
+from bom_graph import BomGraph
+from fetch_data import build_bom_tree, calculate_max_units, calculate_max_units_batch, max_buildable
+
+COLUMNS = ("Code", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity")
+
+# BOM 1: 2 A per unit and one subassembly S (1 in stock) built from 3 B
+ROWS = [
+    (1, 1, "A", "BUY", 10, 2),
+    (1, 1, "S", "MAKE", 1, 1),
+    (1, 2, "B", "BUY", 6, 3),
+]
+
+
+def solver_inputs(rows, bom_number):
+    return build_bom_tree([dict(zip(COLUMNS, row)) for row in rows], str(bom_number))
+
+
+def test_feasible_quantity_uses_subassembly_stock_first():
+    item_data, tree = solver_inputs(ROWS, 1)
+    _, shortages, used_items = calculate_max_units(tree, item_data, "1", 3)
+    assert shortages == []
+    # One S from stock, two built from 6 B
+    assert used_items == {"A": 6, "S": 1, "B": 6}
+
+
+def test_shortage_reports_missing_quantity():
+    item_data, tree = solver_inputs(ROWS, 1)
+    _, shortages, _ = calculate_max_units(tree, item_data, "1", 4)
+    assert shortages == [("B", 3)]
+
+
+def test_shared_item_is_netted_once_for_all_parents():
+    # C is used by both subassemblies, 2 + 2 per unit against 10 in stock
+    rows = [
+        (1, 1, "S1", "MAKE", 0, 1),
+        (1, 2, "C", "BUY", 10, 2),
+        (1, 1, "S2", "MAKE", 0, 1),
+        (1, 2, "C", "BUY", 10, 2),
+    ]
+    item_data, tree = solver_inputs(rows, 1)
+    assert calculate_max_units(tree, item_data, "1", 2)[1] == []
+    assert calculate_max_units(tree, item_data, "1", 3)[1] == [("C", 2)]
+
+
+def test_max_buildable_reports_what_one_more_unit_lacks():
+    item_data, tree = solver_inputs(ROWS, 1)
+    assert max_buildable(tree, item_data, "1") == (3, [("B", 3)])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_max_buildable_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        item_data, tree, fg_code = random_bom(rng)
+        expected = brute_force(tree, item_data, fg_code)
+        if expected >= BRUTE_FORCE_LIMIT:
+            continue
+        assert max_buildable(tree, item_data, fg_code)[0] == expected
+
+
+def test_batch_matches_leaf_requirements():
+    rows = ROWS + [
+        (2, 1, "A", "BUY", 10, 1),
+        (2, 1, "1", "MAKE", 0, 1),
+        (3, 1, "Z", "BUY", 0, 1),
+    ]
+    graph = BomGraph.from_rows(rows)
+    stock = graph.stock_vector()
+    fg_codes, max_units, limiting = calculate_max_units_batch(graph)
+
+    for fg_code, units, item_code in zip(fg_codes, max_units, limiting):
+        leaves = graph.explode(fg_code, leaves_only=True)
+        per_item = {code: stock[graph.node_id(code)] // qty for code, qty in leaves.items()}
+        assert units == min(per_item.values())
+        assert per_item[item_code] == units
+    assert dict(zip(fg_codes, max_units)) == {"1": 2, "2": 2, "3": 0}
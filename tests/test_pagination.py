@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from pagination import PageRequest, decode_cursor, encode_cursor, fetch_page, parse_page_request
+
+
+class SqliteCursor:
+    """The slice of a psycopg2 RealDictCursor that fetch_page uses, over sqlite."""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    def execute(self, query, params):
+        self.cursor.execute(query.replace("%s", "?"), params)
+
+    def fetchall(self):
+        names = [column[0] for column in self.cursor.description]
+        return [dict(zip(names, row)) for row in self.cursor.fetchall()]
+
+
+@pytest.fixture
+def cursor():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE logs (id integer PRIMARY KEY, created_at text, bom_number text)")
+    # Repeated timestamps, so the id tie-breaker decides the order within them
+    connection.executemany("INSERT INTO logs VALUES (?, ?, ?)",
+                           [(i, f"2024-01-{i // 3 + 1:02d}", str(i % 2)) for i in range(1, 24)])
+    yield SqliteCursor(connection)
+    connection.close()
+
+
+def test_parse_defaults():
+    request = parse_page_request({}, 2)
+    assert (request.page_size, request.after, request.page, request.count) == (10, None, 1, "exact")
+
+
+def test_parse_cursor_request_defaults_to_no_count():
+    request = parse_page_request({"cursor": encode_cursor(["2024-01-02", 7]), "page_size": 5}, 2)
+    assert request.after == ["2024-01-02", 7]
+    assert request.count == "none"
+    assert request.offset == 0
+
+
+@pytest.mark.parametrize("data", [
+    {"page_size": 0},
+    {"page_size": "10"},
+    {"page": 0},
+    {"count": "all"},
+    {"cursor": "not a cursor"},
+    {"cursor": encode_cursor([1])},
+])
+def test_parse_rejects_bad_input(data):
+    with pytest.raises(ValueError):
+        parse_page_request(data, 2)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(["2024-01-02", 7]), 2) == ["2024-01-02", 7]
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_keyset_pages_cover_every_row_once(cursor, descending):
+    keys = ("created_at", "id")
+    seen = []
+    token = None
+    while True:
+        rows, token = fetch_page(cursor, "logs", None, (), keys, descending,
+                                 PageRequest(4, decode_cursor(token, 2) if token else None))
+        seen.extend(row["id"] for row in rows)
+        if token is None:
+            break
+
+    cursor.execute("SELECT id FROM logs ORDER BY created_at {0}, id {0}".format("DESC" if descending else "ASC"), ())
+    assert seen == [row["id"] for row in cursor.fetchall()]
+
+
+def test_keyset_page_keeps_filter(cursor):
+    first, token = fetch_page(cursor, "logs", "bom_number = %s", ("1",), ("id",), True, PageRequest(3))
+    second, _ = fetch_page(cursor, "logs", "bom_number = %s", ("1",), ("id",), True,
+                           PageRequest(3, decode_cursor(token, 1)))
+    assert [row["id"] for row in first + second] == [23, 21, 19, 17, 15, 13]
+
+
+def test_last_page_has_no_cursor(cursor):
+    rows, token = fetch_page(cursor, "logs", None, (), ("id",), False, PageRequest(23))
+    assert len(rows) == 23 and token is None
+
+
+def test_page_number_uses_offset(cursor):
+    rows, _ = fetch_page(cursor, "logs", None, (), ("id",), False, parse_page_request({"page": 2, "page_size": 5}, 1))
+    assert [row["id"] for row in rows] == [6, 7, 8, 9, 10]
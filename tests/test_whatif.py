@@ -0,0 +1,49 @@
+import pytest
+
+from bom_graph import BomGraph
+from solver_cache import solve_rows, stock_snapshot
+from whatif import WhatIfSession
+
+# (bom_number, Item_Level, Item_code, Type, On_hand_Qty, Extended_Quantity); X and S are
+# shared between both BOMs with different quantities, S being a subassembly of Y
+ROWS = [
+    (100, 1, "X", "BUY", 10, 2),
+    (100, 1, "S", "MAKE", 1, 1),
+    (100, 2, "Y", "BUY", 12, 3),
+    (200, 1, "X", "BUY", 10, 5),
+    (200, 1, "S", "MAKE", 1, 2),
+    (200, 2, "Y", "BUY", 12, 3),
+]
+COLUMNS = ("Code", "Item_Level", "Item_code", "Type", "On_hand_Qty", "Extended_Quantity")
+
+
+def bom_rows(bom_number):
+    """The rows fetch_bom_data returns for one of the self-contained BOMs above."""
+    return [dict(zip(COLUMNS, row)) for row in ROWS if row[0] == bom_number]
+
+
+@pytest.fixture
+def session():
+    graph = BomGraph.from_rows(ROWS)
+    return WhatIfSession("tester", graph, graph.stock_vector())
+
+
+@pytest.mark.parametrize("bom_number", [100, 200])
+@pytest.mark.parametrize("quantity", [1, 2, 3, 5, 6])
+def test_try_matches_solver_on_shared_parts(session, bom_number, quantity):
+    _, _, expected = solve_rows(bom_rows(bom_number), str(bom_number), quantity, stock_snapshot())
+    max_units, shortages, used_items = session.evaluate(bom_number, quantity)
+    assert bool(shortages) == bool(expected[1])
+    assert sorted(shortages) == sorted(expected[1])
+    assert used_items == expected[2]
+    assert max_units == expected[0]
+
+
+def test_applied_plan_reduces_shared_stock(session):
+    _, shortages, used_items = session.evaluate(200, 2)
+    assert not shortages and used_items["X"] == 10
+    session.apply(200, 2, used_items)
+    assert session.remaining(["X"]) == {"X": 0}
+    assert session.evaluate(100, 1)[1] == [("X", 2)]
+    session.undo()
+    assert session.remaining(["X"]) == {"X": 10}
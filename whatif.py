@@ -0,0 +1,183 @@
+"""
+What-if planning sessions: try (finished good, quantity) combinations
+against a frozen stock snapshot without writing anything.
+
+A session reads the BOM graph and one stock vector when it starts. The
+vector is read-only and shared; each tentative plan records only the
+stock it changes in a copy-on-write overlay, so trying, undoing and
+reading remaining stock never touch the database. Like BomGraph, stock is
+tracked per item code. commit_plans() replays the chosen plans against
+live data in one transaction.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from fetch_data import fetch_bom_data, build_bom_tree, calculate_max_units
+from assembly_manager import plan_inventory, InsufficientStock
+
+WHATIF_SESSION_TTL = float(os.getenv("WHATIF_SESSION_TTL", "1800"))
+WHATIF_MAX_SESSIONS = int(os.getenv("WHATIF_MAX_SESSIONS", "100"))
+
+
+class PlanConflict(Exception):
+    """A plan that was feasible in the session is no longer feasible on live stock."""
+
+    def __init__(self, bom_number, quantity, shortages):
+        super().__init__(f"BOM {bom_number} x{quantity} is no longer feasible")
+        self.bom_number = bom_number
+        self.quantity = quantity
+        self.shortages = shortages
+
+
+class WhatIfSession:
+    """Tentative plans layered over an immutable stock snapshot."""
+
+    def __init__(self, owner, graph, stock):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.graph = graph
+        stock.setflags(write=False)
+        self.base = stock
+        self.overlay = {}       # node id -> stock after the applied plans
+        self.plans = []         # (bom_number, quantity, used_items, {node: stock before the plan})
+        self.subtrees = {}      # fg code -> (item_data, tree), structure only
+        self.created_at = time.time()
+        self.touched_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def stock_of(self, node):
+        value = self.overlay.get(node)
+        return float(self.base[node]) if value is None else value
+
+    def remaining(self, item_codes):
+        """{item_code: stock left after the applied plans}; unknown codes are skipped."""
+        index = self.graph.index
+        return {code: self.stock_of(index[code]) for code in map(str, item_codes) if code in index}
+
+    def _item_data(self, fg_code):
+        if fg_code not in self.subtrees:
+            self.subtrees[fg_code] = self.graph.subtree(fg_code)
+        template, tree = self.subtrees[fg_code]
+        index = self.graph.index
+        item_data = {}
+        for code, item in template.items():
+            node = index.get(code)
+            item_data[code] = {**item, "On_hand_Qty": self.stock_of(node)} if node is not None else item
+        # The finished good's own stock as a subassembly elsewhere isn't used
+        # to plan it, same as build_bom_tree's default root entry
+        item_data[fg_code] = {**item_data[fg_code], "On_hand_Qty": 0, "Extended_Quantity": 1,
+                              "Type": "finished_good"}
+        return item_data, tree
+
+    def evaluate(self, bom_number, quantity):
+        """
+        (max_units, shortages, used_items) for `quantity` units on the
+        session's current stock, or None when the BOM is unknown.
+        """
+        fg_code = str(bom_number)
+        if self.graph.node_id(fg_code) is None:
+            return None
+        item_data, tree = self._item_data(fg_code)
+        return calculate_max_units(tree, item_data, fg_code, quantity)
+
+    def apply(self, bom_number, quantity, used_items):
+        """Deducts `used_items` in the overlay, the way plan_inventory does in admin_parts."""
+        index = self.graph.index
+        previous = {}
+        for code, used in used_items.items():
+            node = index.get(code)
+            if node is None:
+                continue
+            before = self.stock_of(node)
+            previous[node] = self.overlay.get(node)
+            self.overlay[node] = max(before - min(used, before), 0)
+        self.plans.append((bom_number, quantity, used_items, previous))
+
+    def undo(self):
+        """Drops the last applied plan; returns it as (bom_number, quantity), or None."""
+        if not self.plans:
+            return None
+        bom_number, quantity, _, previous = self.plans.pop()
+        for node, value in previous.items():
+            if value is None:
+                self.overlay.pop(node, None)
+            else:
+                self.overlay[node] = value
+        return bom_number, quantity
+
+    def summary(self):
+        return {
+            "session_id": self.id,
+            "snapshot_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.created_at)),
+            "plans": [{"bom_number": plan[0], "quantity": plan[1]} for plan in self.plans],
+            "changed_items": len(self.overlay),
+        }
+
+
+class SessionStore:
+    """In-process sessions, dropped after WHATIF_SESSION_TTL idle seconds or when over capacity."""
+
+    def __init__(self, ttl=WHATIF_SESSION_TTL, capacity=WHATIF_MAX_SESSIONS):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.touched_at >= cutoff and len(self.sessions) <= self.capacity:
+                break
+            self.sessions.popitem(last=False)
+
+    def add(self, session):
+        with self.lock:
+            self.sessions[session.id] = session
+            self._expire()
+        return session
+
+    def get(self, session_id, owner):
+        """The caller's session, or None when unknown, expired or someone else's."""
+        with self.lock:
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return None
+            session.touched_at = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+
+sessions = SessionStore()
+
+
+def commit_plans(connection, plans):
+    """
+    Replays (bom_number, quantity) plans against live stock in the caller's
+    transaction, each re-checked on rows that already reflect the plans
+    before it. Raises PlanConflict on the first plan that no longer fits,
+    leaving the rollback to the caller. Returns the item codes whose stock
+    was deducted. Does not commit.
+    """
+    deducted = set()
+    for bom_number, quantity in plans:
+        bom_data = fetch_bom_data(connection, bom_number)
+        if not bom_data:
+            raise PlanConflict(bom_number, quantity, [])
+        item_data, tree = build_bom_tree(bom_data, bom_number)
+        _, shortages, used_items = calculate_max_units(tree, item_data, bom_number, quantity)
+        if shortages:
+            raise PlanConflict(bom_number, quantity, shortages)
+        try:
+            plan_inventory(connection, bom_number, quantity, used_items, item_data)
+        except InsufficientStock as e:
+            raise PlanConflict(bom_number, quantity, e.shortages)
+        deducted.update(used_items)
+    return deducted